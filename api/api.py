@@ -1,22 +1,40 @@
-from os import environ
-from random import randint
-from multiprocessing import Value
+from os import environ, getpid, kill, listdir, makedirs, replace
+from os.path import join
+from bisect import bisect_left
+from math import cos, floor, sin
+from random import choice, randint
+from tempfile import gettempdir
 from numbers import Number
+from threading import BoundedSemaphore, Lock, Condition, Event, Thread
+from time import monotonic, perf_counter, sleep, time
+from collections import Counter, deque
+from itertools import chain
+from select import select
+from io import BytesIO
+from json import dumps as raw_dumps
 
-from flask import Flask, g, request, jsonify, make_response, redirect
+from flask import Flask, Response, g, request, json, jsonify, make_response, redirect
 from flask.json import JSONEncoder
 from warnings import catch_warnings, simplefilter
 with catch_warnings():
     simplefilter('ignore')
-    from psycopg2 import connect
+    from psycopg2 import connect, Error as DatabaseError, ProgrammingError
+    from psycopg2.extensions import connection, parse_dsn, TRANSACTION_STATUS_IDLE
     from psycopg2.extras import NamedTupleCursor
 from flask_limiter import Limiter
+from flask_limiter.errors import RateLimitExceeded
 from flask_limiter.util import get_remote_address
+from limits import parse as parse_limit
 from dateutil.parser import parse
 from datetime import datetime, timedelta
 from tzlocal import get_localzone
 from pytz import timezone
 
+import numpy as np
+
+from ephemeris import Ephemeris, OCTANTS
+from shared import SharedTable, SharedStorage, SharedCache
+
 TIMEZONE = get_localzone()
 if 'TIMEZONE' in environ:
     TIMEZONE = timezone(environ['TIMEZONE'])
@@ -28,10 +46,50 @@ DBPARAMS = {'dbname': DBNAME, 'user': DBUSER}
 if DBHOST is not None:
     DBPARAMS['host'] = DBHOST
 
+DBPOOL_SIZE = int(environ.get('DBPOOL_SIZE', 4))            # idle connections kept per worker
+DBPOOL_RECYCLE = float(environ.get('DBPOOL_RECYCLE', 3600)) # max connection age (secs)
+DBPOOL_CHECK = float(environ.get('DBPOOL_CHECK', 30))       # ping connections idle longer than this (secs)
+
+# NOTE: streaming replicas, as libpq connection strings separated by ';' (e.g.,
+#       'port=5433' for a standby on this host), each over DBPARAMS
+DBREPLICAS = [{**DBPARAMS, **parse_dsn(dsn)} for dsn in environ.get('DBREPLICAS', '').split(';') if dsn.strip()]
+DBREPLICA_LAG = float(environ.get('DBREPLICA_LAG', 1))       # most lag of a replica serving reads (secs)
+DBREPLICA_CHECK = float(environ.get('DBREPLICA_CHECK', .25)) # interval between lag checks (secs)
+
+STREAM_CHANNEL = 'neocrisis'                                 # see game.notify
+STREAM_BACKLOG = int(environ.get('STREAM_BACKLOG', 1024))     # max undelivered events per subscriber
+STREAM_HEARTBEAT = float(environ.get('STREAM_HEARTBEAT', 15)) # keepalive interval (secs)
+STREAM_MAX = int(environ.get('STREAM_MAX', 8))                # most open streams per worker (each holds a thread)
+
+EPHEMERIS = environ.get('EPHEMERIS', 'false').lower() in {'1', 'true', 'yes'} # observe from in-process ephemeris
+EPHEMERIS_TTL = float(environ.get('EPHEMERIS_TTL', 5))                        # max ephemeris age (secs)
+
+REPLAY_CHUNK = int(environ.get('REPLAY_CHUNK', 1000)) # history rows fetched per round trip
+REPLAY_MAX = int(environ.get('REPLAY_MAX', 4))        # most replays at once per worker (each holds a thread & a connection)
+REPLAY_LIMIT = environ.get('REPLAY_LIMIT', '10 per 1 minute')
+
+SHARED_PATH = environ.get('SHARED_PATH', join(gettempdir(), f'neocrisis-{DBNAME}.shm')) # rate limits & shot names of every worker
+
+TELESCOPE_TICK = float(environ.get('TELESCOPE_TICK', 0))                                    # observation time quantum (secs; 0: off)
+TELESCOPE_CACHE = environ.get('TELESCOPE_CACHE', join(gettempdir(), f'neocrisis-{DBNAME}.cache')) # responses of the current tick, for every worker
+TELESCOPE_CACHE_PRUNE = float(environ.get('TELESCOPE_CACHE_PRUNE', 60))                      # secs until a response no one asks for is removed
+
+# NOTE: only the ephemeris observes at a given time (the start of the tick)
+if TELESCOPE_TICK:
+    EPHEMERIS = True
+
+METRICS_DIR = environ.get('METRICS_DIR', None)         # shared by every worker for /metrics (default: per worker)
+METRICS_FLUSH = float(environ.get('METRICS_FLUSH', 1)) # max age of a worker's metrics in METRICS_DIR (secs)
+
 SATELLITE_NAME = environ.get('SATELLITE_NAME', None)
 
 SLUG_VELOCITY = 1
 
+IMPACTS_LIMIT = 100 # most rocks per /impacts list
+
+RAILGUN_LIMIT = environ.get('RAILGUN_LIMIT', '5 per 1 seconds') # shots (not requests) per client
+RAILGUN_RATE = parse_limit(RAILGUN_LIMIT)
+
 class CustomEncoder(JSONEncoder):
     def default(self, obj):
         if isinstance(obj, datetime):
@@ -40,26 +98,758 @@ class CustomEncoder(JSONEncoder):
 
 app = Flask(__name__)
 app.json_encoder = CustomEncoder
+app.config['RATELIMIT_ENABLED'] = environ.get('RATELIMIT_ENABLED', 'true').lower() not in {'0', 'false', 'no'}
+app.config['RATELIMIT_STORAGE_URL'] = f'mmap://{SHARED_PATH}' # see SharedStorage
 limiter = Limiter(
     app,
     key_func = get_remote_address,
     default_limits = ['20 per second'],
 )
 
-counter = Value('i', 0)
+class PooledConnection(connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.created = self.used = monotonic()
+        self.prepared = set()
+        self.db_time = 0 # secs spent in execute() since checkout (see Server-Timing)
+
+class TimedCursor(NamedTupleCursor):
+    def execute(self, *args, **kwargs):
+        start = perf_counter()
+        try:
+            return super().execute(*args, **kwargs)
+        finally:
+            self.connection.db_time += perf_counter() - start
+
+
+class Pool:
+    '''
+    per-worker pool of database connections
+
+    connections are reused LIFO; connections idle longer than `check` seconds
+    are pinged before reuse and connections older than `recycle` seconds are
+    replaced; at most `size` idle connections are kept (size=0 disables pooling)
+    '''
+    def __init__(self, params, size, recycle, check):
+        self.params, self.size, self.recycle, self.check = params, size, recycle, check
+        self.lock = Lock()
+        self.pid = getpid()
+        self.idle, self.in_use = [], 0
+        self.counts = Counter()
+
+    def connect(self):
+        conn = connect(**self.params, connection_factory=PooledConnection, cursor_factory=TimedCursor)
+        conn.set_session(autocommit=True)
+        conn.pool = self
+        self.counts['connects'] += 1
+        return conn
+
+    def healthy(self, conn):
+        now = monotonic()
+        if conn.closed:
+            return False
+        if now - conn.created > self.recycle:
+            self.counts['recycles'] += 1
+            return False
+        if now - conn.used > self.check:
+            self.counts['checks'] += 1
+            try:
+                with conn.cursor() as cur:
+                    cur.execute('select 1')
+            except DatabaseError:
+                self.counts['check_failures'] += 1
+                return False
+        return True
+
+    def getconn(self):
+        with self.lock:
+            if self.pid != getpid(): # forked: connections belong to the parent
+                self.pid, self.idle, self.in_use = getpid(), [], 0
+                self.counts.clear()
+            self.in_use += 1
+            self.counts['checkouts'] += 1
+        while True:
+            with self.lock:
+                conn = self.idle.pop() if self.idle else None
+            if conn is None:
+                try:
+                    return self.connect()
+                except DatabaseError:
+                    with self.lock:
+                        self.in_use -= 1
+                    raise
+            if self.healthy(conn):
+                return conn
+            conn.close()
+
+    def putconn(self, conn):
+        conn.used = monotonic()
+        with self.lock:
+            self.in_use -= 1
+            if (not conn.closed
+                and conn.get_transaction_status() == TRANSACTION_STATUS_IDLE
+                and len(self.idle) < self.size):
+                self.idle.append(conn)
+                return
+            self.counts['discards'] += 1
+        conn.close()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'pid': self.pid,
+                'size': self.size,
+                'idle': len(self.idle),
+                'in_use': self.in_use,
+                **self.counts,
+            }
+
+pool = Pool(DBPARAMS, DBPOOL_SIZE, DBPOOL_RECYCLE, DBPOOL_CHECK)
+
+# NOTE: WAL positions in bytes; a replica has replayed up to a position, and
+#       the primary has flushed up to one (WAL only written may not be sent
+#       to replicas for as long as the primary is idle)
+PRIMARY_LSN_QUERY = "select pg_wal_lsn_diff(pg_current_wal_flush_lsn(), '0/0')::bigint as lsn"
+REPLICA_LSN_QUERY = "select pg_wal_lsn_diff(pg_last_wal_replay_lsn(), '0/0')::bigint as lsn"
+
+class Replicas:
+    '''
+    per-worker pools of connections to streaming replicas, and the lag of each
+
+    a background thread samples the primary's WAL position every `check`
+    seconds and then each replica's replayed position: a replica is as fresh
+    as the newest sample it has replayed past (so its lag is known to within
+    `check` seconds) and serves reads only while it lags at most `lag`
+    seconds; otherwise (or while it cannot be reached) reads go to the primary
+    '''
+    def __init__(self, params, replicas, lag, check):
+        self.params, self.lag, self.check = params, lag, check
+        self.pools = [Pool(p, DBPOOL_SIZE, DBPOOL_RECYCLE, DBPOOL_CHECK) for p in replicas]
+        self.lock = Lock()
+        self.pid, self.thread = None, None
+        self.lags = [None] * len(self.pools) # secs (None: unknown)
+        self.counts = Counter()
+
+    def start(self):
+        with self.lock:
+            if self.pools and self.pid != getpid(): # forked: the monitor thread belongs to the parent
+                self.pid, self.lags = getpid(), [None] * len(self.pools)
+                self.counts.clear()
+                self.thread = Thread(target=self.monitor, daemon=True)
+                self.thread.start()
+
+    @staticmethod
+    def position(conn, params, query):
+        'the WAL position `query` reads (over `conn`, or a new connection to `params`)'
+        if conn is None or conn.closed:
+            conn = connect(**params)
+            conn.set_session(autocommit=True)
+        with conn.cursor() as cur:
+            cur.execute(query)
+            lsn, = cur.fetchone()
+        return conn, lsn
+
+    def monitor(self):
+        pid = getpid()
+        primary, conns = None, [None] * len(self.pools)
+        samples = deque() # (monotonic secs, primary position)
+        while self.pid == pid:
+            try:
+                primary, lsn = self.position(primary, self.params, PRIMARY_LSN_QUERY)
+                samples.append((monotonic(), lsn))
+            except DatabaseError:
+                primary = None
+            while len(samples) > 1 and samples[1][0] < monotonic() - 2 * self.lag - self.check:
+                samples.popleft()
+            for i, p in enumerate(self.pools):
+                try:
+                    conns[i], replayed = self.position(conns[i], p.params, REPLICA_LSN_QUERY)
+                except DatabaseError:
+                    conns[i], replayed = None, None
+                # NOTE: replayed is None unless the server is in recovery
+                fresh = [t for t, lsn in samples if replayed is not None and lsn <= replayed]
+                self.lags[i] = monotonic() - fresh[-1] if fresh else None
+            sleep(self.check)
+
+    def fresh(self):
+        'the indices of the replicas that lag at most `lag` seconds'
+        self.start()
+        return [i for i, lag in enumerate(self.lags) if lag is not None and lag <= self.lag]
+
+    def getconn(self):
+        'a connection to a fresh replica (chosen at random), or None'
+        if not self.pools:
+            return None
+        fresh, conn = self.fresh(), None
+        if fresh:
+            try:
+                conn = self.pools[choice(fresh)].getconn()
+            except DatabaseError:
+                pass
+        with self.lock:
+            self.counts['fallbacks' if conn is None else 'reads'] += 1
+        return conn
+
+    def stats(self):
+        return {
+            'lag': self.lag,
+            'replicas': [{'lag': lag, **p.stats()} for lag, p in zip(self.lags, self.pools)],
+            **self.counts,
+        }
+
+replicas = Replicas(DBPARAMS, DBREPLICAS, DBREPLICA_LAG, DBREPLICA_CHECK)
+
+class Metrics:
+    '''
+    per-worker request counts and latency & database time histograms, by route
+
+    with a `path`, each worker writes its metrics to <path>/<pid>.json (from a
+    thread, every `flush` seconds after a change) and collect() adds up every
+    worker's; the counts of exited workers are kept, their pool stats are not
+    '''
+    BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+    def __init__(self, path, flush):
+        self.path, self.flush = path, flush
+        self.lock = Lock()
+        self.reset()
+        if path is not None:
+            makedirs(path, exist_ok=True)
+
+    def reset(self):
+        self.pid, self.dirty, self.flusher = getpid(), False, None
+        self.requests = Counter()       # (route, method, status) -> count
+        self.latency, self.db = {}, {}  # route -> [count per bucket..., count over, sum]
+
+    def histogram(self, hists, route, value):
+        hist = hists.setdefault(route, [0] * (len(self.BUCKETS) + 1) + [0])
+        hist[bisect_left(self.BUCKETS, value)] += 1
+        hist[-1] += value
+
+    def observe(self, route, method, status, elapsed, db_time):
+        with self.lock:
+            if self.pid != getpid(): # forked: metrics belong to the parent
+                self.reset()
+            self.requests[route, method, status] += 1
+            if elapsed is not None:
+                self.histogram(self.latency, route, elapsed)
+            if db_time is not None:
+                self.histogram(self.db, route, db_time)
+            self.dirty = True
+            if self.path is not None and self.flusher is None:
+                self.flusher = Thread(target=self.run, daemon=True)
+                self.flusher.start()
+
+    def run(self):
+        pid = getpid()
+        while self.pid == pid:
+            sleep(self.flush)
+            if self.dirty:
+                self.dump()
+
+    def snapshot(self):
+        with self.lock:
+            if self.pid != getpid():
+                self.reset()
+            self.dirty = False
+            return {
+                'pid': self.pid,
+                'requests': [[*k, v] for k, v in self.requests.items()],
+                'latency': {k: list(v) for k, v in self.latency.items()},
+                'db': {k: list(v) for k, v in self.db.items()},
+                'pool': pool.stats(),
+            }
+
+    def dump(self):
+        snapshot = self.snapshot()
+        tmp = join(self.path, f'.{snapshot["pid"]}.json')
+        with open(tmp, 'w') as f:
+            f.write(json.dumps(snapshot))
+        replace(tmp, join(self.path, f'{snapshot["pid"]}.json'))
+
+    def collect(self):
+        'the metrics of every worker'
+        if self.path is None:
+            return [self.snapshot()]
+        self.dump()
+        workers = []
+        for name in listdir(self.path):
+            if not name.endswith('.json') or name.startswith('.'):
+                continue
+            try:
+                with open(join(self.path, name)) as f:
+                    worker = json.loads(f.read())
+            except (OSError, ValueError):
+                continue
+            try:
+                kill(worker['pid'], 0)
+            except ProcessLookupError:
+                worker['pool'] = None
+            except OSError:
+                pass
+            workers.append(worker)
+        return workers
+
+    def render(self, triggers=()):
+        'the metrics of every worker (and `triggers`) in the Prometheus text format'
+        workers = self.collect()
+        requests, latency, db, pools = Counter(), {}, {}, Counter()
+        for worker in workers:
+            for *labels, n in worker['requests']:
+                requests[tuple(labels)] += n
+            for merged, hists in ((latency, worker['latency']), (db, worker['db'])):
+                for route, hist in hists.items():
+                    merged[route] = [x + y for x, y in zip(merged.get(route, [0] * len(hist)), hist)]
+            if worker['pool'] is not None:
+                pools['workers'] += 1
+                pools.update({k: v for k, v in worker['pool'].items() if k not in {'pid', 'size'}})
+
+        escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        label = lambda **kw: ','.join(f'{k}="{escape(v)}"' for k, v in kw.items())
+        lines = [
+            '# HELP neocrisis_requests_total requests served',
+            '# TYPE neocrisis_requests_total counter',
+            *(f'neocrisis_requests_total{{{label(route=r, method=m, status=s)}}} {n}'
+              for (r, m, s), n in sorted(requests.items())),
+        ]
+        for name, help, hists in (
+            ('neocrisis_request_duration_seconds', 'time to respond to a request', latency),
+            ('neocrisis_db_duration_seconds', 'time spent in database queries per request', db),
+        ):
+            lines += [f'# HELP {name} {help}', f'# TYPE {name} histogram']
+            for route, hist in sorted(hists.items()):
+                counts = [sum(hist[:i + 1]) for i in range(len(self.BUCKETS) + 1)]
+                lines += [
+                    *(f'{name}_bucket{{{label(route=route, le=le)}}} {n}'
+                      for le, n in zip([*self.BUCKETS, '+Inf'], counts)),
+                    f'{name}_sum{{{label(route=route)}}} {hist[-1]}',
+                    f'{name}_count{{{label(route=route)}}} {counts[-1]}',
+                ]
+        lines += [
+            '# HELP neocrisis_workers workers serving requests',
+            '# TYPE neocrisis_workers gauge',
+            f'neocrisis_workers {pools.pop("workers", 0)}',
+            '# HELP neocrisis_pool_connections database connections of every worker',
+            '# TYPE neocrisis_pool_connections gauge',
+            *(f'neocrisis_pool_connections{{{label(state=k)}}} {pools.pop(k, 0)}' for k in ('idle', 'in_use')),
+            '# HELP neocrisis_pool_events_total database pool events of every worker (see /info/pool)',
+            '# TYPE neocrisis_pool_events_total counter',
+            *(f'neocrisis_pool_events_total{{{label(event=k)}}} {n}' for k, n in sorted(pools.items())),
+            '# HELP neocrisis_trigger_calls_total calls of each game trigger (see api.trigger_stats)',
+            '# TYPE neocrisis_trigger_calls_total counter',
+            *(f'neocrisis_trigger_calls_total{{{label(trigger=x.trigger)}}} {x.calls}' for x in triggers),
+            '# HELP neocrisis_trigger_seconds_total time in each game trigger (see api.trigger_stats)',
+            '# TYPE neocrisis_trigger_seconds_total counter',
+            *(f'neocrisis_trigger_seconds_total{{{label(trigger=x.trigger)}}} {x.total_time / 1000}' for x in triggers),
+        ]
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics(METRICS_DIR, METRICS_FLUSH)
+
+class Subscription:
+    'a bounded queue of events for one stream; overflowing resets the stream'
+    RESET = json.dumps({'op': 'RESET'})
+
+    def __init__(self, backlog):
+        self.events = deque()
+        self.backlog = backlog
+        self.cond = Condition()
+
+    def put(self, event):
+        with self.cond:
+            if len(self.events) >= self.backlog:
+                self.events.clear()
+                event = self.RESET
+            self.events.append(event)
+            self.cond.notify()
+
+    def get(self, timeout):
+        with self.cond:
+            if not self.events:
+                self.cond.wait(timeout)
+            return self.events.popleft() if self.events else None
+
+
+class Broadcaster:
+    '''
+    per-worker fan-out of database notifications
+
+    a single connection LISTENs on `channel` from a background thread and
+    every payload is passed to every subscription and callback; if the
+    connection drops, they are sent a RESET (events may have been missed)
+    '''
+    def __init__(self, params, channel):
+        self.params, self.channel = params, channel
+        self.lock = Lock()
+        self.pid, self.thread = None, None
+        self.listening = Event()
+        self.subscriptions = set()
+        self.callbacks = []
+
+    def start(self):
+        with self.lock:
+            if self.pid != getpid(): # forked: the listener thread belongs to the parent
+                self.pid, self.subscriptions = getpid(), set()
+                self.listening = Event()
+                self.thread = Thread(target=self.listen, daemon=True)
+                self.thread.start()
+
+    def subscribe(self):
+        '''
+        a new subscription; returns once LISTEN is in effect, so that a
+        snapshot taken after misses no change (or, if the listener cannot
+        connect in time, with a RESET queued)
+        '''
+        self.start()
+        sub = Subscription(STREAM_BACKLOG)
+        with self.lock:
+            self.subscriptions.add(sub)
+        if not self.listening.wait(STREAM_HEARTBEAT):
+            sub.put(Subscription.RESET)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            self.subscriptions.discard(sub)
+
+    def publish(self, event):
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        for sub in subscriptions:
+            sub.put(event)
+        for callback in self.callbacks:
+            callback(event)
+
+    def listen(self):
+        # NOTE: any failure (e.g., select() on a dead socket) reconnects, or
+        #       every open stream would wait for good
+        while True:
+            conn = None
+            try:
+                conn = connect(**self.params)
+                conn.set_session(autocommit=True)
+                with conn.cursor() as cur:
+                    cur.execute(f'listen {self.channel}')
+                self.listening.set()
+                while True:
+                    select([conn], [], [], STREAM_HEARTBEAT)
+                    conn.poll()
+                    while conn.notifies:
+                        self.publish(conn.notifies.pop(0).payload)
+            except Exception:
+                app.logger.exception('listening on %r failed; reconnecting', self.channel)
+                self.listening.clear()
+                self.publish(Subscription.RESET)
+                sleep(1)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+broadcaster = Broadcaster(DBPARAMS, STREAM_CHANNEL)
+
+# NOTE: a stream holds its thread for as long as the client stays connected;
+#       past STREAM_MAX, answer 503 rather than leave every other request of
+#       the worker waiting for a thread (asgi.py serves streams without one)
+streams = BoundedSemaphore(STREAM_MAX)
+replays = BoundedSemaphore(REPLAY_MAX) # likewise, and each its own connection
+
+
+class Busy(Exception):
+    'every slot (see take_slot) of a resource is taken; args[0] names it'
+
+
+def take_slot(slots, what):
+    '''
+    takes one of `slots` (a BoundedSemaphore) without waiting, or raises Busy;
+    returns a function giving it back (once, however often it is called)
+    '''
+    if not slots.acquire(blocking=False):
+        raise Busy(what)
+    taken = [True]
+    def release():
+        if taken and taken.pop():
+            slots.release()
+    return release
+
+ephemeris = Ephemeris(EPHEMERIS_TTL)
+broadcaster.callbacks.append(lambda _: ephemeris.invalidate())
+
+GENERATION_TTL = 24 * 60 * 60 # secs an octant's generation is kept unchanged
+
+
+def octant(r, theta, phi):
+    'as game.octant'
+    x, y, z = r * sin(phi) * cos(theta), r * sin(phi) * sin(theta), r * cos(phi)
+    return int(OCTANTS[(x < 0) + 2 * (y < 0) + 4 * (z < 0)])
+
+
+def changed_octants(event):
+    '''
+    the octants a notification (see game.notify) changes now: where a slug
+    flies, where a hit happens, where a rock is (or, for a DELETE, was);
+    every octant, if it cannot tell (e.g., a RESET)
+    '''
+    try:
+        event = json.loads(event)
+        table, obj = event['table'], event['object']
+        if table == 'slugs':
+            p = obj['params']
+            return {octant(1, p['theta'], p['phi'])}
+        if table == 'hits':
+            p = obj['collision']['pos']
+            return {octant(p['r'], p['theta'], p['phi'])}
+        if table == 'rocks':
+            p, dt = obj['params'], time() - parse(obj['fired']).timestamp()
+            return {octant(p['r_0'] + p['v'] * dt, p['m_theta'] * dt + p['b_theta'], p['m_phi'] * dt + p['b_phi'])}
+    except (ValueError, KeyError, TypeError):
+        pass
+    return set(range(1, 9))
+
+
+def generations():
+    'the generation of every octant (see invalidate)'
+    table = SharedTable.open(SHARED_PATH)
+    return tuple(table.get(f'telescope {o}')[0] for o in range(1, 9))
+
+
+def invalidate(octants):
+    'ends the current tick of `octants` early, for every worker (see ticked)'
+    table = SharedTable.open(SHARED_PATH)
+    for o in octants:
+        table.incr(f'telescope {o}', GENERATION_TTL)
 
-def get_db():
-    'opens database connection'
+
+# NOTE: after ephemeris.invalidate(), so that a worker that computes a tick
+#       after a change it has not yet been notified of (and so from a stale
+#       ephemeris) computes it again once it has
+if TELESCOPE_TICK:
+    telescope_cache = SharedCache(TELESCOPE_CACHE)
+    broadcaster.callbacks.append(lambda event: invalidate(changed_octants(event)))
+
+OBJECT_TYPES = {'api.rocks': 'rock', 'api.slugs': 'slug'}
+
+# NOTE: ?format=columns; one row of arrays, so that no row (or dict) per
+#       object is built in Python
+COLUMNS = ('id', 'type', 'name', 'target', 'mass', 'fired', 'r', 'theta', 'phi', 'x', 'y', 'z', 'octant', 'age')
+COLUMNS_QUERY = '''
+    select
+        {obs_time} as obs_time
+        , array_agg(n.id) as id
+        , array_agg(n.regclass::text) as regclass
+        , array_agg(n.name) as name
+        , array_agg(n.target) as target
+        , array_agg(n.mass) as mass
+        , array_agg(extract(epoch from n.fired)::double precision) as fired
+        , array_agg((n.pos).r::double precision) as r
+        , array_agg((n.pos).theta::double precision) as theta
+        , array_agg((n.pos).phi::double precision) as phi
+        , array_agg((n.cpos).x::double precision) as x
+        , array_agg((n.cpos).y::double precision) as y
+        , array_agg((n.cpos).z::double precision) as z
+        , array_agg(n.octant) as octant
+        , array_agg(extract(epoch from n.age)::double precision) as age
+    from {source}
+'''
+
+# NOTE: server-side prepared statements, PREPAREd once per pooled connection
+PREPARED = {
+    'telescope': ('integer', '''
+        select
+            id
+            , regclass
+            , name
+            , mass
+            , target
+            , fired
+            , (pos).r::double precision as pos_r
+            , (pos).theta::double precision as pos_theta
+            , (pos).phi::double precision as pos_phi
+            , (cpos).x::double precision as cpos_x
+            , (cpos).y::double precision as cpos_y
+            , (cpos).z::double precision as cpos_z
+            , t
+            , octant
+            , age
+        from api.telescope(array[$1])
+    '''),
+    # NOTE: api.telescope looks up the requested octants in the octant_spans
+    #       index; the outer join guarantees an observation time even for an
+    #       empty sky
+    'telescope_sweep': ('integer[]', '''
+        select
+            obs.t as obs_time
+            , n.id
+            , n.regclass
+            , n.name
+            , n.mass
+            , n.target
+            , n.fired
+            , (n.pos).r::double precision as pos_r
+            , (n.pos).theta::double precision as pos_theta
+            , (n.pos).phi::double precision as pos_phi
+            , (n.cpos).x::double precision as cpos_x
+            , (n.cpos).y::double precision as cpos_y
+            , (n.cpos).z::double precision as cpos_z
+            , n.t
+            , n.octant
+            , n.age
+        from (select now() as t) as obs
+        left outer join api.telescope($1) as n
+            on true
+    '''),
+    # NOTE: history.neos reads the bitemporal history (engine/bitemporal)
+    'telescope_asof': ('integer[], timestamp with time zone', '''
+        select
+            id
+            , regclass
+            , name
+            , mass
+            , target
+            , fired
+            , (pos).r::double precision as pos_r
+            , (pos).theta::double precision as pos_theta
+            , (pos).phi::double precision as pos_phi
+            , (cpos).x::double precision as cpos_x
+            , (cpos).y::double precision as cpos_y
+            , (cpos).z::double precision as cpos_z
+            , t
+            , octant
+            , age
+        from history.neos($2)
+        where octant = any($1)
+    '''),
+    'telescope_columns': ('integer[]', COLUMNS_QUERY.format(
+        obs_time='now()',
+        source='api.telescope($1) as n',
+    )),
+    'telescope_columns_asof': ('integer[], timestamp with time zone', COLUMNS_QUERY.format(
+        obs_time='$2',
+        source='history.neos($2) as n where n.octant = any($1)',
+    )),
+    # NOTE: one statement for the whole salvo, so the engine resolves the
+    #       collisions and hits of every shot at once
+    'railgun_fire': ('text[], text[], numeric[], numeric[], timestamp with time zone[]', f'''
+        insert into game.slugs (name, target, params, fired)
+        select name, target, (theta, phi, {SLUG_VELOCITY})::game.slug_params, coalesce(fired, now())
+        from unnest($1, $2, $3, $4, $5) as shot (name, target, theta, phi, fired)
+        returning id
+    '''),
+    # NOTE: solutions are computed from the exact game.rock_params (see
+    #       game.intercept); collisions after year 9999 don't fit in a
+    #       datetime (and won't save anyone)
+    'railgun_solve': ('timestamp with time zone, integer[]', f'''
+        select
+            s.id
+            , s.name
+            , f.fired
+            , s.t
+            , (s.params).theta::double precision as theta
+            , (s.params).phi::double precision as phi
+        from (select coalesce($1, now()) as fired) as f
+        cross join api.solve(f.fired, {SLUG_VELOCITY}, $2) as s
+        where s.t < '10000-01-01'
+        order by s.t
+    '''),
+    'railgun_slugs': ('integer[]', '''
+        select
+            id
+            , name
+            , target
+            , fired
+            , (pos).r::double precision as pos_r
+            , (pos).theta::double precision as pos_theta
+            , (pos).phi::double precision as pos_phi
+            , (cpos).x::double precision as cpos_x
+            , (cpos).y::double precision as cpos_y
+            , (cpos).z::double precision as cpos_z
+            , t
+            , octant
+            , age
+        from api.neos
+        where regclass = 'api.slugs'::regclass and id = any($1)
+        order by array_position($1, id)
+    '''),
+    # NOTE: index range scans on game.impacts (impacts_t)
+    'impacts_past': ('integer', '''
+        select r.id, r.name, r.target, r.fired, i.t
+        from game.impacts as i
+        inner join game.rocks as r on (r.id = i.rock)
+        where i.t <= now()
+        order by i.t desc
+        limit $1
+    '''),
+    'impacts_next': ('integer', '''
+        select r.id, r.name, r.target, r.fired, i.t
+        from game.impacts as i
+        inner join game.rocks as r on (r.id = i.rock)
+        where i.t > now()
+        order by i.t
+        limit $1
+    '''),
+}
+
+def execute(cur, name, *args):
+    'executes a prepared statement, preparing it on first use'
+    conn = cur.connection
+    if name not in conn.prepared:
+        types, query = PREPARED[name]
+        cur.execute(f'prepare {name} ({types}) as {query}')
+        conn.prepared.add(name)
+    cur.execute(f'execute {name} ({", ".join("%s" for _ in args)})', args)
+
+
+def get_db(readonly=False):
+    '''
+    checks out a database connection from the pool (from a replica's, if
+    `readonly` and one is fresh; see Replicas); the first checkout of a
+    request decides where all of its queries go
+    '''
     if not hasattr(g, 'db'):
-        g.db = connect(**DBPARAMS, cursor_factory=NamedTupleCursor)
-        g.db.set_session(autocommit=True)
+        conn = replicas.getconn() if readonly else None
+        g.db = conn if conn is not None else pool.getconn()
+        g.db.db_time = 0
     return g.db
 
 
+def get_observer(asof=None):
+    '''
+    a database connection for an observation; the ephemeris is (re)loaded
+    from the primary, whose notifications invalidate it, since one loaded from
+    a lagging replica would be kept (stale) for up to EPHEMERIS_TTL
+    '''
+    return get_db(readonly=asof is not None or not EPHEMERIS)
+
+
+@app.before_request
+def start_timer():
+    g.start = perf_counter()
+
+
+@app.after_request
+def record_metrics(resp):
+    # NOTE: requests refused before start_timer (e.g., rate limited) are
+    #       counted but not timed
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    elapsed = perf_counter() - g.start if 'start' in g else None
+    db_time = g.db.db_time if hasattr(g, 'db') else None
+    metrics.observe(route, request.method, resp.status_code, elapsed, db_time)
+    return resp
+
+
+@app.after_request
+def server_timing(resp):
+    # NOTE: database time of this request (see api/bench.py); streams return
+    #       their connection early and go without
+    if hasattr(g, 'db'):
+        resp.headers['Server-Timing'] = f'db;dur={g.db.db_time * 1000:.3f}'
+    return resp
+
+
 @app.teardown_appcontext
 def close_db(_):
     if hasattr(g, 'db'):
-        g.db.close()
+        conn = g.pop('db')
+        conn.pool.putconn(conn)
 
 
 @app.route('/', methods=['GET'])
@@ -71,7 +861,7 @@ def docs():
 @app.route('/help/', methods=['GET'])
 def help():
     return jsonify({
-        'message': 'check out /telescope/help/ and /railgun/help/',
+        'message': 'check out /telescope/help/, /railgun/help/ and /impacts/help/',
     })
 
 
@@ -81,16 +871,46 @@ def telescope_help():
         'endpoints': {
             '/telescope/help/':        'describes the /telescope/<int:octant> endpoint',
             '/telescope/<int:octant>': 'makes an observation in the specified octant',
+            '/telescope/<octants>':    'makes a single observation in each of the specified octants',
+            '/telescope/all':          'makes a single observation of the whole sky (also: /telescope)',
+            '/telescope/stream':       'observes the whole sky, then streams every change as it happens',
+            '/telescope/replay':       'streams every change of a past game, as recorded in its history',
         },
         'methods': {
             '/telescope/help/':        ['GET'],
             '/telescope/<int:octant>': ['GET'],
+            '/telescope/<octants>':    ['GET'],
+            '/telescope/all':          ['GET'],
+            '/telescope/stream':       ['GET'],
+            '/telescope/replay':       ['GET'],
         },
         'inputs': {
             '/telescope/help/': {},
             '/telescope/<int:octant>': {
-                'octant': 'the octant in which to make the observation (integer, [1, 8])'
+                'octant': 'the octant in which to make the observation (integer, [1, 8])',
+                'asof':   '(OPTIONAL) observe the sky as it was at this past time, from the history (URL parameter; string, as HH:MM:SS in local time zone or an ISO 8601 timestamp)',
+                'format': "(OPTIONAL) 'objects' (default), 'columns' (see ?format=columns in outputs), or 'npz' (the same columns as a NumPy .npz file; strings as UTF-8 bytes) (URL parameter; or by Accept: application/vnd.neocrisis.columns+json or application/x-npz)",
+            },
+            '/telescope/<octants>': {
+                'octants': 'the octants in which to make the observation (comma-separated integers, each [1, 8]; e.g., 1,3,5)',
+                'asof':    '(OPTIONAL) as for /telescope/<int:octant>',
+                'format':  '(OPTIONAL) as for /telescope/<int:octant>',
+            },
+            '/telescope/all': {
+                'asof':   '(OPTIONAL) as for /telescope/<int:octant>',
+                'format': '(OPTIONAL) as for /telescope/<int:octant>',
+            },
+            '/telescope/stream': {
+                'format': "(OPTIONAL) 'sse' for Server-Sent Events (default) or 'ndjson' for newline-delimited JSON",
+                'note':   'a server keeps a limited number of streams open at once; past that, it answers 503 (retry later)',
             },
+            '/telescope/replay': ['the following are all passed as URL parameters', {
+                'from':   '(OPTIONAL) the time to replay from; the state at that time is sent first (default: the start of the history)',
+                'to':     '(OPTIONAL) the time to replay to (default: now)',
+                'speed':  '(OPTIONAL) how many times faster than real time to replay; 0 sends every event at once (number, default 1)',
+                'format': "(OPTIONAL) as for /telescope/stream",
+                'note':   f'at most {REPLAY_LIMIT} per client; a server keeps a limited number of replays open at once; past that, it answers 503 (retry later)',
+            }],
         },
         'outputs': {
             '/telescope/help/': {
@@ -125,54 +945,429 @@ def telescope_help():
                     }
                 ]
             },
+            '/telescope/<octants>': {
+                'obs_time': 'the time of this observation (shared by every object seen)',
+                'octants':  'the objects seen, keyed by octant (each as in /telescope/<int:octant>)',
+            },
+            '/telescope/all': {
+                'obs_time': 'the time of this observation (shared by every object seen)',
+                'octants':  'the objects seen, keyed by octant (each as in /telescope/<int:octant>)',
+            },
+            '?format=columns': {
+                'obs_time': 'the time of this observation (shared by every object seen)',
+                'count':    'the number of objects seen',
+                'columns':  ['one array per field, with one entry per object seen (in every octant requested)', {
+                             'id, type, name, target, mass, octant': 'as in /telescope/<int:octant>',
+                             'r, theta, phi':                       'as pos in /telescope/<int:octant>',
+                             'x, y, z':                             'as cpos in /telescope/<int:octant>',
+                             'fired':                               'the time when the object was first launched (in secs since 1970-01-01 UTC)',
+                             'age':                                 'the amount of time since the object was launched (in secs, with fractions)',
+                             }],
+            },
+            '/telescope/stream': [
+                'a stream of events, one JSON object per event',
+                {
+                    'op':     "'SNAPSHOT' (first event, as in /telescope/all), 'INSERT' or 'UPDATE' (a change), 'DELETE' (a removal, e.g., a hit un-done by an earlier one), or 'RESET' (events were missed; reconnect)",
+                    'table':  "the table that changed: 'rocks', 'slugs', or 'hits'",
+                    'object': 'the new row of that table (for a DELETE, the removed row)',
+                },
+            ],
+            '/telescope/replay': [
+                'a stream of events, one JSON object per event, in the order they happened',
+                {
+                    'op':     "'INSERT' (an object appears), 'UPDATE' (it changes), 'DELETE' (it is removed), or 'END' (last event)",
+                    'table':  "the table that changed: 'rocks', 'slugs', or 'hits'",
+                    'asof':   'the time of the change',
+                    'object': 'the row of that table (as of that time)',
+                },
+            ],
         },
     })
 
+def telescope_object(x):
+    return {
+        'help': 'GET /telescope/help/ for more information',
+        'id': x.id,
+        'type': OBJECT_TYPES.get(x.regclass, 'unknown'),
+        'name': x.name,
+        'target': x.target,
+        'mass': x.mass,
+        'fired': x.fired,
+        'pos': {'r': x.pos_r, 'theta': x.pos_theta, 'phi': x.pos_phi},
+        'cpos': {'x': x.cpos_x, 'y': x.cpos_y, 'z': x.cpos_z},
+        'obs_time': x.t,
+        'octant': x.octant,
+        'age': x.age.seconds,
+    }
+
+
+def parse_time(value, now):
+    'parses a past time (e.g., ?asof=); returns it and an error message'
+    try:
+        t = parse(value)
+    except Exception as e:
+        return None, f'bad time {value!r}: {e!r}'
+    if t.tzinfo is None:
+        t = TIMEZONE.localize(t)
+    if t > now:
+        return None, f'time {t} after current time {now}'
+    return t, None
+
+
+class NoHistory(Exception):
+    'the bitemporal layer (engine/bitemporal) is not installed'
+
+# undefined_table, undefined_function, invalid_schema_name
+NO_HISTORY_CODES = {'42P01', '42883', '3F000'}
+
+
+def observe_asof(cur, octants, asof, statement='telescope_asof'):
+    try:
+        execute(cur, statement, octants, asof)
+    except ProgrammingError as e:
+        if e.pgcode not in NO_HISTORY_CODES:
+            raise
+        raise NoHistory(e.pgerror)
+    return cur.fetchall()
+
+
+@app.errorhandler(NoHistory)
+def no_history(e):
+    msg = {'error': 'no history is kept', 'msg': str(e)}
+    return make_response(jsonify(msg), 404)
+
+
+@app.errorhandler(Busy)
+def busy(e):
+    what, = e.args
+    msg = {'error': f'too many open {what}; try again later'}
+    return make_response(jsonify(msg), 503, {'Retry-After': '1'})
+
+
+TELESCOPE_FORMATS = {
+    'objects': 'application/json',
+    'columns': 'application/vnd.neocrisis.columns+json',
+    'npz':     'application/x-npz',
+}
+
+
+def parse_format():
+    'the telescope response format, from ?format= or Accept:; returns it and an error message'
+    if 'format' in request.args:
+        fmt = request.args['format']
+        if fmt not in TELESCOPE_FORMATS:
+            return None, f'invalid format {fmt!r} must be one of {", ".join(map(repr, TELESCOPE_FORMATS))}'
+        return fmt, None
+    mimetype = request.accept_mimetypes.best_match(list(TELESCOPE_FORMATS.values()), 'application/json')
+    return {v: k for k, v in TELESCOPE_FORMATS.items()}[mimetype], None
+
+
+def observe_columns(octants, asof=None, t=None):
+    '''
+    one observation of `octants` (now, or at `t` from the ephemeris), as lists
+    by column; returns obs_time and the columns
+    '''
+    with get_observer(asof).cursor() as cur:
+        if asof is not None:
+            row, = observe_asof(cur, octants, asof, 'telescope_columns_asof')
+            obs_time, columns = row.obs_time, row._asdict()
+        elif EPHEMERIS:
+            broadcaster.start()
+            obs_time = t or datetime.now(TIMEZONE)
+            columns = ephemeris.columns(cur, obs_time, octants)
+        else:
+            execute(cur, 'telescope_columns', octants)
+            row = cur.fetchone()
+            obs_time, columns = row.obs_time, row._asdict()
+    columns['type'] = [OBJECT_TYPES.get(x, 'unknown') for x in columns.pop('regclass') or ()]
+    return obs_time, {k: columns[k] or [] for k in COLUMNS}
+
+
+def columns_response(obs_time, columns, fmt):
+    '''
+    an observation in column arrays: JSON (with the default encoder, so no
+    object is visited in Python) or NumPy's .npz (strings as UTF-8 bytes)
+    '''
+    if fmt == 'npz':
+        buf = BytesIO()
+        np.savez(
+            buf,
+            obs_time=np.array(obs_time.isoformat().encode()),
+            **{k: np.array([b'' if x is None else x.encode() for x in v], dtype=bytes)
+                  if k in {'type', 'name', 'target'} else np.array(v)
+               for k, v in columns.items()},
+        )
+        return Response(buf.getvalue(), mimetype=TELESCOPE_FORMATS['npz'])
+    body = raw_dumps({
+        'help': 'GET /telescope/help/ for more information',
+        'obs_time': obs_time.isoformat(),
+        'count': len(columns['id']),
+        'columns': columns,
+    }, separators=(',', ':'))
+    return Response(body, mimetype=TELESCOPE_FORMATS['columns'])
+
+
+def ticked(octants, fmt, respond):
+    '''
+    the response of respond(t) at the start `t` of the current tick (see
+    TELESCOPE_TICK), made by one worker for every worker; its ETag is the
+    tick and the generations of `octants`, so that invalidate() ends the tick
+    early, and caches must revalidate it (cheaply: a 304 needs no query)
+    '''
+    broadcaster.start()
+    now = time()
+    tick = floor(now / TELESCOPE_TICK)
+    gens = generations()
+    tag = '.'.join(map(str, [tick, fmt, *(gens[o - 1] for o in octants)]))
+    # NOTE: not max-age for the rest of the tick: a cache (e.g., nginx) would
+    #       keep serving it after invalidate(), hiding a slug just fired
+    headers = {
+        'ETag': f'"{tag}"',
+        'Cache-Control': 'no-cache',
+        'Vary': 'Accept',
+    }
+    if request.if_none_match.contains(tag):
+        return Response(status=304, headers=headers)
+
+    def compute():
+        telescope_cache.prune(max(TELESCOPE_CACHE_PRUNE, TELESCOPE_TICK))
+        resp = respond(datetime.fromtimestamp(tick * TELESCOPE_TICK, TIMEZONE))
+        return resp.content_type, resp.get_data()
+
+    # NOTE: by endpoint and the parsed octants, not request.path, so that,
+    #       e.g., /telescope/1,1 and /telescope/01 share one file
+    key = f'{request.endpoint} {",".join(map(str, octants))} {fmt}'
+    content_type, body = telescope_cache.get(key, tag, compute)
+    return Response(body, content_type=content_type, headers=headers)
+
+
 @app.route('/telescope/<int:octant>', methods=['GET'])
 def telescope(octant):
     if not 1 <= octant <= 8:
         msg = {'error': f'invalid octant {octant} must be [1, 8]'}
         return make_response(jsonify(msg), 400)
-    query = '''
-        select
-            id
-            , regclass
-            , name
-            , mass
-            , target
-            , fired
-            , (pos).r::double precision as pos_r
-            , (pos).theta::double precision as pos_theta
-            , (pos).phi::double precision as pos_phi
-            , (cpos).x::double precision as cpos_x
-            , (cpos).y::double precision as cpos_y
-            , (cpos).z::double precision as cpos_z
-            , t
-            , octant
-            , age
-        from api.neos
-        where octant = %(octant)s
+    asof = None
+    if 'asof' in request.args:
+        asof, error = parse_time(request.args['asof'], datetime.now(TIMEZONE))
+        if error is not None:
+            return make_response(jsonify({'error': error}), 400)
+    fmt, error = parse_format()
+    if error is not None:
+        return make_response(jsonify({'error': error}), 400)
+
+    def respond(t=None):
+        if fmt != 'objects':
+            return columns_response(*observe_columns([octant], asof, t), fmt)
+        with get_observer(asof).cursor() as cur:
+            if asof is not None:
+                cur = observe_asof(cur, [octant], asof)
+            elif EPHEMERIS:
+                broadcaster.start()
+                cur = ephemeris.observe(cur, t or datetime.now(TIMEZONE), [octant])
+            else:
+                execute(cur, 'telescope', octant)
+            objects = [telescope_object(x) for x in cur]
+        return jsonify({'objects': objects})
+
+    if asof is None and TELESCOPE_TICK:
+        return ticked([octant], fmt, respond)
+    return respond()
+
+
+def parse_octants(octants):
     '''
-    with get_db().cursor() as cur:
-        cur.execute(query, {'octant': octant})
-        objects = [
-            {
-                'help': 'GET /telescope/help/ for more information',
-                'id': x.id,
-                'type': {'api.rocks': 'rock', 'api.slugs': 'slug'}.get(x.regclass, 'unknown'),
-                'name': x.name,
-                'target': x.target,
-                'mass': x.mass,
-                'fired': x.fired,
-                'pos': {'r': x.pos_r, 'theta': x.pos_theta, 'phi': x.pos_phi},
-                'cpos': {'x': x.cpos_x, 'y': x.cpos_y, 'z': x.cpos_z},
-                'obs_time': x.t,
-                'octant': x.octant,
-                'age': x.age.seconds,
-            }
-            for x in cur
-        ]
-    return jsonify({'objects': objects})
+    parses a comma-separated octant list (all octants, if None);
+    returns the octants and an error message
+    '''
+    if octants is None:
+        return list(range(1, 9)), None
+    try:
+        octants = sorted({int(o) for o in octants.split(',')})
+    except ValueError:
+        return None, f'invalid octants {octants!r} must be a comma-separated list of integers'
+    if not all(1 <= o <= 8 for o in octants):
+        return None, f'invalid octants {octants} must be [1, 8]'
+    return octants, None
+
+
+def sweep(octants, asof=None, t=None):
+    '''
+    makes one observation of the given octants (as of a past time, if given;
+    at `t` from the ephemeris, if given)
+    '''
+    objects = {str(o): [] for o in octants}
+    with get_observer(asof).cursor() as cur:
+        if asof is not None:
+            obs_time = asof
+            for x in observe_asof(cur, octants, asof):
+                objects[str(x.octant)].append(telescope_object(x))
+        elif EPHEMERIS:
+            broadcaster.start()
+            obs_time = t or datetime.now(TIMEZONE)
+            for x in ephemeris.observe(cur, obs_time, octants):
+                objects[str(x.octant)].append(telescope_object(x))
+        else:
+            execute(cur, 'telescope_sweep', octants)
+            for x in cur:
+                obs_time = x.obs_time
+                if x.id is not None:
+                    objects[str(x.octant)].append(telescope_object(x))
+    return {'obs_time': obs_time, 'octants': objects}
+
+
+@app.route('/telescope', methods=['GET'])
+@app.route('/telescope/all', methods=['GET'])
+@app.route('/telescope/<octants>', methods=['GET'])
+def telescope_sweep(octants=None):
+    octants, error = parse_octants(octants)
+    if error is not None:
+        return make_response(jsonify({'error': error}), 400)
+    asof = None
+    if 'asof' in request.args:
+        asof, error = parse_time(request.args['asof'], datetime.now(TIMEZONE))
+        if error is not None:
+            return make_response(jsonify({'error': error}), 400)
+    fmt, error = parse_format()
+    if error is not None:
+        return make_response(jsonify({'error': error}), 400)
+
+    def respond(t=None):
+        if fmt != 'objects':
+            return columns_response(*observe_columns(octants, asof, t), fmt)
+        return jsonify(sweep(octants, asof, t))
+
+    if asof is None and TELESCOPE_TICK:
+        return ticked(octants, fmt, respond)
+    return respond()
+
+
+@app.route('/telescope/stream', methods=['GET'])
+def telescope_stream():
+    fmt = request.args.get('format', 'sse')
+    if fmt not in {'sse', 'ndjson'}:
+        msg = {'error': f"invalid format {fmt!r} must be 'sse' or 'ndjson'"}
+        return make_response(jsonify(msg), 400)
+
+    # NOTE: subscribe before observing so no change is missed in between (so
+    #       observe the primary, which sends the notifications), and return
+    #       the connection to the pool before streaming
+    release = take_slot(streams, 'streams')
+    sub = broadcaster.subscribe()
+    def close():
+        broadcaster.unsubscribe(sub)
+        release()
+    try:
+        get_db()
+        snapshot = json.dumps({'op': 'SNAPSHOT', **sweep(list(range(1, 9)))})
+    except Exception:
+        close()
+        raise
+    finally:
+        close_db(None)
+
+    if fmt == 'sse':
+        frame = lambda event: f'data: {event}\n\n'
+        heartbeat = ': heartbeat\n\n'
+        mimetype = 'text/event-stream'
+    else:
+        frame = lambda event: f'{event}\n'
+        heartbeat = '\n'
+        mimetype = 'application/x-ndjson'
+
+    def events():
+        try:
+            yield frame(snapshot)
+            while True:
+                event = sub.get(STREAM_HEARTBEAT)
+                yield heartbeat if event is None else frame(event)
+        finally:
+            close()
+
+    # NOTE: also on close, as a generator never started has no finally to run
+    response = Response(events(), mimetype=mimetype, headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(close)
+    return response
+
+
+@app.route('/telescope/replay', methods=['GET'])
+@limiter.limit(REPLAY_LIMIT)
+def telescope_replay():
+    fmt = request.args.get('format', 'sse')
+    if fmt not in {'sse', 'ndjson'}:
+        msg = {'error': f"invalid format {fmt!r} must be 'sse' or 'ndjson'"}
+        return make_response(jsonify(msg), 400)
+    try:
+        speed = float(request.args.get('speed', 1))
+        if not speed >= 0:
+            raise ValueError(speed)
+    except ValueError as e:
+        msg = {'error': 'invalid speed must be a number >= 0', 'msg': repr(e)}
+        return make_response(jsonify(msg), 400)
+
+    now = datetime.now(TIMEZONE)
+    bounds = {}
+    for arg in ('from', 'to'):
+        if arg in request.args:
+            bounds[arg], error = parse_time(request.args[arg], now)
+            if error is not None:
+                return make_response(jsonify({'error': error}), 400)
+
+    # NOTE: a dedicated connection, in a read-only transaction, so the events
+    #       are read from one server-side cursor as they are sent (and the
+    #       pool is not held for the length of the replay); on the primary,
+    #       since a standby cancels long queries that conflict with replay; so
+    #       at most REPLAY_MAX of them per worker
+    release = take_slot(replays, 'replays')
+    conn = None
+    def close():
+        if conn is not None:
+            conn.close()
+        release()
+    try:
+        conn = connect(**DBPARAMS)
+        conn.set_session(readonly=True)
+        cur = conn.cursor(name='replay')
+        cur.itersize = REPLAY_CHUNK
+        cur.execute('''
+            select t, op, tbl, object::text
+            from history.replay(
+                coalesce(%s, '-infinity')::timestamp with time zone
+                , coalesce(%s, now())::timestamp with time zone
+            )
+        ''', (bounds.get('from'), bounds.get('to')))
+        first = cur.fetchone()
+    except Exception as e:
+        close()
+        if isinstance(e, ProgrammingError) and e.pgcode in NO_HISTORY_CODES:
+            raise NoHistory(e.pgerror)
+        raise
+
+    if fmt == 'sse':
+        frame = lambda event: f'data: {event}\n\n'
+        mimetype = 'text/event-stream'
+    else:
+        frame = lambda event: f'{event}\n'
+        mimetype = 'application/x-ndjson'
+
+    def events():
+        # NOTE: events are paced by their time since the first event, at
+        #       `speed` times real time (speed=0 sends them all at once)
+        try:
+            start, game_start = monotonic(), first[0] if first else None
+            for t, op, table, obj in chain([first] if first else [], cur):
+                if speed:
+                    delay = (t - game_start).total_seconds() / speed - (monotonic() - start)
+                    if delay > 0:
+                        sleep(delay)
+                yield frame(f'{{"op": "{op}", "table": "{table}", "asof": "{t.isoformat()}", "object": {obj}}}')
+            yield frame(json.dumps({'op': 'END'}))
+        finally:
+            close()
+
+    # NOTE: also on close, as for telescope_stream
+    response = Response(events(), mimetype=mimetype, headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(close)
+    return response
 
 
 @app.route('/railgun/help/', methods=['GET'])
@@ -180,11 +1375,13 @@ def railgun_help():
     return jsonify({
         'endpoints': {
             '/railgun/help/': 'describes the /railgun/<int:octant> endpoint',
-            '/railgun':       'fires a slug',
+            '/railgun':       'fires a slug (or a salvo of slugs)',
+            '/railgun/solve': 'computes (and optionally fires) a firing solution for every visible rock',
         },
         'methods': {
             '/railgun/help/': ['GET'],
             '/railgun':       ['POST'],
+            '/railgun/solve': ['POST'],
         },
         'inputs': {
             '/railgun/help/': {},
@@ -194,6 +1391,11 @@ def railgun_help():
                 'phi':    '(also: φ or inclination) the angle at which to fore, measured north-to-south (latitudinally) from the North Pole to the South Pole (number, in radians, [0, π]])',
                 'target': "the name of the rock you're trying to hit (for display purposes only) (string)",
                 'fired':  '(OPTIONAL) the time when you want to fire; must be in the future, must be within 5 minutes of the current time; if not specified, assume immediate firing (string, as HH:MM:SS in local time zone)',
+            }, 'or a JSON array of the above (a salvo, fired in one go); rate limits count each shot'],
+            '/railgun/solve': ['the following are all passed as JSON POST data', {
+                'rocks': '(OPTIONAL) the ids of the rocks to solve for; if not specified, solve for every visible rock; rocks a slug in flight is already on course to hit are skipped (array of integers)',
+                'fired': '(OPTIONAL) the time when you want to fire; as for /railgun (string, as HH:MM:SS in local time zone)',
+                'fire':  f'(OPTIONAL) if true, fire the (at most {RAILGUN_RATE.amount}) soonest solutions as a salvo; rate limits count each shot (boolean)',
             }],
         },
         'outputs': {
@@ -204,6 +1406,7 @@ def railgun_help():
                 'outputs':   'the outputs the endpoints return',
             },
             '/railgun': {
+                'objects': '(for a salvo) a list of the details of each slug you just fired, in order; as below',
                 'object': [
                     'the details of the slug you just fired',
                     {
@@ -228,100 +1431,291 @@ def railgun_help():
                     }
                 ]
             },
+            '/railgun/solve': {
+                'solutions': ['a list of firing solutions, soonest collision first', {
+                    'rock':           'the id and name of the rock',
+                    'theta':          'the angle at which to fire (as for /railgun)',
+                    'phi':            'the angle at which to fire (as for /railgun)',
+                    'fired_time':     'the time when the slug must be fired',
+                    'collision_time': 'the time when the slug will hit the rock (unless something else hits it first)',
+                }],
+                'objects': '(if fire is true) the details of each slug fired, in the order of the solutions; as for /railgun',
+                'unfired': '(if fire is true) the id and name of each rock solved for but not fired at (over the salvo limit); ask again',
+            },
         },
     })
 
 
+class BadShot(Exception):
+    'a shot that fails validation; args[0] is the error response'
+
+
+def parse_fired(data, now):
+    'validates the (optional) firing time of a shot; returns it or None'
+    if 'fired' not in data:
+        return None
+    try:
+        fired = TIMEZONE.localize(parse(data['fired'], ignoretz=True))
+    except Exception as e:
+        raise BadShot({'error': f'bad firing time', 'msg': repr(e)})
+    if fired < now:
+        raise BadShot({'error': f"firing time before current time", 'now': now, 'fired': fired})
+    if (fired - now).total_seconds() > (60 * 5):
+        raise BadShot({'error': f"firing time too far into future; must be within 5 minutes of current time", 'now': now, 'fired': fired})
+    return fired
+
+
+def parse_shot(data, now):
+    'validates one shot; returns (name or None, target, theta, phi, fired) or raises BadShot'
+    if not isinstance(data, dict):
+        raise BadShot({'error': 'malformed request'})
+
+    # NOTE: unnamed shots are named once they pass the rate limit (see
+    #       name_shots), so refused shots do not use up the sequence
+    name = data.get('name')
+
+    try:
+        theta = float(data.get('theta'))
+        phi = float(data.get('phi'))
+        target = data.get('target')
+    except Exception as e:
+        raise BadShot({'error': f'bad theta/phi params', 'msg': repr(e)})
+
+    return name, target, theta, phi, parse_fired(data, now)
+
+
+def parse_salvo(data, now):
+    '''
+    validates a POST /railgun body, a single shot (object) or a salvo (array of
+    shots); returns whether it is a salvo and the shots (as from parse_shot) or
+    raises BadShot
+    '''
+    if data is None:
+        raise BadShot({'error': 'malformed request'})
+    salvo = isinstance(data, list)
+    shots = data if salvo else [data]
+    if not shots:
+        raise BadShot({'error': 'empty salvo'})
+    if len(shots) > RAILGUN_RATE.amount:
+        raise BadShot({'error': f'salvo too large; at most {RAILGUN_RATE.amount} shots', 'shots': len(shots)})
+
+    parsed = []
+    for idx, shot in enumerate(shots):
+        try:
+            parsed.append(parse_shot(shot, now))
+        except BadShot as e:
+            msg, = e.args
+            if salvo:
+                msg['shot'] = idx
+            raise
+    return salvo, parsed
+
+
+def name_shots(shots):
+    'the shots (as from parse_shot), each unnamed one named from the shared sequence'
+    # NOTE: one sequence for every worker (see SharedTable)
+    table = SharedTable.open(SHARED_PATH)
+    return [
+        (f'shot #{table.next() * 10}' if name is None else name, *rest)
+        for name, *rest in shots
+    ]
+
+
+def take_hits(limit, hits, *identifiers):
+    '''
+    counts `hits` hits against `limit` (a limits item, under the key limits
+    gives `identifiers`) at once, or none if fewer remain; returns whether it
+    counted them
+    '''
+    # NOTE: in one step under the key's lock (see SharedTable.incr); with
+    #       limits' hit(), a refused hit is still counted, and hits counted
+    #       before another request's use up the window between them
+    table = SharedTable.open(SHARED_PATH)
+    count = table.incr(limit.key_for(*identifiers), limit.get_expiry(), amount=hits, limit=limit.amount)
+    return count <= limit.amount
+
+
+def count_shots(shots):
+    'counts `shots` against RAILGUN_LIMIT, as if each were a POST /railgun; all or none'
+    # NOTE: same key and scope as the @limiter.limit on railgun()
+    if limiter.enabled and shots:
+        if not take_hits(RAILGUN_RATE, shots, get_remote_address(), 'railgun'):
+            raise RateLimitExceeded(str(RAILGUN_RATE))
+
+
+def fire(cur, shots):
+    'fires `shots` (as from parse_shot) in one statement; returns the slugs'
+    execute(cur, 'railgun_fire', *map(list, zip(*shots)))
+    slug_ids = [x.id for x in cur.fetchall()]
+    execute(cur, 'railgun_slugs', slug_ids)
+    slugs = cur.fetchall()
+    fired(slugs)
+    return [slug_object(x) for x in slugs]
+
+
+def fired(slugs):
+    'forgets the observations made before `slugs` (rows of railgun_slugs) were fired'
+    # NOTE: at once, rather than when this worker is notified (see
+    #       changed_octants), so that the next observation sees the slugs
+    ephemeris.invalidate()
+    if TELESCOPE_TICK:
+        invalidate({octant(1, x.pos_theta, x.pos_phi) for x in slugs})
+
+
+def slug_object(x):
+    return {
+        'help': 'GET /railgun/help/ for more information',
+        'id': x.id,
+        'type': 'slug',
+        'name': x.name,
+        'target': x.target,
+        'fired_time': x.fired,
+        'pos': {'r': x.pos_r, 'theta': x.pos_theta, 'phi': x.pos_phi},
+        'cpos': {'x': x.cpos_x, 'y': x.cpos_y, 'z': x.cpos_z},
+        'obs_time': x.t,
+        'octant': x.octant,
+        'age': x.age.seconds,
+    }
+
+
 @app.route('/railgun', methods=['POST'])
-@limiter.limit('5 per 1 seconds')
+@limiter.limit(RAILGUN_LIMIT)
 def railgun():
+    try:
+        salvo, parsed = parse_salvo(request.json, datetime.now(TIMEZONE))
+    except BadShot as e:
+        msg, = e.args
+        return make_response(jsonify(msg), 400)
+
+    # NOTE: @limiter.limit counts the request as one shot; count the rest
+    count_shots(len(parsed) - 1)
+
+    with get_db().cursor() as cur:
+        objs = fire(cur, name_shots(parsed))
+    if salvo:
+        return jsonify({'objects': objs})
+    return jsonify({'object': objs[0] if objs else {}})
+
+
+@app.route('/railgun/solve', methods=['POST'])
+@limiter.limit('5 per 1 seconds')
+def railgun_solve():
     data = request.json
     if data is None:
+        data = {}
+    if not isinstance(data, dict):
         msg = {'error': 'malformed request'}
         return make_response(jsonify(msg), 400)
 
-    if 'name' in data:
-        name = data['name']
-    else:
-        with counter.get_lock():
-            counter.value += 1
-            name = data.get('name', f'shot #{counter.value * 10}')
-
     try:
-        theta = float(data.get('theta'))
-        phi = float(data.get('phi'))
-        target = data.get('target')
+        rocks = data.get('rocks')
+        if rocks is not None:
+            rocks = [int(x) for x in rocks]
+        fire_solutions = bool(data.get('fire', False))
     except Exception as e:
-        msg = {'error': f'bad theta/phi params', 'msg': repr(e)}
+        msg = {'error': f'bad rocks/fire params', 'msg': repr(e)}
         return make_response(jsonify(msg), 400)
 
     now = datetime.now(TIMEZONE)
-    if 'fired' not in data:
-        fired = None
-    else:
-        try:
-            fired = TIMEZONE.localize(parse(data['fired'], ignoretz=True))
-            if fired < now:
-                msg = {'error': f"firing time before current time", 'now': now, 'fired': fired}
-                return make_response(jsonify(msg), 400)
-            if (fired - now).total_seconds() > (60 * 5):
-                msg = {'error': f"firing time too far into future; must be within 5 minutes of current time", 'now': now, 'fired': fired}
-                return make_response(jsonify(msg), 400)
-        except Exception as e:
-            msg = {'error': f'bad firing time', 'msg': repr(e)}
-            return make_response(jsonify(msg), 400)
-
-    params = {'name': name, 'theta': theta, 'phi': phi, 'target': target}
-    if fired is None:
-        insert_query = f'''
-            insert into game.slugs (name, params)
-            values (%(name)s, (%(theta)s, %(phi)s, {SLUG_VELOCITY}))
-            returning id
-        '''
-    else:
-        insert_query = f'''
-            insert into game.slugs (name, params, fired)
-            values (%(name)s, (%(theta)s, %(phi)s, {SLUG_VELOCITY}), %(fired)s)
-            returning id
-        '''
-        params['fired'] = fired
-    select_query = '''
-        select
-            id
-            , name
-            , target
-            , fired
-            , (pos).r::double precision as pos_r
-            , (pos).theta::double precision as pos_theta
-            , (pos).phi::double precision as pos_phi
-            , (cpos).x::double precision as cpos_x
-            , (cpos).y::double precision as cpos_y
-            , (cpos).z::double precision as cpos_z
-            , t
-            , octant
-            , age
-        from api.neos
-        where regclass = 'api.slugs'::regclass and id = %(slug_id)s
-    '''
-    with get_db().cursor() as cur:
-        cur.execute(insert_query, params)
-        slug_id, = cur.fetchone()
-        cur.execute(select_query, {'slug_id': slug_id})
-        x = cur.fetchone()
-        obj = {} if x is None else {
-            'help': 'GET /railgun/help/ for more information',
-            'id': x.id,
-            'type': 'slug',
-            'name': x.name,
-            'target': x.target,
-            'fired_time': x.fired,
-            'pos': {'r': x.pos_r, 'theta': x.pos_theta, 'phi': x.pos_phi},
-            'cpos': {'x': x.cpos_x, 'y': x.cpos_y, 'z': x.cpos_z},
-            'obs_time': x.t,
-            'octant': x.octant,
-            'age': x.age.seconds,
-        }
-    return jsonify({'object': obj})
+    try:
+        fired = parse_fired(data, now)
+    except BadShot as e:
+        msg, = e.args
+        return make_response(jsonify(msg), 400)
+
+    # NOTE: solutions to fire are solved on the primary, as they are fired
+    with get_db(readonly=not fire_solutions).cursor() as cur:
+        execute(cur, 'railgun_solve', fired, rocks)
+        solutions = cur.fetchall()
+
+        objs, unfired = None, []
+        if fire_solutions and solutions:
+            # NOTE: a salvo is at most RAILGUN_RATE.amount shots; fire at the
+            #       soonest collisions and leave the rest for the next call
+            salvo, unfired = solutions[:RAILGUN_RATE.amount], solutions[RAILGUN_RATE.amount:]
+            count_shots(len(salvo))
+            objs = fire(cur, [
+                (f'@ {x.name}', x.name, x.theta, x.phi, x.fired)
+                for x in salvo
+            ])
+
+    solved = {'solutions': [{
+        'rock': {'id': x.id, 'name': x.name},
+        'theta': x.theta,
+        'phi': x.phi,
+        'fired_time': x.fired,
+        'collision_time': x.t,
+    } for x in solutions]}
+    if objs is not None:
+        solved['objects'] = objs
+        solved['unfired'] = [{'id': x.id, 'name': x.name} for x in unfired]
+    return jsonify(solved)
+
+
+@app.route('/impacts/help/', methods=['GET'])
+def impacts_help():
+    return jsonify({
+        'endpoints': {
+            '/impacts/help/': 'describes the /impacts endpoint',
+            '/impacts':       'lists the rocks that hit earth and the next rocks that will',
+        },
+        'methods': {
+            '/impacts/help/': ['GET'],
+            '/impacts':       ['GET'],
+        },
+        'inputs': {
+            '/impacts/help/': {},
+            '/impacts': ['the following are passed as URL parameters', {
+                'limit': f'(OPTIONAL) the most rocks to list, in each of impacted and upcoming (integer, [1, {IMPACTS_LIMIT}], default 10)',
+            }],
+        },
+        'outputs': {
+            '/impacts/help/': {
+                'endpoints': 'the relevant endpoints',
+                'methods':   'the HTTP verbs (GET, POST, PUT, DELETE, etc.) that the endpoints support',
+                'inputs':    'the inputs the endpoints take',
+                'outputs':   'the outputs the endpoints return',
+            },
+            '/impacts': {
+                'impacted': ['the rocks that already hit earth, most recent first', {
+                    'id':          "the rock's unique identifier",
+                    'name':        'the human readable name of the rock',
+                    'target':      "the human readable name of the rock's target",
+                    'fired':       'the time when the rock was fired',
+                    'impact_time': 'the time when the rock hit earth',
+                }],
+                'upcoming': 'the rocks that will hit earth (unless they are hit first), soonest first; as above',
+            },
+        },
+    })
+
+
+def impact_object(x):
+    return {
+        'help': 'GET /impacts/help/ for more information',
+        'id': x.id,
+        'name': x.name,
+        'target': x.target,
+        'fired': x.fired,
+        'impact_time': x.t,
+    }
+
+
+@app.route('/impacts', methods=['GET'])
+def impacts():
+    try:
+        limit = int(request.args.get('limit', 10))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= IMPACTS_LIMIT:
+        msg = {'error': f'invalid limit must be [1, {IMPACTS_LIMIT}]'}
+        return make_response(jsonify(msg), 400)
+    with get_db(readonly=True).cursor() as cur:
+        execute(cur, 'impacts_past', limit)
+        impacted = [impact_object(x) for x in cur.fetchall()]
+        execute(cur, 'impacts_next', limit)
+        upcoming = [impact_object(x) for x in cur.fetchall()]
+    return jsonify({'impacted': impacted, 'upcoming': upcoming})
 
 
 @app.route('/info', methods=['GET'])
@@ -339,6 +1733,24 @@ def info():
     return jsonify(info)
 
 
+@app.route('/info/pool', methods=['GET'])
+def info_pool():
+    return jsonify({'pool': pool.stats(), 'replicas': replicas.stats()})
+
+
+@app.route('/metrics', methods=['GET'])
+@limiter.exempt
+def metrics_():
+    triggers = []
+    try:
+        with get_db().cursor() as cur:
+            cur.execute('select trigger, calls, total_time from api.trigger_stats order by trigger')
+            triggers = cur.fetchall()
+    except ProgrammingError: # engine without api.trigger_stats
+        pass
+    return Response(metrics.render(triggers), mimetype='text/plain; version=0.0.4')
+
+
 if __name__ == '__main__':
     host = environ.get('HOST', 'localhost')
     port = environ.get('PORT', 5000)
@@ -0,0 +1,398 @@
+'''
+the API as an ASGI app on asyncpg: the telescope, railgun, info and help
+endpoints of api.py, with the same JSON
+
+    $ uvicorn --workers 4 asgi:app
+    $ gunicorn --workers 4 --worker-class uvicorn.workers.UvicornWorker asgi:app
+
+A Flask worker (wsgi.py) serves a request per thread and holds the thread
+through every database round trip; an ASGI worker serves any number of
+requests at once on its event loop, sharing a pool of at most DBPOOL_MAX
+connections.
+
+Validation, serialization, and the statements (see PREPARED) are api.py's; so
+are the rate limits, counted in the same SharedTable (and so together with any
+Flask worker), and the replicas (DBREPLICAS) the telescope reads from while
+they are fresh (see api.Replicas). Help is rendered once, by the Flask views.
+
+A /telescope/<int:octant> with ?asof= or ?format= (or under EPHEMERIS or
+TELESCOPE_TICK) is passed to the Flask app (see native_telescope), so that
+every URL keeps api.py's contract.
+
+/telescope/stream is served here too, each stream a coroutine waiting on a
+queue (rather than a thread, as in api.py, which keeps at most STREAM_MAX open
+per worker), fed by one LISTEN connection per worker (see Broadcaster).
+
+Every other endpoint (e.g., /telescope/all, /impacts, /railgun/solve,
+/metrics) is passed to the Flask app, run on a pool of FLASK_THREADS threads.
+'''
+from datetime import datetime
+from random import choice
+from json import dumps, loads
+from os import environ
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+import asyncio
+import re
+
+import asyncpg
+from limits import parse as parse_limit
+from uvicorn.middleware.wsgi import WSGIMiddleware
+
+from api import (
+    app as flask_app, DBNAME, DBHOST, DBUSER, DBPOOL_SIZE, DBPOOL_RECYCLE, EPHEMERIS, PREPARED, RAILGUN_RATE,
+    SATELLITE_NAME, STREAM_BACKLOG, STREAM_CHANNEL, STREAM_HEARTBEAT, TELESCOPE_FORMATS,
+    TELESCOPE_TICK, TIMEZONE, BadShot, CustomEncoder, Subscription, fired, name_shots, parse_salvo,
+    slug_object, take_hits, telescope_object, help, telescope_help, railgun_help, impacts_help, replicas,
+)
+
+DBPOOL_MAX = int(environ.get('DBPOOL_MAX', 16))       # most connections per worker (one query at a time each)
+FLASK_THREADS = int(environ.get('FLASK_THREADS', 16)) # threads per worker serving the other endpoints
+
+
+def typed(name):
+    '''
+    the query of a PREPARED statement with its parameter types cast inline
+    (asyncpg prepares, and caches, every statement itself, with the types the
+    server infers; e.g., it cannot for unnest($1, $2))
+    '''
+    types, query = PREPARED[name]
+    types = [t.strip() for t in types.split(',')]
+    return re.sub(r'\$(\d+)\b', lambda m: f'{m.group(0)}::{types[int(m.group(1)) - 1]}', query)
+
+STATEMENTS = {name: typed(name) for name in ('telescope', 'telescope_sweep', 'railgun_fire', 'railgun_slugs')}
+
+# NOTE: as api.py's limiter: same keys (client, endpoint), same storage
+RATELIMIT_ENABLED = flask_app.config['RATELIMIT_ENABLED']
+DEFAULT_LIMIT = parse_limit('20 per second')
+LIMITS = {'railgun': RAILGUN_RATE, 'info': parse_limit('10 per 1 second')}
+
+# NOTE: the endpoints of api.py that are not served here (each request holds a
+#       thread, as under a Flask worker)
+flask = WSGIMiddleware(flask_app, workers=FLASK_THREADS)
+
+pool = None          # created at startup (see lifespan)
+replica_pools = None # likewise, one per api.replicas.pools
+broadcaster = None   # likewise (see Broadcaster)
+
+
+class Broadcaster:
+    '''
+    per-worker fan-out of database notifications, as api.Broadcaster, on the
+    event loop: a single connection LISTENs on STREAM_CHANNEL and every
+    payload is put in every subscription (a queue of at most STREAM_BACKLOG
+    events; overflowing resets it); if the connection drops, they are sent a
+    RESET (events may have been missed)
+    '''
+    def __init__(self):
+        self.subscriptions = set()
+        self.listening = asyncio.Event()
+        self.task = asyncio.ensure_future(self.listen())
+
+    async def subscribe(self):
+        '''
+        a new subscription; returns once LISTEN is in effect (or, if the
+        listener cannot connect in time, with a RESET queued)
+        '''
+        sub = asyncio.Queue(STREAM_BACKLOG)
+        self.subscriptions.add(sub)
+        try:
+            await asyncio.wait_for(self.listening.wait(), STREAM_HEARTBEAT)
+        except asyncio.TimeoutError:
+            self.put(sub, Subscription.RESET)
+        return sub
+
+    def unsubscribe(self, sub):
+        self.subscriptions.discard(sub)
+
+    @staticmethod
+    def put(sub, event):
+        if sub.full():
+            while not sub.empty():
+                sub.get_nowait()
+            event = Subscription.RESET
+        sub.put_nowait(event)
+
+    def publish(self, event):
+        for sub in list(self.subscriptions):
+            self.put(sub, event)
+
+    async def listen(self):
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(database=DBNAME, user=DBUSER, host=DBHOST)
+                await conn.add_listener(STREAM_CHANNEL, lambda conn, pid, channel, payload: self.publish(payload))
+                self.listening.set()
+                # NOTE: a dropped connection is only noticed when it is used
+                while True:
+                    await asyncio.sleep(STREAM_HEARTBEAT)
+                    await conn.execute('select 1')
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                flask_app.logger.exception('listening on %r failed; reconnecting', STREAM_CHANNEL)
+                self.listening.clear()
+                self.publish(Subscription.RESET)
+                await asyncio.sleep(1)
+            finally:
+                if conn is not None:
+                    conn.terminate()
+
+    async def close(self):
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+
+def asyncpg_params(params):
+    'libpq connection parameters (see DBREPLICAS) as asyncpg.connect arguments'
+    names = {'dbname': 'database', 'user': 'user', 'host': 'host', 'port': 'port', 'password': 'password'}
+    return {names[k]: int(v) if k == 'port' else v for k, v in params.items() if k in names}
+
+
+def reader():
+    'the pool of a fresh replica (chosen at random), or the primary\'s'
+    fresh = replicas.fresh()
+    return replica_pools[choice(fresh)] if fresh else pool
+
+
+def row(record):
+    'an asyncpg Record with attributes, as psycopg2 rows (for telescope_object, slug_object)'
+    return SimpleNamespace(**record)
+
+
+def hit(limit, client, endpoint, times=1):
+    'counts `times` hits against `limit`; none if fewer remain (see api.take_hits)'
+    if not RATELIMIT_ENABLED or not times:
+        return True
+    return take_hits(limit, times, client, endpoint)
+
+
+def rendered(view):
+    'a handler for the (constant) response of a Flask view'
+    with flask_app.app_context():
+        body = view().get_data()
+    async def handler(client, body_):
+        return 200, body
+    return handler
+
+
+def native_telescope(scope):
+    '''
+    whether a /telescope/<int:octant> request is served here: not if it needs
+    what only api.telescope does, ?asof= or ?format= (or a format by Accept:),
+    the ephemeris (EPHEMERIS), or ticks and ETags (TELESCOPE_TICK)
+    '''
+    if EPHEMERIS or TELESCOPE_TICK or scope['query_string']:
+        return False
+    accept = b','.join(v for k, v in scope['headers'] if k == b'accept').decode('latin-1')
+    return not any(f in accept for f in TELESCOPE_FORMATS.values() if f != TELESCOPE_FORMATS['objects'])
+
+
+async def telescope(client, body, octant):
+    octant = int(octant)
+    if not 1 <= octant <= 8:
+        return 400, {'error': f'invalid octant {octant} must be [1, 8]'}
+    async with reader().acquire() as conn:
+        rows = await conn.fetch(STATEMENTS['telescope'], octant)
+    return 200, {'objects': [telescope_object(row(x)) for x in rows]}
+
+
+async def railgun(client, body):
+    try:
+        data = loads(body)
+    except ValueError:
+        data = None
+    try:
+        salvo, shots = parse_salvo(data, datetime.now(TIMEZONE))
+    except BadShot as e:
+        msg, = e.args
+        return 400, msg
+
+    # NOTE: the request counted as one shot; count the rest
+    if not hit(RAILGUN_RATE, client, 'railgun', len(shots) - 1):
+        return 429, {'error': 'rate limit exceeded', 'limit': str(RAILGUN_RATE)}
+
+    shots = name_shots(shots)
+    async with pool.acquire() as conn:
+        ids = [x['id'] for x in await conn.fetch(STATEMENTS['railgun_fire'], *map(list, zip(*shots)))]
+        slugs = [row(x) for x in await conn.fetch(STATEMENTS['railgun_slugs'], ids)]
+    # NOTE: the Flask app in this process (see flask) observes from the
+    #       ephemeris and ticks too
+    fired(slugs)
+    objs = [slug_object(x) for x in slugs]
+    if salvo:
+        return 200, {'objects': objs}
+    return 200, {'object': objs[0] if objs else {}}
+
+
+# (frame, heartbeat, content type) of each ?format= of /telescope/stream
+STREAM_FORMATS = {
+    'sse':    (lambda event: f'data: {event}\n\n', ': heartbeat\n\n', 'text/event-stream'),
+    'ndjson': (lambda event: f'{event}\n', '\n', 'application/x-ndjson'),
+}
+
+
+async def disconnected(receive):
+    'returns once the client disconnects'
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def telescope_stream(scope, receive, send):
+    'as api.telescope_stream; sends its own response, as events arrive'
+    fmt = parse_qs(scope['query_string'].decode()).get('format', ['sse'])[-1]
+    if fmt not in STREAM_FORMATS:
+        return await respond(send, 400, {'error': f"invalid format {fmt!r} must be 'sse' or 'ndjson'"})
+    frame, heartbeat, mimetype = STREAM_FORMATS[fmt]
+
+    # NOTE: subscribe before observing so no change is missed in between (so
+    #       observe the primary, which sends the notifications)
+    sub = await broadcaster.subscribe()
+    gone, event = asyncio.ensure_future(disconnected(receive)), None
+    try:
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(STATEMENTS['telescope_sweep'], list(range(1, 9)))
+        octants = {str(o): [] for o in range(1, 9)}
+        for x in rows:
+            if x['id'] is not None:
+                octants[str(x['octant'])].append(telescope_object(row(x)))
+        snapshot = {'op': 'SNAPSHOT', 'obs_time': rows[0]['obs_time'], 'octants': octants}
+
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', mimetype.encode()),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        chunk = frame(dumps(snapshot, cls=CustomEncoder))
+        while True:
+            await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+            event = event or asyncio.ensure_future(sub.get())
+            done, _ = await asyncio.wait({event, gone}, timeout=STREAM_HEARTBEAT, return_when=asyncio.FIRST_COMPLETED)
+            if gone in done:
+                return
+            if event in done:
+                chunk, event = frame(event.result()), None
+            else:
+                chunk = heartbeat
+    finally:
+        broadcaster.unsubscribe(sub)
+        for task in (gone, event):
+            if task is not None:
+                task.cancel()
+
+
+async def info(client, body):
+    return 200, {
+        'name': SATELLITE_NAME,
+        'railgun': {
+            'online': True,
+        },
+        'telescope': {
+            'online': True,
+        },
+    }
+
+
+# (method, path, endpoint, handler); endpoints named as in api.py (see LIMITS)
+ROUTES = [
+    ('GET',  r'/help/',                   'help',           rendered(help)),
+    ('GET',  r'/telescope/help/',         'telescope_help', rendered(telescope_help)),
+    ('GET',  r'/telescope/(?P<octant>\d+)', 'telescope',    telescope),
+    ('GET',  r'/telescope/stream',        'telescope_stream', telescope_stream),
+    ('GET',  r'/railgun/help/',           'railgun_help',   rendered(railgun_help)),
+    ('POST', r'/railgun',                 'railgun',        railgun),
+    ('GET',  r'/impacts/help/',           'impacts_help',   rendered(impacts_help)),
+    ('GET',  r'/info',                    'info',           info),
+]
+ROUTES = [(method, re.compile(path), endpoint, handler) for method, path, endpoint, handler in ROUTES]
+STREAMS = {'telescope_stream'} # endpoints whose handlers send their own response
+NATIVE = {'telescope': native_telescope} # endpoints served here only if native(scope); else by Flask
+
+
+async def respond(send, status, body):
+    if not isinstance(body, bytes):
+        body = dumps(body, cls=CustomEncoder).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def read_body(receive):
+    body, more = b'', True
+    while more:
+        message = await receive()
+        body += message.get('body', b'')
+        more = message.get('more_body', False)
+    return body
+
+
+async def lifespan(receive, send):
+    global pool, replica_pools, broadcaster
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            pool = await asyncpg.create_pool(
+                database=DBNAME, user=DBUSER, host=DBHOST,
+                min_size=min(DBPOOL_SIZE, DBPOOL_MAX), max_size=DBPOOL_MAX,
+                max_inactive_connection_lifetime=DBPOOL_RECYCLE,
+            )
+            # NOTE: replicas are connected on first use (min_size=0), so that
+            #       one that is down does not keep the worker from starting
+            replica_pools = [
+                await asyncpg.create_pool(
+                    **asyncpg_params(p.params),
+                    min_size=0, max_size=DBPOOL_MAX,
+                    max_inactive_connection_lifetime=DBPOOL_RECYCLE,
+                )
+                for p in replicas.pools
+            ]
+            replicas.start()
+            broadcaster = Broadcaster()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await broadcaster.close()
+            for p in replica_pools:
+                await p.close()
+            await pool.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    for method, path, endpoint, handler in ROUTES:
+        match = path.fullmatch(scope['path'])
+        if match is not None:
+            break
+    else:
+        return await flask(scope, receive, send)
+    if scope['method'] != method:
+        return await respond(send, 405, {'error': f'method {scope["method"]} not allowed; {method} only'})
+    if endpoint in NATIVE and not NATIVE[endpoint](scope):
+        return await flask(scope, receive, send)
+
+    # NOTE: rate limits (like shot names) are counted in shared memory, under
+    #       locks held for microseconds, so on the event loop
+    client = scope['client'][0] if scope.get('client') else None
+    limit = LIMITS.get(endpoint, DEFAULT_LIMIT)
+    if not hit(limit, client, endpoint):
+        return await respond(send, 429, {'error': 'rate limit exceeded', 'limit': str(limit)})
+    if endpoint in STREAMS:
+        return await handler(scope, receive, send)
+    body = await read_body(receive)
+    await respond(send, *await handler(client, body, **match.groupdict()))
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+'''
+measures API latency under concurrent load
+
+e.g., to compare per-request connections against the connection pool
+(with rate limiting disabled so that it does not dominate the results):
+
+    $ export RATELIMIT_ENABLED=false
+    $ DBPOOL_SIZE=0 gunicorn --workers 4 --bind localhost:5000 wsgi:app
+    $ ./bench.py http://localhost:5000/telescope/1 -c 16 -n 2000
+    $ DBPOOL_SIZE=4 gunicorn --workers 4 --bind localhost:5000 wsgi:app
+    $ ./bench.py http://localhost:5000/telescope/1 -c 16 -n 2000
+
+given only a server (no path), it drives a weighted --mix of telescope and
+railgun traffic instead; it can also seed a scenario of --rocks rocks and
+--slugs slugs (deleted afterwards) and --serve api.py under gunicorn with the
+settings of the deploy unit (see neocrisis_gunicorn.service; rate limiting
+off); --json writes the throughput, latency and database time (from the
+Server-Timing header) of each endpoint at each concurrency, so that runs can
+be compared between commits:
+
+    $ ./bench.py --serve --rocks 1000 --slugs 100 -c 1 4 16 --json bench.json
+    $ ./bench.py --serve --mix telescope=1 railgun=1 --json - | jq .runs
+
+--serve wsgi asgi runs the same benchmark against each app in turn (asgi.py
+serves only the telescope/<octant>, railgun, info and help endpoints):
+
+    $ ./bench.py --serve wsgi asgi --mix telescope=9 railgun=1 -c 64 256 1024
+'''
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, closing, ExitStack
+from datetime import datetime
+from itertools import chain
+from math import pi
+from os import environ
+from os.path import dirname, abspath
+from random import choices, randint, uniform
+from statistics import mean
+from subprocess import Popen, check_output, DEVNULL
+from sys import stdout, stderr
+from threading import local
+from time import perf_counter, sleep
+from urllib.parse import urlsplit
+import json
+import re
+
+from requests import Session, RequestException
+from warnings import catch_warnings, simplefilter
+with catch_warnings():
+    simplefilter('ignore')
+    from psycopg2 import connect
+
+DBNAME = environ.get('DBNAME', 'nc')
+DBHOST = environ.get('DBHOST',  None)
+DBUSER = environ.get('DBUSER', 'postgres')
+
+DBPARAMS = {'dbname': DBNAME, 'user': DBUSER}
+if DBHOST is not None:
+    DBPARAMS['host'] = DBHOST
+
+HERE = dirname(abspath(__file__))
+
+# NOTE: as in deploy/roles/neocrisis/templates/neocrisis_gunicorn.service
+#       (the environment overrides these, e.g., DBPOOL_SIZE=0)
+GUNICORN = ['--workers', '4', '--threads', '16']
+SERVERS = {
+    'wsgi': (GUNICORN, 'wsgi:app'),
+    'asgi': (['--workers', '4', '--worker-class', 'uvicorn.workers.UvicornWorker'], 'asgi:app'),
+}
+GUNICORN_ENV = {
+    'DBPOOL_SIZE': '4',
+    'DBPOOL_RECYCLE': '3600',
+    'DBPOOL_CHECK': '30',
+    'RATELIMIT_ENABLED': 'false',
+}
+
+SEED_PREFIX = 'bench ' # names of everything seeded (or fired) by the benchmark
+
+ENDPOINTS = {
+    'telescope':     lambda: ('GET', f'/telescope/{randint(1, 8)}', None),
+    'telescope-all': lambda: ('GET', '/telescope/all', None),
+    'impacts':       lambda: ('GET', '/impacts', None),
+    'railgun':       lambda: ('POST', '/railgun', {
+        'name': f'{SEED_PREFIX}shot',
+        'theta': uniform(0, 2 * pi),
+        'phi': uniform(0, pi),
+    }),
+}
+MIX = {'telescope': 8, 'telescope-all': 1, 'railgun': 1}
+
+def weight(value):
+    name, _, w = value.partition('=')
+    if name not in ENDPOINTS:
+        raise ValueError(value)
+    return name, float(w or 1)
+
+parser = ArgumentParser()
+parser.add_argument('url', nargs='?', default='http://localhost:5000')
+parser.add_argument('-c', '--concurrency', default=[8], type=int, nargs='+', help='one run per concurrency')
+parser.add_argument('-n', '--requests', default=1000, type=int, help='requests per run')
+parser.add_argument('--warmup', default=50, type=int, help='requests before each run (not measured)')
+parser.add_argument('--mix', default=None, type=weight, nargs='+',
+                    help=f'endpoint=weight, from {", ".join(ENDPOINTS)} (default: {" ".join(f"{k}={v}" for k, v in MIX.items())})')
+parser.add_argument('--rocks', default=0, type=int, help='rocks to seed')
+parser.add_argument('--slugs', default=0, type=int, help='slugs to seed')
+parser.add_argument('--keep', action='store_true', help='keep the seeded (and fired) rocks and slugs')
+parser.add_argument('--serve', default=None, nargs='*', choices=SERVERS,
+                    help='run the app (wsgi, the default, and/or asgi) under gunicorn at `url` for the benchmark')
+parser.add_argument('--json', default=None, help='write the results to this file (- for stdout)')
+
+@contextmanager
+def scenario(rocks, slugs, keep):
+    '''
+    seeds `rocks` rocks (in every direction, inbound from between one light
+    minute and one light hour) and `slugs` slugs (at c, so that some hit)
+    '''
+    with closing(connect(**DBPARAMS)) as db:
+        db.set_session(autocommit=True)
+        with db.cursor() as cur:
+            cur.execute('''
+                insert into game.rocks (name, fired, params)
+                select
+                    %(prefix)s || 'rock ' || i
+                    , now() - interval '1 second' * (random() * 60)
+                    , row(
+                        (random() - .5) / 1000
+                        , random() * 2 * pi_()
+                        , (random() - .5) / 1000
+                        , random() * pi_()
+                        , c() * (60 + random() * 3540)
+                        , -random() * c()
+                    )::game.rock_params
+                from generate_series(1, %(rocks)s) as i
+            ''', {'prefix': SEED_PREFIX, 'rocks': rocks})
+            cur.execute('''
+                insert into game.slugs (name, params)
+                select %(prefix)s || 'slug ' || i, row(random() * 2 * pi_(), random() * pi_(), c())::game.slug_params
+                from generate_series(1, %(slugs)s) as i
+            ''', {'prefix': SEED_PREFIX, 'slugs': slugs})
+        try:
+            yield
+        finally:
+            if not keep:
+                # NOTE: fragments go with their source rocks (on delete cascade)
+                with db.cursor() as cur:
+                    cur.execute('delete from game.slugs where name like %s', [f'{SEED_PREFIX}%'])
+                    cur.execute('delete from game.rocks where name like %s', [f'{SEED_PREFIX}%'])
+
+@contextmanager
+def serve(url, server, timeout=30):
+    'runs the app of `server` (see SERVERS) under gunicorn (as deployed) until the context exits'
+    netloc = urlsplit(url).netloc
+    args, app = SERVERS[server]
+    proc = Popen(['gunicorn', *args, '--bind', netloc, app],
+                 cwd=HERE, env={**GUNICORN_ENV, **environ}, stdout=DEVNULL, stderr=DEVNULL)
+    try:
+        deadline = perf_counter() + timeout
+        with Session() as session:
+            while True:
+                try:
+                    session.get(f'{url}/help/').raise_for_status()
+                    break
+                except RequestException:
+                    if proc.poll() is not None or perf_counter() > deadline:
+                        raise SystemExit(f'gunicorn did not start at {netloc}')
+                    sleep(.1)
+        yield proc
+    finally:
+        proc.terminate()
+        proc.wait()
+
+sessions = local()
+SERVER_TIMING = re.compile(r'(?:^|,)\s*db;dur=([\d.]+)')
+
+def request(target):
+    'returns the (endpoint, latency, ok, database time) of one request'
+    endpoint, method, url, body = target
+    if not hasattr(sessions, 'session'):
+        sessions.session = Session()
+    start = perf_counter()
+    try:
+        resp = sessions.session.request(method, url, json=body)
+    except RequestException:
+        return endpoint, perf_counter() - start, False, None
+    elapsed = perf_counter() - start
+    db = SERVER_TIMING.search(resp.headers.get('Server-Timing', ''))
+    return endpoint, elapsed, resp.ok, float(db.group(1)) / 1000 if db else None
+
+def percentile(xs, p):
+    return xs[min(len(xs) - 1, int(len(xs) * p / 100))]
+
+def summary(xs):
+    'mean, p50, p95, p99 (in ms) of `xs` (in secs)'
+    if not xs:
+        return None
+    xs = sorted(xs)
+    return {'mean': mean(xs) * 1000, **{f'p{p}': percentile(xs, p) * 1000 for p in (50, 95, 99)}}
+
+def targets(url, mix, n):
+    'the requests of one run: (endpoint, method, url, body)'
+    if mix is None:
+        return [(urlsplit(url).path, 'GET', url, None)] * n
+    names, weights = zip(*mix)
+    return [
+        (name, method, url + path, body)
+        for name in choices(names, weights, k=n)
+        for method, path, body in [ENDPOINTS[name]()]
+    ]
+
+def run(url, mix, concurrency, n, warmup):
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(request, targets(url, mix, warmup)))
+        batch = targets(url, mix, n)
+        start = perf_counter()
+        results = list(pool.map(request, batch))
+        elapsed = perf_counter() - start
+
+    endpoints = {}
+    for endpoint in sorted({x[0] for x in results}):
+        rs = [x for x in results if x[0] == endpoint]
+        endpoints[endpoint] = {
+            'requests': len(rs),
+            'errors': sum(not ok for _, _, ok, _ in rs),
+            'throughput': len(rs) / elapsed,
+            'latency': summary([t for _, t, _, _ in rs]),
+            'db': summary([db for _, _, _, db in rs if db is not None]),
+        }
+    return {
+        'concurrency': concurrency,
+        'requests': n,
+        'errors': sum(x['errors'] for x in endpoints.values()),
+        'elapsed': elapsed,
+        'throughput': n / elapsed,
+        'latency': summary([t for _, t, _, _ in results]),
+        'db': summary([db for _, _, _, db in results if db is not None]),
+        'endpoints': endpoints,
+    }
+
+def report(r, file):
+    print(f'server={r["server"]}, ' if r['server'] else '', end='', file=file)
+    print(f'concurrency={r["concurrency"]}, requests={r["requests"]}, errors={r["errors"]}, '
+          f'throughput={r["throughput"]:.1f} req/s', file=file)
+    print(f'{"endpoint":<20} {"req/s":>8} {"errors":>6} {"p50":>8} {"p95":>8} {"p99":>8} {"db p50":>8} {"db p99":>8} (ms)', file=file)
+    for name, x in chain(r['endpoints'].items(), [('(all)', r)]):
+        lat, db = x['latency'], x['db'] or {}
+        print(f'{name[:20]:<20} {x["throughput"]:>8.1f} {x["errors"]:>6} '
+              f'{lat["p50"]:>8.2f} {lat["p95"]:>8.2f} {lat["p99"]:>8.2f} '
+              f'{db.get("p50", float("nan")):>8.2f} {db.get("p99", float("nan")):>8.2f}', file=file)
+    print(file=file)
+
+def commit():
+    try:
+        return check_output(['git', 'describe', '--always', '--dirty'], cwd=HERE, stderr=DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    url = args.url.rstrip('/')
+    mix = args.mix
+    if mix is None and urlsplit(url).path in {'', '/'}:
+        mix = list(MIX.items())
+    if mix is not None and urlsplit(url).path not in {'', '/'}:
+        parser.error('--mix needs a server url (without a path)')
+    if args.serve is not None and urlsplit(url).path not in {'', '/'}:
+        parser.error('--serve needs a server url (without a path)')
+    servers = [None] if args.serve is None else args.serve or ['wsgi']
+    out = stderr if args.json == '-' else stdout
+
+    # NOTE: the scenario (and the cleanup of fired shots) is in the local
+    #       database, so only when seeding or serving
+    runs = []
+    with ExitStack() as stack:
+        if args.rocks or args.slugs or args.serve is not None:
+            stack.enter_context(scenario(args.rocks, args.slugs, args.keep))
+        for server in servers:
+            with ExitStack() as served:
+                if server is not None:
+                    served.enter_context(serve(url, server))
+                for concurrency in args.concurrency:
+                    runs.append({'server': server, **run(url, mix, concurrency, args.requests, args.warmup)})
+                    report(runs[-1], out)
+
+    if args.json is not None:
+        results = {
+            'commit': commit(),
+            'time': datetime.now().isoformat(),
+            'url': url,
+            'scenario': {'rocks': args.rocks, 'slugs': args.slugs},
+            'mix': dict(mix) if mix is not None else None,
+            'gunicorn': {
+                'servers': {server: SERVERS[server] for server in servers},
+                'env': {k: environ.get(k, v) for k, v in GUNICORN_ENV.items()},
+            } if args.serve is not None else None,
+            'runs': runs,
+        }
+        if args.json == '-':
+            json.dump(results, stdout, indent=2)
+            print()
+        else:
+            with open(args.json, 'w') as f:
+                json.dump(results, f, indent=2)
@@ -0,0 +1,159 @@
+'''
+in-process ephemeris: positions of every rock and slug, computed in NumPy
+
+A trajectory (`game.rock_params`/`game.slug_params`, `fired`) almost never
+changes; only the observation time does. The Ephemeris keeps every trajectory
+in arrays and evaluates `game.pos`, `game.pos2cpos` and `game.octant` for all
+objects at once, with the same visibility rules as `api.neos`.
+
+Results are computed in double precision rather than `numeric`; they agree with
+the database well within the 2-decimal rounding that `game.collide` uses.
+'''
+from collections import namedtuple
+from datetime import timedelta
+from threading import Lock
+from time import monotonic
+
+import numpy as np
+
+# NOTE: same fields as the telescope queries in api.py
+Observation = namedtuple('Observation', '''
+    id regclass name mass target fired
+    pos_r pos_theta pos_phi
+    cpos_x cpos_y cpos_z
+    t octant age
+''')
+
+# NOTE: slugs are stored as rocks with r_0 = m_theta = m_phi = 0
+LOAD_QUERY = '''
+    select
+        'api.rocks' as regclass
+        , r.id
+        , r.name
+        , r.mass
+        , r.target
+        , r.fired
+        , extract(epoch from r.fired)::double precision as t_fired
+        , (r.params).m_theta::double precision as m_theta
+        , (r.params).b_theta::double precision as b_theta
+        , (r.params).m_phi::double precision as m_phi
+        , (r.params).b_phi::double precision as b_phi
+        , (r.params).r_0::double precision as r_0
+        , (r.params).v::double precision as v
+        , extract(epoch from (h.collision).t)::double precision as t_collided
+    from game.rocks as r
+    left outer join game.hits as h on (r.id = h.rock)
+    union all
+    select
+        'api.slugs' as regclass
+        , s.id
+        , s.name
+        , 1 as mass
+        , s.target
+        , s.fired
+        , extract(epoch from s.fired)::double precision as t_fired
+        , 0 as m_theta
+        , (s.params).theta::double precision as b_theta
+        , 0 as m_phi
+        , (s.params).phi::double precision as b_phi
+        , 0 as r_0
+        , (s.params).v::double precision as v
+        , extract(epoch from (h.collision).t)::double precision as t_collided
+    from game.slugs as s
+    left outer join game.hits as h on (s.id = h.slug)
+'''
+
+# octant by sign bits: x < 0 (1), y < 0 (2), z < 0 (4); as in game.octant
+OCTANTS = np.array([1, 2, 4, 3, 5, 6, 8, 7])
+
+class Ephemeris:
+    '''
+    array-backed table of every trajectory
+
+    the table is reloaded (with one query) after `invalidate()` is called or
+    after it is `ttl` seconds old, whichever comes first
+    '''
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.lock = Lock()
+        self.stale, self.loaded = True, None
+        self.state = (), None # metadata & params, swapped as one (see compute)
+
+    def invalidate(self):
+        self.stale = True
+
+    def refresh(self, cur):
+        with self.lock:
+            if not self.stale and monotonic() - self.loaded < self.ttl:
+                return
+            self.stale, self.loaded = False, monotonic()
+            cur.execute(LOAD_QUERY)
+            rows = cur.fetchall()
+            meta = [(x.id, x.regclass, x.name, x.mass, x.target, x.fired) for x in rows]
+            params = np.array([
+                (x.t_fired, x.m_theta, x.b_theta, x.m_phi, x.b_phi, x.r_0, x.v,
+                 np.nan if x.t_collided is None else x.t_collided)
+                for x in rows
+            ], dtype=float).reshape(-1, 8).T
+            self.state = meta, params
+
+    def compute(self, cur, t, octants):
+        '''
+        positions of every object visible in `octants` at time `t` (an aware
+        datetime); returns the metadata (as of the arrays), their indices, and
+        arrays of r, theta, phi, x, y, z, octant, age and fired (epoch secs)
+        '''
+        # NOTE: read without the lock, so from one attribute: a refresh in
+        #       between two reads would pair new metadata with old params
+        self.refresh(cur)
+        meta, params = self.state
+        t_fired, m_theta, b_theta, m_phi, b_phi, r_0, v, t_collided = params
+
+        t_now = t.timestamp()
+        dt = t_now - t_fired
+        r = r_0 + v * dt
+        theta = m_theta * dt + b_theta
+        phi = m_phi * dt + b_phi
+
+        x = r * np.sin(phi) * np.cos(theta)
+        y = r * np.sin(phi) * np.sin(theta)
+        z = r * np.cos(phi)
+        octant = OCTANTS[(x < 0) + 2 * (y < 0) + 4 * (z < 0)]
+
+        with np.errstate(invalid='ignore'):
+            visible = (
+                (t_fired <= t_now)
+                & ~(t_collided <= t_now)
+                & (r >= 0)
+                & np.isin(octant, octants)
+            )
+
+        idx, = np.nonzero(visible)
+        return meta, idx, [a[idx] for a in (r, theta, phi, x, y, z, octant, dt, t_fired)]
+
+    def observe(self, cur, t, octants):
+        '''
+        observes every visible object in `octants` at time `t` (an aware
+        datetime); returns a list of Observations
+        '''
+        meta, idx, arrays = self.compute(cur, t, octants)
+        columns = zip(idx.tolist(), *(a.tolist() for a in arrays[:-1]))
+        return [
+            Observation(*meta[i], *pos_cpos, t, o, timedelta(seconds=age))
+            for i, *pos_cpos, o, age in columns
+        ]
+
+    def columns(self, cur, t, octants):
+        '''
+        observes as observe() does, as a dict of lists (the columns of
+        ?format=columns in api.py; fired and age in epoch secs)
+        '''
+        meta, idx, arrays = self.compute(cur, t, octants)
+        rows = [meta[i] for i in idx.tolist()]
+        id, regclass, name, mass, target, _ = map(list, zip(*rows)) if rows else ([],) * 6
+        r, theta, phi, x, y, z, octant, age, fired = (a.tolist() for a in arrays)
+        return {
+            'id': id, 'regclass': regclass, 'name': name, 'target': target, 'mass': mass,
+            'fired': fired, 'r': r, 'theta': theta, 'phi': phi, 'x': x, 'y': y, 'z': z,
+            'octant': octant, 'age': age,
+        }
@@ -0,0 +1,282 @@
+'''
+host-wide shared memory for the API workers: rate limit counters, a sequence,
+and a cache of serialized responses
+
+gunicorn workers are separate processes, so in-process state (the default
+`limits` storage, a `multiprocessing.Value` created after fork) is per worker;
+with 4 workers a '5 per 1 seconds' limit really allows 20. A SharedTable is a
+file mapped into every worker (MAP_SHARED): a header with a sequence, then a
+fixed number of counter slots, (key hash, count, expiry), found by hashing the
+key into one of STRIPES stripes and probing within it.
+
+Each stripe has its own lock: a threading.Lock (between threads) and an
+fcntl byte-range lock on the stripe (between processes), so workers only
+wait on each other for keys in the same stripe. A full stripe evicts its
+soonest-expiring slot.
+
+SharedStorage serves a SharedTable to `limits` (and so to flask_limiter) as
+the 'mmap' storage scheme (e.g., RATELIMIT_STORAGE_URL = 'mmap:///run/x'),
+for the fixed-window strategies (the default).
+
+A SharedCache keeps values too large for a slot (e.g., a telescope response)
+as files in a directory (preferably on a tmpfs, such as /run), computing each
+in only one process at a time.
+'''
+from fcntl import flock, lockf, LOCK_EX, LOCK_UN
+from hashlib import blake2b
+from mmap import mmap
+from os import open as os_open, close, fstat, ftruncate, getpid, listdir, makedirs, replace, stat, unlink, O_RDWR, O_CREAT
+from os.path import join
+from struct import Struct
+from threading import Lock, get_ident
+from time import time
+from urllib.parse import urlparse
+
+from limits.storage import Storage
+
+HEADER = Struct('<8sQ')  # magic, sequence
+SLOT = Struct('<Qqd')    # key hash (0: empty), count, expiry (epoch secs)
+MAGIC = b'ncshm\x00\x00\x01'
+
+class StripeLock:
+    'a threading.Lock and an fcntl lock on bytes [start, start + length)'
+    def __init__(self, fd, start, length):
+        self.fd, self.start, self.length = fd, start, length
+        self.lock = Lock()
+
+    def __enter__(self):
+        self.lock.acquire()
+        lockf(self.fd, LOCK_EX, self.length, self.start)
+
+    def __exit__(self, *_):
+        lockf(self.fd, LOCK_UN, self.length, self.start)
+        self.lock.release()
+
+class SharedTable:
+    'fixed-window counters and a sequence, in a file shared by every process'
+    STRIPES = 64
+
+    tables = {} # (pid, path) -> SharedTable; fcntl locks are per process & file
+
+    @classmethod
+    def open(cls, path, slots=4096):
+        key = getpid(), path
+        if key not in cls.tables:
+            cls.tables[key] = cls(path, slots)
+        return cls.tables[key]
+
+    def __init__(self, path, slots):
+        self.path = path
+        self.fd = os_open(path, O_RDWR | O_CREAT, 0o600)
+        lockf(self.fd, LOCK_EX, HEADER.size, 0)
+        try:
+            size = fstat(self.fd).st_size
+            if size < HEADER.size:
+                size = HEADER.size + SLOT.size * self.STRIPES * max(1, slots // self.STRIPES)
+                ftruncate(self.fd, size)
+            self.mem = mmap(self.fd, size)
+            if self.mem[:len(MAGIC)] != MAGIC:
+                self.mem[:] = bytes(size)
+                HEADER.pack_into(self.mem, 0, MAGIC, 0)
+        finally:
+            lockf(self.fd, LOCK_UN, HEADER.size, 0)
+        self.per_stripe = (size - HEADER.size) // SLOT.size // self.STRIPES
+        self.header_lock = StripeLock(self.fd, 0, HEADER.size)
+        self.stripe_locks = [
+            StripeLock(self.fd, self.offset(stripe), self.per_stripe * SLOT.size)
+            for stripe in range(self.STRIPES)
+        ]
+
+    def close(self):
+        self.mem.close()
+        close(self.fd)
+
+    def offset(self, stripe):
+        return HEADER.size + stripe * self.per_stripe * SLOT.size
+
+    def next(self):
+        'the next number of the sequence (from 1)'
+        with self.header_lock:
+            magic, seq = HEADER.unpack_from(self.mem, 0)
+            HEADER.pack_into(self.mem, 0, magic, seq + 1)
+        return seq + 1
+
+    @staticmethod
+    def hash(key):
+        return int.from_bytes(blake2b(key.encode(), digest_size=8).digest(), 'little') or 1
+
+    def find(self, h, now, create):
+        '''
+        the offset of the slot of key hash `h` (with its stripe locked); if
+        `create`, claims an empty, expired, or the soonest-expiring slot
+        '''
+        base = self.offset(h % self.STRIPES)
+        first = (h // self.STRIPES) % self.per_stripe
+        free = None
+        for i in range(self.per_stripe):
+            offset = base + (first + i) % self.per_stripe * SLOT.size
+            slot_h, count, expiry = SLOT.unpack_from(self.mem, offset)
+            if slot_h == h:
+                return offset
+            if slot_h == 0:
+                free = offset if free is None else free
+                break # never claimed: h is not further along
+            if free is None and expiry <= now:
+                free = offset
+        if not create:
+            return None
+        if free is None:
+            free = min(
+                (base + i * SLOT.size for i in range(self.per_stripe)),
+                key=lambda offset: SLOT.unpack_from(self.mem, offset)[2],
+            )
+        SLOT.pack_into(self.mem, free, h, 0, 0)
+        return free
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1, limit=None):
+        '''
+        counts `amount` hits of `key`; returns the new count, or (if it would
+        be over `limit`) the count it would have been, counting none
+        '''
+        h, now = self.hash(key), time()
+        with self.stripe_locks[h % self.STRIPES]:
+            offset = self.find(h, now, True)
+            _, count, expires = SLOT.unpack_from(self.mem, offset)
+            if expires <= now:
+                count = 0
+            if limit is not None and count + amount > limit:
+                return count + amount
+            count += amount
+            if elastic_expiry or count == amount:
+                expires = now + expiry
+            SLOT.pack_into(self.mem, offset, h, count, expires)
+        return count
+
+    def get(self, key):
+        'the count and expiry of `key` (0 and 0, if expired)'
+        h, now = self.hash(key), time()
+        with self.stripe_locks[h % self.STRIPES]:
+            offset = self.find(h, now, False)
+            if offset is None:
+                return 0, 0
+            _, count, expires = SLOT.unpack_from(self.mem, offset)
+        return (count, expires) if expires > now else (0, 0)
+
+    def clear(self, key=None):
+        'forgets `key` (or every key)'
+        if key is not None:
+            h = self.hash(key)
+            with self.stripe_locks[h % self.STRIPES]:
+                offset = self.find(h, time(), False)
+                if offset is not None:
+                    SLOT.pack_into(self.mem, offset, h, 0, 0)
+            return
+        for stripe, lock in enumerate(self.stripe_locks):
+            with lock:
+                start = self.offset(stripe)
+                self.mem[start:start + self.per_stripe * SLOT.size] = bytes(self.per_stripe * SLOT.size)
+
+class SharedCache:
+    '''
+    tagged values, one file per key, in a directory shared by every process
+
+    a file is a header line (the tag and the content type) and the value; a
+    missing (or differently tagged) value is computed under an flock on the
+    key's lock file, so that concurrent misses wait for the first rather than
+    compute it again, and is replaced atomically, so readers never see a
+    partial file; prune() removes the values no one has written lately
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.pruned = time()
+        makedirs(path, exist_ok=True)
+
+    def file(self, key):
+        return join(self.path, blake2b(key.encode(), digest_size=16).hexdigest())
+
+    @staticmethod
+    def read(file, tag):
+        'the (content type, value) in `file`, if tagged `tag`'
+        try:
+            with open(file, 'rb') as f:
+                file_tag, _, content_type = f.readline().rstrip(b'\n').partition(b' ')
+                if file_tag.decode() != tag:
+                    return None
+                return content_type.decode(), f.read()
+        except FileNotFoundError:
+            return None
+
+    def get(self, key, tag, compute):
+        '''
+        the (content type, value) of `key` as of `tag` (which has no spaces);
+        calls compute() for them if there is none
+        '''
+        file = self.file(key)
+        value = self.read(file, tag)
+        if value is not None:
+            return value
+        # NOTE: flock (not lockf) locks belong to the open file, so they also
+        #       exclude other threads of this process
+        fd = os_open(f'{file}.lock', O_RDWR | O_CREAT, 0o600)
+        try:
+            flock(fd, LOCK_EX)
+            value = self.read(file, tag)
+            if value is None:
+                value = content_type, body = compute()
+                tmp = f'{file}.{getpid()}.{get_ident()}'
+                with open(tmp, 'wb') as f:
+                    f.write(f'{tag} {content_type}\n'.encode())
+                    f.write(body)
+                replace(tmp, file)
+        finally:
+            close(fd)
+        return value
+
+    def prune(self, older_than):
+        '''
+        removes the values (and partial files, of a process that died while
+        writing) not written in the last `older_than` secs; at most once per
+        `older_than` secs in each process
+        '''
+        now = time()
+        if now - self.pruned < older_than:
+            return
+        self.pruned = now
+        # NOTE: not the lock files, which another process may hold (and one
+        #       per key is bounded by the keys)
+        for name in listdir(self.path):
+            if name.endswith('.lock'):
+                continue
+            try:
+                file = join(self.path, name)
+                if stat(file).st_mtime < now - older_than:
+                    unlink(file)
+            except FileNotFoundError:
+                pass
+
+class SharedStorage(Storage):
+    'limits storage in a SharedTable (mmap:///path/to/file)'
+    STORAGE_SCHEME = 'mmap'
+
+    def __init__(self, uri=None, **options):
+        self.table = SharedTable.open(urlparse(uri).path, **options)
+        super().__init__(uri)
+
+    def incr(self, key, expiry, elastic_expiry=False):
+        return self.table.incr(key, expiry, elastic_expiry)
+
+    def get(self, key):
+        return self.table.get(key)[0]
+
+    def get_expiry(self, key):
+        count, expires = self.table.get(key)
+        return expires if count else time()
+
+    def check(self):
+        return not self.table.mem.closed
+
+    def reset(self):
+        self.table.clear()
+
+    def clear(self, key):
+        self.table.clear(key)
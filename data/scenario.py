@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+'''
+writes a scenario of rocks and slugs as CSV, for engine/load.sql
+
+    $ ./scenario.py --rocks 10000 --slugs 1000 > scenario.csv
+    $ make -C ../engine load SCENARIO=$PWD/scenario.csv
+
+rocks are named for the people in ACKS (as by trunc.py) and come inbound from
+between one light minute and one light hour in every direction; slugs are
+fired outward at c; both were fired within the minute before the scenario is
+loaded (`fired` is relative to the time of loading, so that a scenario can be
+loaded again later); with --coarse, every angle is a whole number of radians
+(as in engine/bench/railgun.sql), so that many slugs hit (and fragment) rocks
+'''
+from argparse import ArgumentParser
+from csv import writer
+from math import pi
+from os.path import dirname, abspath, join
+from random import choice, random, randrange, seed
+from sys import stdout
+
+from trunc import truncate
+
+C = 299792458 # m/s, as public.c()
+
+HERE = dirname(abspath(__file__))
+
+parser = ArgumentParser()
+parser.add_argument('--rocks', default=1000, type=int)
+parser.add_argument('--slugs', default=100, type=int)
+parser.add_argument('--coarse', action='store_true', help='whole-radian angles, so that many slugs hit')
+parser.add_argument('--seed', default=None, type=int)
+
+def rock(coarse):
+    if coarse:
+        return 0, randrange(6), 0, randrange(3), C * (60 + random() * 3540), -random() * C
+    return (
+        (random() - .5) / 1000
+        , random() * 2 * pi
+        , (random() - .5) / 1000
+        , random() * pi
+        , C * (60 + random() * 3540)
+        , -random() * C
+    )
+
+def slug(coarse):
+    if coarse:
+        return randrange(6), randrange(3), C
+    return random() * 2 * pi, random() * pi, C
+
+def composite(params):
+    return f'({",".join(map(repr, params))})'
+
+def fired():
+    return f'{-random() * 60:.6f} seconds'
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    seed(args.seed)
+    with open(join(HERE, 'ACKS')) as f:
+        acks = [line for line in f.readlines()[13:] if line.strip()]
+
+    out = writer(stdout)
+    out.writerow(['tbl', 'name', 'target', 'mass', 'fired', 'params'])
+    for _ in range(args.rocks):
+        out.writerow(['rocks', truncate(choice(acks)), None, 4, fired(), composite(rock(args.coarse))])
+    for i in range(1, args.slugs + 1):
+        out.writerow(['slugs', f'scenario shot #{i}', None, None, fired(), composite(slug(args.coarse))])
@@ -18,16 +18,18 @@ special = {
     'Bryce "Zooko" Wilcox-O\'Hearn': "Z Wilcox-O'Hearn",
 }
 
-if __name__ == '__main__':
-    for line in stdin:
-        line = line.strip()
+def truncate(line):
+    'a short name (initials, surname, and a random number) for a line of ACKS'
+    line = line.strip()
+
+    if line in special:
+        return special[line]
 
-        if line in special:
-            print(special[line])
-            continue
+    number = "".join(choice(digits) for _ in range(randrange(2, 9)))
+    *forenames, surname = line.split()
+    initials = [f[0] for f in forenames if f[0].isalpha()]
+    return f'{"".join(initials)} {surname} {number}'.strip()
 
-        number = "".join(choice(digits) for _ in range(randrange(2, 9)))
-        *forenames, surname = line.split()
-        initials = [f[0] for f in forenames if f[0].isalpha()]
-        name = f'{"".join(initials)} {surname} {number}'.strip()
-        print(name)
+if __name__ == '__main__':
+    for line in stdin:
+        print(truncate(line))
@@ -0,0 +1,91 @@
+-- vim: set foldmethod=marker
+\echo 'NEO-Crisis <http://github.com/dutc/neocrisis>'
+\echo 'James Powell <james@dontusethiscode.com>'
+\echo 'NOTE: benchmark! Measures ephemeris kernel throughput; leaves no data behind.'
+\set VERBOSITY terse
+\set ON_ERROR_STOP true
+
+-- usage: psql -d nc -v rocks=10000 -v slugs=10 -v passes=5 < bench/kernel.sql
+--        (or `make bench-kernel BENCH_ROCKS=10000 BENCH_KERNEL_SLUGS=10`)
+\if :{?rocks}
+\else
+    \set rocks 10000
+\endif
+\if :{?slugs}
+\else
+    \set slugs 10
+\endif
+\if :{?passes}
+\else
+    \set passes 5
+\endif
+
+begin;
+set local search_path = game, public;
+set local client_min_messages = info;
+select
+    set_config('bench.rocks', :'rocks', true)
+    , set_config('bench.slugs', :'slugs', true)
+    , set_config('bench.passes', :'passes', true);
+
+-- NOTE|dutc: the kernel is measured directly; skip collision bookkeeping
+alter table rocks disable trigger user;
+alter table slugs disable trigger user;
+insert into rocks (name, fired, params)
+select
+    'bench ' || i
+    , now() - interval '1 second' * (random() * 60)
+    , row(
+        random() * .1 - .05
+        , random() * 2 * pi_()
+        , random() * .1 - .05
+        , random() * pi_()
+        , c() * (60 + random() * 3600)
+        , -random() * c()
+    )::rock_params
+from generate_series(1, current_setting('bench.rocks')::integer) as i;
+insert into slugs (name, fired, params)
+select
+    'bench ' || i
+    , now() - interval '1 second' * (random() * 60)
+    , row(random() * 2 * pi_(), random() * pi_(), c())::slug_params
+from generate_series(1, current_setting('bench.slugs')::integer) as i;
+analyze rocks;
+analyze slugs;
+
+do $$
+declare
+    passes integer := current_setting('bench.passes')::integer;
+    -- NOTE|dutc: throughput per rock, or (for collide) per rock & slug pair
+    queries text[] := array[
+        ['rocks', 'select * from api.rocks']
+        , ['rocks', 'select * from api.neos']
+        , ['rocks', 'select * from api.neos where octant = 1']
+        , ['pairs', 'select collide(r.fired, r.params, s.fired, s.params) from rocks as r, slugs as s']
+    ];
+    num_rocks bigint := (select count(*) from game.rocks);
+    num_pairs bigint := num_rocks * (select count(*) from game.slugs);
+    item text[];
+    query text;
+    num bigint;
+    start timestamp with time zone;
+    elapsed double precision;
+begin
+    foreach item slice 1 in array queries loop
+        query := item[2];
+        execute 'select count(x) from (' || query || ') as x' into num;
+        start := clock_timestamp();
+        for pass in 1..passes loop
+            execute 'select count(x) from (' || query || ') as x' into num;
+        end loop;
+        elapsed := extract(epoch from clock_timestamp() - start)::double precision / passes;
+        raise info '% %/s % ms/query % rows: %'
+            , lpad(to_char(case item[1] when 'pairs' then num_pairs else num_rocks end / elapsed, 'FM9999999990'), 10)
+            , item[1]
+            , lpad(to_char(elapsed * 1000, 'FM999990.0'), 8)
+            , lpad(num::text, 6)
+            , query;
+    end loop;
+end $$;
+
+rollback;
@@ -0,0 +1,187 @@
+-- vim: set foldmethod=marker
+\echo 'NEO-Crisis <http://github.com/dutc/neocrisis>'
+\echo 'James Powell <james@dontusethiscode.com>'
+\echo 'NOTE: benchmark! Measures the trigger & view pipeline as the game grows; leaves no data behind.'
+\set VERBOSITY terse
+\set ON_ERROR_STOP true
+
+-- usage: psql -d nc -v sizes=100,200,400,800 -v slugs=.5 -v reps=20 < bench/pipeline.sql 2>&1 | grep -v 'INFO:  trigger:'
+--        (or `make bench-pipeline BENCH_SIZES=100,200,400,800`)
+--
+--        at each size (in rocks, with `slugs` slugs per rock), times `reps`
+--        runs of every statement (and of the stages they fan out into) and
+--        prints ms per statement by size; `slope` is the exponent of the
+--        fitted curve (ms ~ rocks ^ slope): ~1 is linear, >1 super-linear
+\if :{?sizes}
+\else
+    \set sizes 100,200,400,800
+\endif
+\if :{?slugs}
+\else
+    \set slugs .5
+\endif
+\if :{?reps}
+\else
+    \set reps 20
+\endif
+
+begin;
+set local search_path = game, public;
+set local client_min_messages = info;
+select
+    set_config('bench.sizes', :'sizes', true)
+    , set_config('bench.slugs', :'slugs', true)
+    , set_config('bench.reps', :'reps', true);
+
+-- NOTE|dutc: coarse angles (as in bench/railgun.sql), so that many slugs hit
+--            (and fragment) rocks
+create function pg_temp.rock_params() -- {{{
+returns rock_params as $func$
+    select row(
+        0
+        , floor(random() * 6)
+        , 0
+        , floor(random() * 3)
+        , c() * (60 + random() * 3600)
+        , -random() * c()
+    )::rock_params
+$func$ volatile language sql; -- }}}
+
+create function pg_temp.slug_params() -- {{{
+returns slug_params as $func$
+    select row(floor(random() * 6), floor(random() * 3), c())::slug_params
+$func$ volatile language sql; -- }}}
+
+create temporary table bench_sizes ( -- {{{
+    size integer primary key
+    , rocks bigint
+    , slugs bigint
+    , collisions bigint
+    , hits bigint
+) on commit drop; -- }}}
+
+create temporary table bench_results ( -- {{{
+    stage text
+    , size integer
+    , elapsed double precision
+) on commit drop; -- }}}
+
+do $$
+declare
+    sizes integer[] := string_to_array(current_setting('bench.sizes'), ',')::integer[];
+    slugs_per_rock double precision := current_setting('bench.slugs')::double precision;
+    reps integer := current_setting('bench.reps')::integer;
+    size integer;
+    rocks_grown integer := 0;
+    slugs_grown integer := 0;
+    counts record;
+    ids integer[];
+    id_ integer;
+    obj record;
+    num bigint;
+    start timestamp with time zone;
+begin
+    foreach size in array sizes loop
+        -- {{{ grow the fixture (untimed)
+        insert into rocks (name, fired, params)
+        select 'bench ' || i, now() - interval '1 second' * (random() * 60), pg_temp.rock_params()
+        from generate_series(rocks_grown + 1, size) as i;
+        insert into slugs (name, fired, params)
+        select 'bench ' || i, now() - interval '1 second' * (random() * 60), pg_temp.slug_params()
+        from generate_series(slugs_grown + 1, (size * slugs_per_rock)::integer) as i;
+        rocks_grown := greatest(rocks_grown, size);
+        slugs_grown := greatest(slugs_grown, (size * slugs_per_rock)::integer);
+        analyze rocks;
+        analyze slugs;
+        analyze collisions;
+        analyze hits;
+        insert into bench_sizes
+        select
+            size
+            , (select count(*) from rocks)
+            , (select count(*) from slugs)
+            , (select count(*) from collisions)
+            , (select count(*) from hits)
+        returning * into counts;
+        raise info 'size %: % rocks, % slugs, % collisions, % hits'
+            , size, counts.rocks, counts.slugs, counts.collisions, counts.hits;
+        -- }}}
+
+        -- {{{ stages (read-only)
+        for i in 1..reps loop
+            select s.id, s.fired, s.params into obj from slugs as s order by random() limit 1;
+            start := clock_timestamp();
+            select count(*) into num from game.collisions(obj.id, obj.fired, obj.params);
+            insert into bench_results values ('game.collisions(slug)', size, extract(epoch from clock_timestamp() - start));
+
+            select r.id, r.fired, r.params into obj from rocks as r order by random() limit 1;
+            start := clock_timestamp();
+            select count(*) into num from game.collisions(obj.id, obj.fired, obj.params);
+            insert into bench_results values ('game.collisions(rock)', size, extract(epoch from clock_timestamp() - start));
+
+            start := clock_timestamp();
+            execute 'select count(*) from api.neos where octant = $1' into num using 1 + floor(random() * 8)::integer;
+            insert into bench_results values ('api.neos where octant = N', size, extract(epoch from clock_timestamp() - start));
+        end loop;
+
+        -- NOTE|dutc: game.hits() is the full resolution that resolve_hits()
+        --            avoids; a few runs are enough
+        for i in 1..greatest(reps / 10, 1) loop
+            start := clock_timestamp();
+            select count(*) into num from game.hits();
+            insert into bench_results values ('game.hits()', size, extract(epoch from clock_timestamp() - start));
+        end loop;
+        -- }}}
+
+        -- {{{ statements (through every trigger)
+        ids := '{}';
+        for i in 1..reps loop
+            start := clock_timestamp();
+            insert into slugs (name, params) values ('bench slug ' || i, pg_temp.slug_params())
+            returning id into id_;
+            insert into bench_results values ('insert into slugs', size, extract(epoch from clock_timestamp() - start));
+            ids := ids || id_;
+        end loop;
+        foreach id_ in array ids loop
+            start := clock_timestamp();
+            delete from slugs where id = id_;
+            insert into bench_results values ('delete from slugs', size, extract(epoch from clock_timestamp() - start));
+        end loop;
+
+        ids := '{}';
+        for i in 1..reps loop
+            start := clock_timestamp();
+            insert into rocks (name, params) values ('bench rock ' || i, pg_temp.rock_params())
+            returning id into id_;
+            insert into bench_results values ('insert into rocks', size, extract(epoch from clock_timestamp() - start));
+            ids := ids || id_;
+        end loop;
+        foreach id_ in array ids loop
+            start := clock_timestamp();
+            update rocks set params = pg_temp.rock_params() where id = id_;
+            insert into bench_results values ('update rocks', size, extract(epoch from clock_timestamp() - start));
+        end loop;
+        delete from rocks where id = any(ids);
+        -- }}}
+    end loop;
+end $$;
+
+\echo
+\echo 'ms per statement (mean) by size; slope: fitted exponent of ms ~ rocks ^ slope'
+select
+    stage
+    , string_agg(
+        format('%s: %s', size, to_char(ms, 'FM999990.00'))
+        , '  ' order by size
+    ) as "size: ms"
+    , round(regr_slope(ln(ms), ln(rocks))::numeric, 2) as slope
+from (
+    select r.stage, r.size, s.rocks, avg(r.elapsed) * 1000 as ms
+    from bench_results as r
+    inner join bench_sizes as s using (size)
+    group by r.stage, r.size, s.rocks
+) as x
+group by stage
+order by slope desc nulls last;
+
+rollback;
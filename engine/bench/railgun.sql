@@ -0,0 +1,65 @@
+-- vim: set foldmethod=marker
+\echo 'NEO-Crisis <http://github.com/dutc/neocrisis>'
+\echo 'James Powell <james@dontusethiscode.com>'
+\echo 'NOTE: benchmark! Measures railgun (slug insert) latency as the game grows; leaves no data behind.'
+\set VERBOSITY terse
+\set ON_ERROR_STOP true
+
+-- usage: psql -d nc -v slugs=300 < bench/railgun.sql 2>&1 | grep -v 'INFO:  trigger:'
+--        (or `make bench-railgun BENCH_SLUGS=300`)
+\if :{?rocks}
+\else
+    \set rocks 200
+\endif
+\if :{?slugs}
+\else
+    \set slugs 300
+\endif
+
+begin;
+set local search_path = game, public;
+set local client_min_messages = info;
+select set_config('bench.rocks', :'rocks', true), set_config('bench.slugs', :'slugs', true);
+
+-- NOTE|dutc: coarse angles, so that many slugs hit (and fragment) rocks
+insert into rocks (name, fired, params)
+select
+    'bench ' || i
+    , now() - interval '1 second' * (random() * 60)
+    , row(
+        0
+        , floor(random() * 6)
+        , 0
+        , floor(random() * 3)
+        , c() * (60 + random() * 3600)
+        , -random() * c()
+    )::rock_params
+from generate_series(1, current_setting('bench.rocks')::integer) as i;
+
+do $$
+declare
+    slugs integer := current_setting('bench.slugs')::integer;
+    start timestamp with time zone;
+    elapsed double precision[];
+begin
+    for i in 1..slugs loop
+        start := clock_timestamp();
+        insert into slugs (name, params)
+        values ('bench ' || i, row(floor(random() * 6), floor(random() * 3), c()));
+        elapsed := elapsed || extract(epoch from clock_timestamp() - start)::double precision;
+    end loop;
+
+    for i in 0..9 loop
+        raise info 'slugs % - %: % ms/insert'
+            , lpad((i * slugs / 10 + 1)::text, 5)
+            , lpad(((i + 1) * slugs / 10)::text, 5)
+            , lpad(to_char((
+                select avg(x) * 1000 from unnest(elapsed[i * slugs / 10 + 1:(i + 1) * slugs / 10]) as x
+              ), 'FM999990.0'), 8);
+    end loop;
+    raise info '% rocks, % slugs, % collisions, % hits'
+        , (select count(*) from rocks), (select count(*) from slugs)
+        , (select count(*) from collisions), (select count(*) from hits);
+end $$;
+
+rollback;
@@ -4,7 +4,13 @@ curdir="$(dirname "$(readlink -f "$(which $0)")")"
 
 export PYTHONIOENCODING='utf-8'
 
+# high-churn tables that are derived from the others (and recomputed by their
+# triggers) get no history; override with, e.g., BITEMPORAL_EXCLUDE=''
+exclude=(${=BITEMPORAL_EXCLUDE-game.collisions game.octant_spans game.impacts})
+
 jinja2 --format=yaml "$curdir/bitemporal.sql.template" <(
+echo 'exclude:'
+for table in $exclude; do echo " - $table"; done
 echo 'tables:'
 (psql -q -d nc -t -A -F'.' <<EOF
     select table_schema, table_name
@@ -12,6 +12,17 @@ begin
         , 'repeated rock';
     assert array_length(array(select distinct slug from hits), 1) = num
         , 'repeated slug';
+    assert not exists (
+        (select rock, t from impacts
+            except
+        select r.id, m.t from rocks as r, miss(r.fired, r.params) as m
+        where m.miss is null and r.id not in (select rock from hits))
+            union all
+        (select r.id, m.t from rocks as r, miss(r.fired, r.params) as m
+        where m.miss is null and r.id not in (select rock from hits)
+            except
+        select rock, t from impacts)
+    ), 'stale impacts';
 end;
 $func$ language plpgsql; -- }}}
 
@@ -141,5 +152,92 @@ begin
     assert (array(select slug from api.hits where rock = 'luna'))[1]
         = '800 @ luna (hit)', 'wrong hit for luna';
 
+end $$;
+
+-- NOTE|dutc: game.load must leave the same game as inserting the rows of its
+--            scenario one by one; the scenario is the game the checks above
+--            leave (its rocks & slugs, not the fragments), loaded both ways
+--            into emptied tables, all rolled back
+begin;
+create temporary table load_scenario ( -- {{{
+    n serial
+    , tbl text not null
+    , name text not null
+    , target text
+    , mass integer
+    , fired interval
+    , params text not null
+) on commit drop; -- }}}
+
+create temporary table load_results ( -- {{{
+    how text
+    , tbl text
+    , object text
+) on commit drop; -- }}}
+
+create function pg_temp.load_snapshot(how text) -- {{{
+returns void as $func$
+begin
+    -- NOTE|dutc: by name, as the ids differ between loads
+    insert into pg_temp.load_results (how, tbl, object)
+    select how, 'rocks', row(r.name, r.mass, r.target, r.fired, r.params, r.source_name, s.name)::text
+    from game.rocks as r
+    left outer join game.rocks as s on (s.id = r.source_rock)
+        union all
+    select how, 'hits', row(r.name, s.name, h.collision)::text
+    from game.hits as h
+    inner join game.rocks as r on (r.id = h.rock)
+    inner join game.slugs as s on (s.id = h.slug)
+        union all
+    select how, 'impacts', row(r.name, i.t)::text
+    from game.impacts as i
+    inner join game.rocks as r on (r.id = i.rock);
+end;
+$func$ language plpgsql; -- }}}
+
+do $$
+declare
+    t timestamp with time zone := now();
+    x record;
+begin
+    raise info 'check load (as row by row inserts)';
+    insert into pg_temp.load_scenario (tbl, name, target, mass, fired, params)
+    select 'rocks', name, target, mass, fired - t, params::text
+    from game.rocks where source_rock is null
+        union all
+    select 'slugs', name, target, null, fired - t, params::text
+    from game.slugs;
+    assert exists (select from game.hits), 'no hits to load';
+    assert exists (select from game.rocks where source_rock is not null), 'no fragments to load';
+
+    delete from game.slugs;
+    delete from game.rocks;
+    for x in select * from pg_temp.load_scenario order by fired, n loop
+        if x.tbl = 'rocks' then
+            insert into game.rocks (name, target, mass, fired, params)
+            values (x.name, x.target, coalesce(x.mass, 4), t + coalesce(x.fired, '0'), x.params::game.rock_params);
+        else
+            insert into game.slugs (name, target, fired, params)
+            values (x.name, x.target, t + coalesce(x.fired, '0'), x.params::game.slug_params);
+        end if;
+    end loop;
+    perform pg_temp.load_snapshot('inserts');
+
+    delete from game.slugs;
+    delete from game.rocks;
+    perform game.load('pg_temp.load_scenario', t);
+    perform pg_temp.load_snapshot('load');
+
+    assert not exists (
+        (select tbl, object from pg_temp.load_results where how = 'inserts'
+            except all
+        select tbl, object from pg_temp.load_results where how = 'load')
+            union all
+        (select tbl, object from pg_temp.load_results where how = 'load'
+            except all
+        select tbl, object from pg_temp.load_results where how = 'inserts')
+    ), 'load differs from inserts';
+
     raise info 'all checks passed';
 end $$;
+rollback;
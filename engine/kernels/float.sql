@@ -0,0 +1,186 @@
+-- vim: set foldmethod=marker
+\echo 'NEO-Crisis <http://github.com/dutc/neocrisis>'
+\echo 'James Powell <james@dontusethiscode.com>'
+\echo 'NOTE: float kernel! Included by model.sql (`psql -v kernel=float`).'
+\set VERBOSITY terse
+\set ON_ERROR_STOP true
+
+-- NOTE|dutc: the composite types hold double precision (see model.sql
+--            types); pos, pos2cpos, octant, and normalize are `language sql`
+--            so that they inline into api.rocks and api.slugs; agrees with
+--            the numeric kernel within the 2-decimal rounding used by collide
+
+do language plpgsql $$ declare
+    exc_message text;
+    exc_context text;
+    exc_detail text;
+begin
+
+-- {{{ float kernel
+raise info 'populating float kernel';
+do $funcs$ begin
+    set search_path = game, public;
+
+    assert current_setting('neocrisis.kernel', true) = 'float'
+        , 'float kernel needs float types (psql -v kernel=float)';
+
+    create or replace function round(v pos, s int) -- {{{
+    returns pos as $func$
+        -- NOTE|dutc: round(double precision) rounds half to even
+        select row(
+            round((v).r * 10 ^ s) / 10 ^ s
+            , round((v).theta * 10 ^ s) / 10 ^ s
+            , round((v).phi * 10 ^ s) / 10 ^ s
+        )::game.pos
+    $func$ immutable language sql; -- }}}
+
+    create or replace function round(v rock_params, s int) -- {{{
+    returns rock_params as $func$
+        select row(
+            round((v).m_theta * 10 ^ s) / 10 ^ s
+            , round((v).b_theta * 10 ^ s) / 10 ^ s
+            , round((v).m_phi * 10 ^ s) / 10 ^ s
+            , round((v).b_phi * 10 ^ s) / 10 ^ s
+            , round((v).r_0 * 10 ^ s) / 10 ^ s
+            , round((v).v * 10 ^ s) / 10 ^ s
+        )::game.rock_params
+    $func$ immutable language sql; -- }}}
+
+    create or replace function normalize(v pos) -- {{{
+    returns pos as $func$
+        -- NOTE|dutc: mod(numeric) truncates toward zero; so does this
+        select row(
+            (v).r
+            , (v).theta - trunc((v).theta / (2 * pi())) * (2 * pi())
+            , (v).phi - trunc((v).phi / pi()) * pi()
+        )::game.pos
+    $func$ immutable language sql; -- }}}
+
+    create or replace function pos2cpos(v pos) -- {{{
+    returns cpos as $func$
+        select row(
+            (v).r * sin((v).phi) * cos((v).theta)
+            , (v).r * sin((v).phi) * sin((v).theta)
+            , (v).r * cos((v).phi)
+        )::game.cpos
+    $func$ immutable language sql; -- }}}
+
+    create or replace function octant(v pos) -- {{{
+    returns integer as $func$
+        -- NOTE|dutc: index by sign bits: x < 0 (1), y < 0 (2), z < 0 (4)
+        select (array[1, 2, 4, 3, 5, 6, 8, 7])[
+            1
+            + ((v).r * sin((v).phi) * cos((v).theta) < 0)::integer
+            + ((v).r * sin((v).phi) * sin((v).theta) < 0)::integer * 2
+            + ((v).r * cos((v).phi) < 0)::integer * 4
+        ]
+    $func$ immutable language sql; -- }}}
+
+    create or replace function elapsed( -- {{{
+        fired timestamp with time zone
+        , t_now timestamp with time zone
+        , r_0 double precision
+        , v double precision
+        , delay boolean
+        )
+    returns double precision as $func$
+        -- NOTE|dutc: with delay, observe where the light we see left from
+        select extract(epoch from t_now - fired)::double precision
+            - case when delay is true
+              then (r_0 + v * extract(epoch from t_now - fired)::double precision) / c()
+              else 0
+              end
+    $func$ immutable language sql; -- }}}
+
+    create or replace function pos( -- {{{
+        fired timestamp with time zone
+        , params rock_params
+        , t_now timestamp with time zone
+        , delay boolean = false
+        )
+    returns pos as $func$
+        select row(
+            (params).r_0 + (params).v
+                * game.elapsed(fired, t_now, (params).r_0, (params).v, delay)
+            , (params).m_theta
+                * game.elapsed(fired, t_now, (params).r_0, (params).v, delay)
+                + (params).b_theta
+            , (params).m_phi
+                * game.elapsed(fired, t_now, (params).r_0, (params).v, delay)
+                + (params).b_phi
+        )::game.pos
+    $func$ immutable language sql; -- }}}
+
+    create or replace function pos( -- {{{
+        fired timestamp with time zone
+        , params slug_params
+        , t_now timestamp with time zone
+        , delay boolean = false
+        )
+    returns pos as $func$
+        select row(
+            (params).v * game.elapsed(fired, t_now, 0, (params).v, delay)
+            , (params).theta
+            , (params).phi
+        )::game.pos
+    $func$ immutable language sql; -- }}}
+
+    create or replace function collide( -- {{{
+        rock_fired timestamp with time zone
+        , rock       rock_params
+        , slug_fired timestamp with time zone
+        , slug       slug_params
+        )
+    returns collision as $func$
+    declare
+        dt double precision;
+        rel_v double precision;
+        rock_pos game.pos;
+        slug_pos game.pos;
+        t timestamp with time zone;
+        m game.mtype[];
+    begin
+        -- NOTE|dutc: solve r_rock(t) = r_slug(t) relative to rock_fired
+        --            (not the epoch) to keep double precision
+        dt := extract(epoch from slug_fired - rock_fired);
+        rel_v := (slug).v - (rock).v;
+        if rel_v <> 0 then
+            t := rock_fired + interval '1 second' *
+                 (((rock).r_0 + (slug).v * dt) / rel_v);
+            if t >= rock_fired and t >= slug_fired then
+                rock_pos := game.round(game.normalize(game.pos(rock_fired, rock, t)), 2);
+                slug_pos := game.round(game.normalize(game.pos(slug_fired, slug, t)), 2);
+
+                if (rock_pos).theta <> (slug_pos).theta then
+                    m := m || 'theta'::game.mtype;
+                end if;
+                if (rock_pos).phi <> (slug_pos).phi then
+                    m := m || 'phi'::game.mtype;
+                end if;
+            else
+                m := m || 'r'::game.mtype;
+            end if;
+        else
+            m := m || 'r'::game.mtype;
+        end if;
+        return (
+            t
+            , slug_pos
+            , (
+                (rock_pos).r - (slug_pos).r
+                , (rock_pos).theta - (slug_pos).theta
+                , (rock_pos).phi - (slug_pos).phi
+            )::game.pos
+            , m
+        );
+    end;
+    $func$ immutable language plpgsql; -- }}}
+
+end $funcs$; -- }}}
+
+exception when others then
+	get stacked diagnostics exc_message = message_text;
+    get stacked diagnostics exc_context = pg_exception_context;
+    get stacked diagnostics exc_detail = pg_exception_detail;
+    raise exception E'\n------\n%\n%\n------\n\nCONTEXT:\n%\n', exc_message, exc_detail, exc_context;
+end $$;
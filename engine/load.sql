@@ -0,0 +1,35 @@
+-- vim: set foldmethod=marker
+\echo 'NEO-Crisis <http://github.com/dutc/neocrisis>'
+\echo 'James Powell <james@dontusethiscode.com>'
+\set VERBOSITY terse
+\set ON_ERROR_STOP true
+
+-- usage: psql -d nc -v scenario=/path/to/scenario.csv < load.sql
+--        (or `make load SCENARIO=/path/to/scenario.csv`)
+--
+--        loads a scenario, as written by data/scenario.py, with game.load
+\if :{?scenario}
+\else
+    \echo 'NOTE: set the scenario (-v scenario=/path/to/scenario.csv)'
+    \quit
+\endif
+
+begin;
+create temporary table scenario ( -- {{{
+    tbl text not null check (tbl in ('rocks', 'slugs'))
+    , name text not null
+    , target text
+    , mass integer
+    , fired interval
+    , params text not null
+) on commit drop; -- }}}
+
+\copy scenario from :'scenario' with (format csv, header)
+select game.load('scenario');
+
+select
+    (select count(*) from game.rocks) as rocks
+    , (select count(*) from game.slugs) as slugs
+    , (select count(*) from game.collisions) as collisions
+    , (select count(*) from game.hits) as hits;
+commit;
@@ -4,6 +4,17 @@
 \set VERBOSITY terse
 \set ON_ERROR_STOP true
 
+-- NOTE|dutc: `psql -v kernel=float` builds the double precision kernel
+--            (kernels/float.sql) instead of the numeric one
+\if :{?kernel}
+\else
+    \set kernel numeric
+\endif
+select
+    set_config('neocrisis.kernel', :'kernel', false) as kernel
+    , :'kernel' = 'float' as float_kernel
+\gset
+
 do language plpgsql $$ declare
     exc_message text;
     exc_context text;
@@ -14,6 +25,11 @@ begin
 raise info 'initial setup';
 do $setup$ begin
 create extension if not exists intarray;
+create extension if not exists btree_gist;
+
+raise info 'counting function calls'; -- {{{
+execute format('alter database %I set track_functions = %L', current_database(), 'pl');
+-- }}}
 
 raise info 'dropping schemas'; -- {{{
 drop schema if exists game cascade;
@@ -65,6 +81,7 @@ do $types$ begin
     drop type if exists pos cascade;
     drop type if exists mtype cascade;
     drop type if exists collision cascade;
+    drop type if exists hit cascade;
 
     create type rock_params as ( -- {{{
         m_theta   numeric
@@ -102,6 +119,34 @@ do $types$ begin
         , miss mtype[]
     ); -- }}}
 
+    create type hit as ( -- {{{
+        rock integer
+        , slug integer
+        , collision collision
+    ); -- }}}
+
+    if current_setting('neocrisis.kernel') = 'float' then -- {{{
+        alter type rock_params
+            alter attribute m_theta type double precision
+            , alter attribute b_theta type double precision
+            , alter attribute m_phi type double precision
+            , alter attribute b_phi type double precision
+            , alter attribute r_0 type double precision
+            , alter attribute v type double precision;
+        alter type slug_params
+            alter attribute theta type double precision
+            , alter attribute phi type double precision
+            , alter attribute v type double precision;
+        alter type pos
+            alter attribute r type double precision
+            , alter attribute theta type double precision
+            , alter attribute phi type double precision;
+        alter type cpos
+            alter attribute x type double precision
+            , alter attribute y type double precision
+            , alter attribute z type double precision;
+    end if; -- }}}
+
 end $types$; -- }}}
 
 -- {{{ built-in functions
@@ -148,9 +193,20 @@ do $funcs$ begin
     drop function if exists octant cascade;
     drop function if exists pos cascade;
     drop function if exists collide cascade;
+    drop function if exists intercept cascade;
+    drop function if exists angle_buckets cascade;
+    drop function if exists reach cascade;
+    drop function if exists theta_buckets cascade;
+    drop function if exists phi_buckets cascade;
+    drop function if exists candidate_rocks cascade;
+    drop function if exists candidate_slugs cascade;
     drop function if exists collisions cascade;
     drop function if exists hits cascade;
+    drop function if exists resolve_hits cascade;
     drop function if exists predicted_hits cascade;
+    drop function if exists notify cascade;
+    drop function if exists octant_spans cascade;
+    drop function if exists refresh_octant_spans cascade;
 
     drop type if exists uniq_hits_t cascade;
     drop function if exists uniq_hits_sfunc cascade;
@@ -313,6 +369,28 @@ do $funcs$ begin
     end;
     $func$ immutable language plpgsql; -- }}}
 
+    create or replace function intercept( -- {{{
+        rock_fired timestamp with time zone
+        , rock       rock_params
+        , slug_fired timestamp with time zone
+        , v          numeric
+        )
+    returns slug_params as $func$
+    declare
+        c game.collision;
+        rock_pos game.pos;
+    begin
+        -- NOTE|dutc: the time of collision doesn't depend on the slug's
+        --            angles; aim at wherever collide puts the rock then
+        c := game.collide(rock_fired, rock, slug_fired, (0, 0, v)::game.slug_params);
+        if (c).t is null or 'r' = any((c).miss) then
+            return null;
+        end if;
+        rock_pos := game.normalize(game.pos(rock_fired, rock, (c).t));
+        return ((rock_pos).theta, (rock_pos).phi, v)::game.slug_params;
+    end;
+    $func$ immutable language plpgsql; -- }}}
+
     create or replace function miss( -- {{{
         fired  timestamp with time zone
         , rock rock_params
@@ -337,6 +415,175 @@ do $funcs$ begin
     end;
     $func$ immutable language plpgsql; -- }}}
 
+    create or replace function angle_buckets( -- {{{
+        lo double precision
+        , hi double precision
+        , period double precision
+        , n integer
+        )
+    returns integer[] as $func$
+    begin
+        -- NOTE|dutc: bucket i holds angles in [i, i + 1) × period / n,
+        --            modulo period; [lo, hi] spans every bucket it touches
+        if lo > hi then
+            return '{}';
+        end if;
+        -- NOTE|dutc: past 1e12, double precision can't tell buckets apart
+        if hi - lo >= period or greatest(abs(lo), abs(hi)) > 1e12 then
+            return array(select generate_series(0, n - 1));
+        end if;
+        hi := hi - floor(lo / period) * period;
+        lo := lo - floor(lo / period) * period;
+        return array(
+            select distinct mod(i, n)
+            from generate_series(
+                floor(lo / period * n)::integer
+                , floor(hi / period * n)::integer
+            ) as i
+        );
+    end;
+    $func$ immutable language plpgsql; -- }}}
+
+    create or replace function reach( -- {{{
+        params rock_params
+        , out e0 double precision
+        , out e1 double precision
+        ) as $func$
+    declare
+        r_0 double precision := (params).r_0;
+        v double precision := (params).v;
+    begin
+        -- NOTE|dutc: elapsed seconds (since fired) during which the rock is
+        --            at r >= 0; a slug fired with v >= 0 can only meet it then
+        if r_0 >= 0 and v < 0 then
+            e0 := 0;
+            e1 := r_0 / -v;
+        elsif r_0 >= 0 then
+            e0 := 0;
+            e1 := 'infinity';
+        elsif v > 0 then
+            e0 := -r_0 / v;
+            e1 := 'infinity';
+        end if;
+    end;
+    $func$ immutable language plpgsql; -- }}}
+
+    create or replace function theta_buckets(params rock_params) -- {{{
+    returns integer[] as $func$
+    declare
+        b double precision := (params).b_theta;
+        m double precision := (params).m_theta;
+        e0 double precision;
+        e1 double precision;
+    begin
+        select * into e0, e1 from game.reach(params);
+        if e0 is null then
+            return '{}';
+        elsif m = 0 then
+            return game.angle_buckets(b, b, 2 * pi(), 64);
+        end if;
+        return game.angle_buckets(
+            least(b + m * e0, b + m * e1)
+            , greatest(b + m * e0, b + m * e1)
+            , 2 * pi()
+            , 64
+        );
+    end;
+    $func$ immutable language plpgsql; -- }}}
+
+    create or replace function phi_buckets(params rock_params) -- {{{
+    returns integer[] as $func$
+    declare
+        b double precision := (params).b_phi;
+        m double precision := (params).m_phi;
+        e0 double precision;
+        e1 double precision;
+    begin
+        select * into e0, e1 from game.reach(params);
+        if e0 is null then
+            return '{}';
+        elsif m = 0 then
+            return game.angle_buckets(b, b, pi(), 32);
+        end if;
+        return game.angle_buckets(
+            least(b + m * e0, b + m * e1)
+            , greatest(b + m * e0, b + m * e1)
+            , pi()
+            , 32
+        );
+    end;
+    $func$ immutable language plpgsql; -- }}}
+
+    create or replace function theta_buckets(params slug_params) -- {{{
+    returns integer[] as $func$
+    begin
+        -- NOTE|dutc: collide compares angles rounded to 2 decimals; pad
+        return game.angle_buckets(
+            (params).theta::double precision - .02
+            , (params).theta::double precision + .02
+            , 2 * pi()
+            , 64
+        );
+    end;
+    $func$ immutable language plpgsql; -- }}}
+
+    create or replace function phi_buckets(params slug_params) -- {{{
+    returns integer[] as $func$
+    begin
+        return game.angle_buckets(
+            (params).phi::double precision - .02
+            , (params).phi::double precision + .02
+            , pi()
+            , 32
+        );
+    end;
+    $func$ immutable language plpgsql; -- }}}
+
+    create or replace function candidate_rocks(slug slug_params) -- {{{
+    returns setof integer as $func$
+    declare
+        -- NOTE|dutc: once per call; in a generic plan, the buckets of a
+        --            parameter would be computed again for every row
+        slug_theta integer[] := game.theta_buckets(slug);
+        slug_phi integer[] := game.phi_buckets(slug);
+    begin
+        -- NOTE|dutc: slugs fired inward meet rocks at r < 0; test them all
+        if (slug).v < 0 then
+            return query select r.id from game.rocks as r;
+            return;
+        end if;
+        -- NOTE|dutc: intarray's &&(int[], int[]) is an exact match and wins
+        --            over the builtin &&(anyarray, anyarray); its operator is
+        --            not in the default GIN opclass, so spell out the builtin
+        --            or the bucket indexes are never used
+        return query
+        select r.id
+        from game.rocks as r
+        where game.theta_buckets(r.params) operator(pg_catalog.&&) slug_theta
+            and game.phi_buckets(r.params) operator(pg_catalog.&&) slug_phi;
+    end;
+    $func$ stable language plpgsql; -- }}}
+
+    create or replace function candidate_slugs(rock rock_params) -- {{{
+    returns setof integer as $func$
+    declare
+        -- NOTE|dutc: as in candidate_rocks (buckets and operator)
+        rock_theta integer[] := game.theta_buckets(rock);
+        rock_phi integer[] := game.phi_buckets(rock);
+    begin
+        return query
+        select s.id
+        from game.slugs as s
+        where game.theta_buckets(s.params) operator(pg_catalog.&&) rock_theta
+            and game.phi_buckets(s.params) operator(pg_catalog.&&) rock_phi
+            and (s.params).v >= 0
+        union all
+        select s.id
+        from game.slugs as s
+        where (s.params).v < 0;
+    end;
+    $func$ stable language plpgsql; -- }}}
+
     create or replace function collisions( -- {{{
         slug_id integer
         , slug_fired timestamp with time zone
@@ -353,7 +600,8 @@ do $funcs$ begin
             r.id
             , slug_id
             , game.collide(r.fired, r.params, slug_fired, slug_params)
-        from game.rocks as r;
+        from game.rocks as r
+        where r.id in (select * from game.candidate_rocks(slug_params));
     end;
     $func$ stable language plpgsql; -- }}}
 
@@ -373,10 +621,245 @@ do $funcs$ begin
             rock_id
             , s.id
             , game.collide(rock_fired, rock_params, s.fired, s.params)
-        from game.slugs as s;
+        from game.slugs as s
+        where s.id in (select * from game.candidate_slugs(rock_params));
     end;
     $func$ stable language plpgsql; -- }}}
 
+    create or replace function notify( -- {{{
+        tbl text
+        , op text
+        , obj json
+        )
+    returns void as $func$
+    begin
+        -- NOTE|dutc: delivered to LISTENers on commit (see api.py stream)
+        perform pg_notify(
+            'neocrisis'
+            , json_build_object('table', tbl, 'op', op, 'object', obj)::text
+        );
+    end;
+    $func$ volatile language plpgsql; -- }}}
+
+    create or replace function octant_spans( -- {{{
+        fired timestamp with time zone
+        , params rock_params
+        , delay boolean = false
+        , t_from timestamp with time zone = null
+        , horizon interval = interval '1 hour'
+        , max_spans integer = 16
+        )
+    returns table (
+        octant integer
+        , during tstzrange
+        ) as $func$
+    declare
+        -- NOTE|dutc: times are seconds since fired; sigma is the time along
+        --            the trajectory, which lags the observation time with delay
+        k double precision := 1;
+        light_lag double precision := 0;
+        s_start double precision;
+        s_end double precision;
+        s_max double precision;
+        breaks double precision[];
+        pad constant interval := interval '1 millisecond';
+    begin
+        s_start := greatest(0, extract(epoch from coalesce(t_from, fired) - fired));
+        -- visible (as in api.neos) until r reaches 0
+        if (params).v < 0 and (params).r_0 >= 0 then
+            s_end := (params).r_0 / -(params).v;
+        end if;
+        if s_end <= s_start then
+            return;
+        end if;
+        if delay is true then
+            k := 1 - (params).v / c();
+            light_lag := (params).r_0 / c();
+        end if;
+
+        -- only angular motion moves an object across octants indefinitely;
+        -- past the horizon, spans are left for refresh_octant_spans
+        s_max := s_end;
+        if (params).m_theta <> 0 or (params).m_phi <> 0 then
+            s_max := least(s_end, s_start + extract(epoch from horizon));
+        end if;
+
+        -- octants change where θ or φ cross a multiple of π/2, or r crosses 0
+        if k <> 0 then
+            breaks := array(
+                select x.s
+                from (
+                    select (sigma + light_lag) / k as s
+                    from (
+                        select ((n * pi() / 2) - a.b) / nullif(a.m, 0) as sigma
+                        from (values
+                            ((params).m_theta::double precision, (params).b_theta::double precision)
+                            , ((params).m_phi::double precision, (params).b_phi::double precision)
+                        ) as a(m, b)
+                        cross join lateral (
+                            select
+                                (a.m * (k * s_start - light_lag) + a.b) / (pi() / 2) as first
+                                , (a.m * (k * coalesce(s_max, s_start) - light_lag) + a.b) / (pi() / 2) as last
+                        ) as w
+                        -- NOTE|dutc: at most max_spans crossings, earliest first
+                        cross join lateral generate_series(
+                            case when w.first <= w.last
+                                then ceil(w.first)
+                                else greatest(ceil(w.last), floor(w.first) - max_spans)
+                            end::bigint
+                            , case when w.first <= w.last
+                                then least(floor(w.last), ceil(w.first) + max_spans)
+                                else floor(w.first)
+                            end::bigint
+                        ) as n
+                        where a.m <> 0
+                        union all
+                        select -(params).r_0 / nullif((params).v, 0)
+                    ) as x
+                ) as x
+                where x.s > s_start and (s_max is null or x.s < s_max)
+                group by x.s
+                order by x.s
+                limit max_spans
+            );
+            if array_length(breaks, 1) = max_spans then
+                s_max := breaks[max_spans];
+                breaks := breaks[1:max_spans - 1];
+            end if;
+        end if;
+
+        -- NOTE|dutc: a segment's octant is that of its midpoint (as in
+        --            game.octant); equal neighbouring segments are merged
+        return query
+        with
+            segments as (
+                select b.s as s_0, lead(b.s) over (order by b.s) as s_1
+                from unnest(
+                    s_start || breaks || coalesce(s_max, 'infinity'::double precision)
+                ) as b(s)
+            )
+            , octants as (
+                select
+                    g.s_0
+                    , g.s_1
+                    , (array[1, 2, 4, 3, 5, 6, 8, 7])[
+                        1
+                        + (x.r * sin(x.phi) * cos(x.theta) < 0)::integer
+                        + (x.r * sin(x.phi) * sin(x.theta) < 0)::integer * 2
+                        + (x.r * cos(x.phi) < 0)::integer * 4
+                    ] as o
+                from segments as g
+                cross join lateral (
+                    select k * case
+                        when g.s_1 = 'infinity' then g.s_0 + 1
+                        else (g.s_0 + g.s_1) / 2
+                        end - light_lag as sigma
+                ) as t
+                cross join lateral (
+                    select
+                        (params).r_0::double precision + (params).v::double precision * t.sigma as r
+                        , (params).m_theta::double precision * t.sigma + (params).b_theta::double precision as theta
+                        , (params).m_phi::double precision * t.sigma + (params).b_phi::double precision as phi
+                ) as x
+                where g.s_1 is not null
+            )
+            , runs as (
+                select
+                    x.*
+                    , count(*) filter (where x.changed) over (order by x.s_0) as run
+                from (
+                    select o.*, o.o is distinct from lag(o.o) over (order by o.s_0) as changed
+                    from octants as o
+                ) as x
+            )
+        select
+            min(r.o)
+            , tstzrange(
+                fired + interval '1 second' * min(r.s_0) - pad
+                , case when max(r.s_1) < 'infinity'
+                    then fired + interval '1 second' * max(r.s_1) + pad
+                    end
+                , '[]'
+            )
+        from runs as r
+        group by r.run
+        union all
+        -- NOTE|dutc: beyond the computed spans, the octant is unknown (null)
+        select
+            null
+            , tstzrange(
+                fired + interval '1 second' * s_max - pad
+                , fired + interval '1 second' * s_end + pad
+                , '[]'
+            )
+        where s_max is distinct from s_end;
+    end;
+    $func$ immutable language plpgsql; -- }}}
+
+    create or replace function octant_spans( -- {{{
+        fired timestamp with time zone
+        , params slug_params
+        , delay boolean = false
+        , t_from timestamp with time zone = null
+        , horizon interval = interval '1 hour'
+        , max_spans integer = 16
+        )
+    returns table (
+        octant integer
+        , during tstzrange
+        ) as $func$
+    begin
+        -- NOTE|dutc: a slug moves like a rock with r_0 = m_theta = m_phi = 0
+        return query
+        select * from game.octant_spans(
+            fired
+            , (0, (params).theta, 0, (params).phi, 0, (params).v)::game.rock_params
+            , delay
+            , t_from
+            , horizon
+            , max_spans
+        );
+    end;
+    $func$ immutable language plpgsql; -- }}}
+
+    create or replace function refresh_octant_spans( -- {{{
+        t_from timestamp with time zone = now()
+        )
+    returns integer as $func$
+    declare
+        _rec record;
+        count integer := 0;
+    begin
+        -- NOTE|dutc: recompute spans for objects that have outlived their
+        --            computed spans; call periodically
+        for _rec in
+            select distinct o.object, o.regclass
+            from game.octant_spans as o
+            where o.octant is null and lower(o.during) <= t_from
+        loop
+            delete from game.octant_spans as o
+            where o.object = _rec.object and o.regclass = _rec.regclass;
+            if _rec.regclass = 'game.rocks'::regclass then
+                insert into game.octant_spans (object, regclass, delay, octant, during)
+                select r.id, _rec.regclass, d.delay, o.*
+                from game.rocks as r
+                cross join (values (false), (true)) as d(delay)
+                cross join lateral game.octant_spans(r.fired, r.params, d.delay, t_from) as o
+                where r.id = _rec.object;
+            else
+                insert into game.octant_spans (object, regclass, delay, octant, during)
+                select s.id, _rec.regclass, d.delay, o.*
+                from game.slugs as s
+                cross join (values (false), (true)) as d(delay)
+                cross join lateral game.octant_spans(s.fired, s.params, d.delay, t_from) as o
+                where s.id = _rec.object;
+            end if;
+            count := count + 1;
+        end loop;
+        return count;
+    end;
+    $func$ volatile language plpgsql; -- }}}
+
     create type uniq_hits_t as ( -- {{{
         uniq boolean
         , rocks integer[]
@@ -431,119 +914,465 @@ do $funcs$ begin
     end;
     $func$ stable language plpgsql; -- }}}
 
+    create or replace function hits( -- {{{
+        since timestamp with time zone
+        , rocks integer[]
+        , slugs integer[]
+        )
+    returns table (
+        rock integer
+        , slug integer
+        , collision collision
+    ) as $func$
+    begin
+        -- NOTE|dutc: hits(), for only the collisions (at or after since) of
+        --            the given rocks & slugs; every other rock & slug keeps
+        --            its hit in game.hits, which blocks its later collisions
+        return query
+        select x.rock, x.slug, x.collision
+        from (
+            select
+                c.rock
+                , c.slug
+                , c.collision
+                , game.uniq_hits(c.rock, c.slug) over win
+            from game.collisions as c
+            where (c.collision).miss is null
+                and (c.collision).t >= since
+                and (c.rock = any(rocks) or c.slug = any(slugs))
+                and not exists (
+                    select 1 from game.hits as h
+                    where h.rock = c.rock and (h.collision).t <
+                        case when c.rock = any(rocks) then since else (c.collision).t end
+                )
+                and not exists (
+                    select 1 from game.hits as h
+                    where h.slug = c.slug and (h.collision).t <
+                        case when c.slug = any(slugs) then since else (c.collision).t end
+                )
+            window win as (
+                partition by 1
+                order by (c.collision).t, c.id
+                rows between unbounded preceding and current row
+            )
+        ) as x
+        where (x.uniq_hits).uniq is true;
+    end;
+    $func$ stable language plpgsql; -- }}}
+
+    create or replace function resolve_hits( -- {{{
+        since timestamp with time zone
+        , rocks integer[]
+        , slugs integer[]
+        )
+    returns void as $func$
+    declare
+        after game.hit[];
+        more_rocks integer[];
+        more_slugs integer[];
+    begin
+        -- NOTE|dutc: updates game.hits as hits() would, given that only the
+        --            hits (at or after since) of rocks & slugs can change;
+        --            grows rocks & slugs until the hits of every other rock &
+        --            slug agree with the hits computed for them
+        loop
+            after := array(
+                select x::game.hit from game.hits(since, rocks, slugs) as x
+            );
+            more_rocks := array(
+                select a.rock from unnest(after) as a
+                where not a.rock = any(rocks)
+                    and not exists (
+                        select 1 from game.hits as h
+                        where h.rock = a.rock and h.slug = a.slug
+                    )
+                union
+                select h.rock from game.hits as h
+                where (h.collision).t >= since
+                    and h.slug = any(slugs)
+                    and not h.rock = any(rocks)
+                    and not exists (
+                        select 1 from unnest(after) as a
+                        where a.rock = h.rock and a.slug = h.slug
+                    )
+            );
+            more_slugs := array(
+                select a.slug from unnest(after) as a
+                where not a.slug = any(slugs)
+                    and not exists (
+                        select 1 from game.hits as h
+                        where h.rock = a.rock and h.slug = a.slug
+                    )
+                union
+                select h.slug from game.hits as h
+                where (h.collision).t >= since
+                    and h.rock = any(rocks)
+                    and not h.slug = any(slugs)
+                    and not exists (
+                        select 1 from unnest(after) as a
+                        where a.rock = h.rock and a.slug = h.slug
+                    )
+            );
+            exit when more_rocks = '{}' and more_slugs = '{}';
+            rocks := rocks || more_rocks;
+            slugs := slugs || more_slugs;
+        end loop;
+
+        with
+            before as (
+                select h.rock, h.slug, h.collision from game.hits as h
+                where (h.collision).t >= since
+                    and (h.rock = any(rocks) or h.slug = any(slugs))
+            )
+            , diff as (
+                select * from before
+                except select a.rock, a.slug, a.collision from unnest(after) as a
+            )
+        delete from game.hits where rock in (select rock from diff);
+
+        -- NOTE|dutc: deleting hits deletes their fragments (see hits_trigger);
+        --            skip hits on these, collisions_trigger resolves them
+        insert into game.hits (rock, slug, collision)
+        select a.rock, a.slug, a.collision from unnest(after) as a
+        where a.rock in (select id from game.rocks)
+            and a.slug in (select id from game.slugs)
+        except select rock, slug, collision from game.hits;
+    end;
+    $func$ language plpgsql; -- }}}
+
+    create or replace function load( -- {{{
+        scenario regclass
+        , t timestamp with time zone = now()
+        )
+    returns void as $func$
+    declare
+        new_rocks integer[];
+        new_slugs integer[];
+    begin
+        -- NOTE|dutc: `scenario` has rows of (tbl, name, target, mass, fired,
+        --            params), as written by data/scenario.py, with fired
+        --            relative to t; inserted one by one, every row computes
+        --            its collisions and every statement resolves hits, which
+        --            is (at least) quadratic; instead, the rows go in with
+        --            neocrisis.loading on (skipping the collisions in
+        --            rocks_trigger & slugs_insert_trigger), and then all their
+        --            collisions in one statement, whose collisions_trigger
+        --            resolves their hits (and so fragments) at once
+        perform set_config('neocrisis.loading', 'on', true);
+        execute format($q$
+            with new as (
+                insert into game.rocks (name, target, mass, fired, params)
+                select name, target, coalesce(mass, 4), $1 + coalesce(fired, '0'), params::game.rock_params
+                from %s where tbl = 'rocks'
+                returning id
+            )
+            select coalesce(array_agg(id), '{}') from new
+        $q$, scenario) into new_rocks using t;
+        execute format($q$
+            with new as (
+                insert into game.slugs (name, target, fired, params)
+                select name, target, $1 + coalesce(fired, '0'), params::game.slug_params
+                from %s where tbl = 'slugs'
+                returning id
+            )
+            select coalesce(array_agg(id), '{}') from new
+        $q$, scenario) into new_slugs using t;
+        perform set_config('neocrisis.loading', 'off', true);
+
+        -- NOTE|dutc: the pairs candidate_rocks & candidate_slugs would
+        --            give, all at once: the buckets of every rock & slug are
+        --            computed once and matched by a join on theta bucket;
+        --            offset 0 keeps each side a subquery, or (guessing 10
+        --            rows per unnest) the planner nests the unnests inside a
+        --            loop over every rock & slug
+        insert into game.collisions
+            (rock, slug, collision)
+        with
+            rocks as (
+                select r.id, r.fired, r.params, game.theta_buckets(r.params) as tb, game.phi_buckets(r.params) as pb
+                    , r.id in (select unnest(new_rocks)) as new
+                from game.rocks as r
+            )
+            , slugs as (
+                select s.id, s.fired, s.params, game.theta_buckets(s.params) as tb, game.phi_buckets(s.params) as pb
+                    , s.id in (select unnest(new_slugs)) as new
+                from game.slugs as s
+            )
+            , pairs as (
+                    select distinct r.id as rock, s.id as slug
+                    from (
+                        select r.id, r.pb, r.new, rt.bucket
+                        from rocks as r
+                        cross join unnest(r.tb) as rt (bucket)
+                        offset 0
+                    ) as r
+                    inner join (
+                        select s.id, s.pb, s.new, st.bucket
+                        from slugs as s
+                        cross join unnest(s.tb) as st (bucket)
+                        where (s.params).v >= 0
+                        offset 0
+                    ) as s on (s.bucket = r.bucket)
+                    where r.pb && s.pb and (r.new or s.new)
+                union all
+                    -- NOTE|dutc: slugs fired inward are candidates of every rock
+                    select r.id, s.id
+                    from rocks as r
+                    cross join slugs as s
+                    where (s.params).v < 0 and (r.new or s.new)
+            )
+        select r.id, s.id, game.collide(r.fired, r.params, s.fired, s.params)
+        from pairs as p
+        inner join rocks as r on (r.id = p.rock)
+        inner join slugs as s on (s.id = p.slug);
+
+        -- NOTE|dutc: one notification rather than one per row; listeners
+        --            start over (as when they miss notifications)
+        perform pg_notify('neocrisis', json_build_object('op', 'RESET')::text);
+    end;
+    $func$ language plpgsql; -- }}}
+
 end $funcs$; -- }}}
 
 -- {{{ triggers
+-- NOTE|dutc: triggers only log themselves (raise info 'trigger: ...') with
+--            `set neocrisis.trace = on`; their calls & time are counted by
+--            track_functions (see setup) in api.trigger_stats
 raise info 'populating trigger functions';
 do $funcs$ begin
     set search_path = game, public;
 
     drop function if exists slugs_trigger;
+    drop function if exists slugs_insert_trigger;
     drop function if exists rocks_trigger;
+    drop function if exists rocks_insert_trigger;
     drop function if exists hits_trigger;
+    drop function if exists delete_trigger;
+    drop function if exists octant_spans_trigger;
+    drop function if exists impacts_trigger;
     drop function if exists const_id;
 
     create or replace function slugs_trigger() -- {{{
     returns trigger as $trig$
     begin
-        raise info 'trigger: %.%.% % ("%")', tg_table_schema, tg_table_name, tg_name, tg_op, new.name;
-
-        if tg_op = 'INSERT' then
+        if current_setting('neocrisis.trace', true) = 'on' then
+            raise info 'trigger: %.%.% % ("%")', tg_table_schema, tg_table_name, tg_name, tg_op, new.name;
+        end if;
+        -- NOTE|dutc: game.load computes the collisions of what it loads at
+        --            once (and notifies once)
+        if current_setting('neocrisis.loading', true) = 'on' then
+            return new;
+        end if;
+        perform game.notify(tg_table_name, tg_op, row_to_json(new));
+
+        -- NOTE|dutc: collisions for inserted slugs are computed for the whole
+        --            statement (see slugs_insert_trigger)
+        if tg_op = 'UPDATE' and new <> old then
+            delete from game.collisions
+            where slug = new.id
+                and rock not in (select * from game.candidate_rocks(new.params));
             insert into game.collisions
                 (rock, slug, collision)
-                select * from game.collisions(new.id, new.fired, new.params);
-        elsif tg_op = 'UPDATE' and new <> old then
-            update game.collisions set
-                collision = game.collide(r.fired, r.params, new.fired, new.params)
-            from game.rocks as r
-            where r.id = rock and new.id = slug;
+                select * from game.collisions(new.id, new.fired, new.params)
+            on conflict (rock, slug) do update set
+                collision = excluded.collision;
         end if;
         return new;
     end;
     $trig$ language plpgsql; -- }}}
 
-    create or replace function rocks_trigger() -- {{{
+    create or replace function slugs_insert_trigger() -- {{{
     returns trigger as $trig$
     begin
-        raise info 'trigger: %.%.% % ("%")', tg_table_schema, tg_table_name, tg_name, tg_op, new.name;
+        if current_setting('neocrisis.trace', true) = 'on' then
+            raise info 'trigger: %.%.% %', tg_table_schema, tg_table_name, tg_name, tg_op;
+        end if;
+        if current_setting('neocrisis.loading', true) = 'on' then
+            return null;
+        end if;
 
-        if tg_op = 'INSERT' then
-            insert into game.collisions
-                (rock, slug, collision)
-                select * from game.collisions(new.id, new.fired, new.params);
-        elsif tg_op = 'UPDATE' and new <> old then
+        -- NOTE|dutc: one statement for every inserted slug (e.g., a salvo),
+        --            so collisions_trigger resolves their hits together
+        insert into game.collisions
+            (rock, slug, collision)
+            select c.*
+            from new_table as s
+            cross join lateral game.collisions(s.id, s.fired, s.params) as c;
+        return null;
+    end;
+    $trig$ language plpgsql; -- }}}
+
+    create or replace function rocks_trigger() -- {{{
+    returns trigger as $trig$
+    begin
+        if current_setting('neocrisis.trace', true) = 'on' then
+            raise info 'trigger: %.%.% % ("%")', tg_table_schema, tg_table_name, tg_name, tg_op, new.name;
+        end if;
+        if current_setting('neocrisis.loading', true) = 'on' then
+            return new;
+        end if;
+        perform game.notify(tg_table_name, tg_op, row_to_json(new));
+
+        -- NOTE|dutc: collisions for inserted rocks are computed for the whole
+        --            statement (see rocks_insert_trigger)
+        if tg_op = 'UPDATE' and new <> old then
+            -- NOTE|dutc: an earlier row of this update may have deleted this
+            --            rock (a fragment of a hit it un-did)
+            if not exists (select 1 from game.rocks where id = new.id) then
+                return new;
+            end if;
             if new.mass <> old.mass then
                 -- mass changed: may affect fragmenting behavior
                 delete from game.rocks where source_rock = new.id;
                 delete from game.hits where rock = new.id;
             end if;
-            update game.collisions set
-                collision = game.collide(new.fired, new.params, s.fired, s.params)
-            from game.slugs as s
-            where s.id = slug and new.id = rock;
+            delete from game.collisions
+            where rock = new.id
+                and slug not in (select * from game.candidate_slugs(new.params));
+            insert into game.collisions
+                (rock, slug, collision)
+                select * from game.collisions(new.id, new.fired, new.params)
+            on conflict (rock, slug) do update set
+                collision = excluded.collision;
         end if;
 
         return new;
     end;
     $trig$ language plpgsql; -- }}}
 
-    create or replace function collisions_trigger() -- {{{
+    create or replace function rocks_insert_trigger() -- {{{
     returns trigger as $trig$
     begin
-        raise info 'trigger: %.%.% %', tg_table_schema, tg_table_name, tg_name, tg_op;
+        if current_setting('neocrisis.trace', true) = 'on' then
+            raise info 'trigger: %.%.% %', tg_table_schema, tg_table_name, tg_name, tg_op;
+        end if;
+        if current_setting('neocrisis.loading', true) = 'on' then
+            return null;
+        end if;
 
-        with
-            before as (select rock, slug, collision from game.hits)
-            , after as (select rock, slug, collision from game.hits())
-            , diff as (select * from before except select * from after)
-        delete from game.hits where rock in (select rock from diff);
+        -- NOTE|dutc: one statement for every inserted rock (e.g., the
+        --            fragments of a salvo's hits), so collisions_trigger
+        --            resolves their hits together
+        insert into game.collisions
+            (rock, slug, collision)
+            select c.*
+            from new_table as r
+            cross join lateral game.collisions(r.id, r.fired, r.params) as c;
+        return null;
+    end;
+    $trig$ language plpgsql; -- }}}
+
+    create or replace function collisions_trigger() -- {{{
+    returns trigger as $trig$
+    declare
+        changed game.hit[];
+        since timestamp with time zone;
+        rocks integer[];
+        slugs integer[];
+    begin
+        if current_setting('neocrisis.trace', true) = 'on' then
+            raise info 'trigger: %.%.% %', tg_table_schema, tg_table_name, tg_name, tg_op;
+        end if;
 
         if tg_op <> 'DELETE' then
-            with
-                before as (select rock, slug, collision from game.hits)
-                , after as (select rock, slug, collision from game.hits())
-                , diff as (select * from after except select * from before)
-            insert into game.hits (rock, slug, collision) select * from diff;
-        else
-            -- NOTE|dutc: processing a delete sometimes inadvertently leads to
-            --            inserts on non-existent rocks (invalid fragments);
-            --            add subselect to eliminate these
-            with
-                before as (select rock, slug, collision from game.hits)
-                , after as (select rock, slug, collision from game.hits())
-                , diff as (select * from after except select * from before)
-            insert into game.hits (rock, slug, collision)
-            select * from diff where rock in (select id from game.rocks);
+            changed := changed || array(
+                select (c.rock, c.slug, c.collision)::game.hit
+                from new_table as c where (c.collision).miss is null
+            );
+        end if;
+        if tg_op <> 'INSERT' then
+            changed := changed || array(
+                select (c.rock, c.slug, c.collision)::game.hit
+                from old_table as c where (c.collision).miss is null
+            );
         end if;
 
-        return new;
+        -- NOTE|dutc: hits are chosen in order of t, so a changed collision
+        --            can only change the hits of its rock or slug if that
+        --            wasn't already hit before it
+        select
+            coalesce(array_agg(distinct c.rock) filter (where f.rock), '{}')
+            , coalesce(array_agg(distinct c.slug) filter (where f.slug), '{}')
+            , min((c.collision).t) filter (where f.rock or f.slug)
+        into rocks, slugs, since
+        from unnest(changed) as c
+        cross join lateral (
+            select
+                not exists (
+                    select 1 from game.hits as h
+                    where h.rock = c.rock and (h.collision).t < (c.collision).t
+                ) as rock
+                , not exists (
+                    select 1 from game.hits as h
+                    where h.slug = c.slug and (h.collision).t < (c.collision).t
+                ) as slug
+        ) as f;
+
+        if since is null then
+            return null;
+        end if;
+
+        -- NOTE|dutc: resolving hits can fire this trigger again (deleting or
+        --            creating fragments); game.hits is only half-updated
+        --            then, so leave that work to the outermost trigger
+        if current_setting('neocrisis.hits_pending', true) = 'on' then
+            perform set_config('neocrisis.hits_since', least(
+                since
+                , nullif(current_setting('neocrisis.hits_since'), '')::timestamp with time zone
+            )::text, true);
+            perform set_config('neocrisis.hits_rocks', (
+                coalesce(nullif(current_setting('neocrisis.hits_rocks'), ''), '{}')::integer[] || rocks
+            )::text, true);
+            perform set_config('neocrisis.hits_slugs', (
+                coalesce(nullif(current_setting('neocrisis.hits_slugs'), ''), '{}')::integer[] || slugs
+            )::text, true);
+            return null;
+        end if;
+
+        perform set_config('neocrisis.hits_pending', 'on', true);
+        loop
+            perform set_config('neocrisis.hits_since', '', true);
+            perform set_config('neocrisis.hits_rocks', '', true);
+            perform set_config('neocrisis.hits_slugs', '', true);
+
+            perform game.resolve_hits(since, rocks, slugs);
+
+            since := nullif(current_setting('neocrisis.hits_since'), '');
+            exit when since is null;
+            rocks := current_setting('neocrisis.hits_rocks');
+            slugs := current_setting('neocrisis.hits_slugs');
+        end loop;
+        perform set_config('neocrisis.hits_pending', 'off', true);
+
+        return null;
     end;
     $trig$ language plpgsql; -- }}}
 
     create or replace function hits_trigger() -- {{{
     returns trigger as $trig$
     declare
-        src_name text;
-        src_mass integer;
-        src_params game.rock_params;
-        count integer;
-
-        _rock text;
-        _slug text;
+        hit record;
     begin
-        _rock := (select name from game.rocks where id = new.rock limit 1);
-        _slug := (select name from game.slugs where id = new.slug limit 1);
-        raise info 'trigger: %.%.% % ("%", "%")', tg_table_schema, tg_table_name, tg_name, tg_op, _rock, _slug;
-
-        src_name := (select coalesce(source_name, name) from game.rocks where id = new.rock limit 1);
-        src_mass := (select mass from game.rocks where id = new.rock limit 1);
-        src_params := (select params from game.rocks where id = new.rock limit 1);
-        count := (select count(*) from game.rocks where source_name = src_name or name = src_name);
-
-        if src_mass <= 1 then
-            return new;
+        if current_setting('neocrisis.trace', true) = 'on' then
+            for hit in
+                select r.name as rock, s.name as slug
+                from new_table as h
+                left outer join game.rocks as r on (r.id = h.rock)
+                left outer join game.slugs as s on (s.id = h.slug)
+                order by h.id
+            loop
+                raise info 'trigger: %.%.% % ("%", "%")', tg_table_schema, tg_table_name, tg_name, tg_op, hit.rock, hit.slug;
+            end loop;
         end if;
-
+        perform game.notify(tg_table_name, tg_op, row_to_json(h))
+        from (select * from new_table order by id) as h;
+
+        -- NOTE|dutc: a hit rock of more than unit mass leaves a fragment of
+        --            half its mass, named for its lineage and numbered in
+        --            order of hit; one statement for every hit (e.g., of a
+        --            salvo), with one lookup of each hit rock, so that
+        --            rocks_insert_trigger computes the collisions of all of
+        --            the fragments together
         insert into game.rocks (
             source_name
             , source_rock
@@ -553,23 +1382,108 @@ do $funcs$ begin
             , fired
             , params
             )
-        values (
-            src_name
-            , new.rock
-            , new.id
-            , src_name || to_char(count, ' FMRN')
-            , src_mass / 2
-            , (new.collision).t
+        select
+            f.src_name
+            , f.rock
+            , f.id
+            , f.src_name || to_char(l.count + f.n - 1, ' FMRN')
+            , f.mass / 2
+            , (f.collision).t
             , (
-                (src_params).m_theta / 2
-                , (src_params).b_theta + (src_params).m_theta / 2 * extract(epoch from (new.collision).t)
-                , (src_params).m_phi / 2
-                , (src_params).b_phi + (src_params).b_phi / 2 * extract(epoch from (new.collision).t)
-                , (new.collision).pos.r + 1
-                , (src_params).v
+                (f.params).m_theta / 2
+                , (f.params).b_theta + (f.params).m_theta / 2 * extract(epoch from (f.collision).t)
+                , (f.params).m_phi / 2
+                , (f.params).b_phi + (f.params).b_phi / 2 * extract(epoch from (f.collision).t)
+                , (f.collision).pos.r + 1
+                , (f.params).v
             )::game.rock_params
-        );
-        return new;
+        from (
+            select
+                h.id
+                , h.rock
+                , h.collision
+                , r.mass
+                , r.params
+                , coalesce(r.source_name, r.name) as src_name
+                , row_number() over (
+                    partition by coalesce(r.source_name, r.name)
+                    order by h.id
+                ) as n
+            from new_table as h
+            inner join game.rocks as r on (r.id = h.rock)
+            where r.mass > 1
+        ) as f
+        -- NOTE|dutc: the lineage so far (see rocks_source_name, rocks_name);
+        --            fragments of earlier hits of this statement are counted
+        --            by n
+        cross join lateral (
+            select count(*) as count from game.rocks as r
+            where r.source_name = f.src_name or r.name = f.src_name
+        ) as l
+        order by f.id;
+        return null;
+    end;
+    $trig$ language plpgsql; -- }}}
+
+    create or replace function delete_trigger() -- {{{
+    returns trigger as $trig$
+    begin
+        if current_setting('neocrisis.trace', true) = 'on' then
+            raise info 'trigger: %.%.% %', tg_table_schema, tg_table_name, tg_name, tg_op;
+        end if;
+        if current_setting('neocrisis.loading', true) = 'on' then
+            return null;
+        end if;
+        -- NOTE|dutc: for the whole statement, so that rows deleted by a
+        --            cascade (e.g., the hits and fragments of a rock, or
+        --            the hits resolve_hits un-does) are notified too
+        perform game.notify(tg_table_name, tg_op, row_to_json(o))
+        from (select * from old_table order by id) as o;
+        return null;
+    end;
+    $trig$ language plpgsql; -- }}}
+
+    create or replace function octant_spans_trigger() -- {{{
+    returns trigger as $trig$
+    begin
+        if tg_op in ('UPDATE', 'DELETE') then
+            delete from game.octant_spans
+            where object = old.id and regclass = tg_relid;
+        end if;
+        if tg_op in ('INSERT', 'UPDATE') then
+            insert into game.octant_spans (object, regclass, delay, octant, during)
+            select new.id, tg_relid, d.delay, o.octant, o.during
+            from (values (false), (true)) as d(delay)
+            cross join lateral game.octant_spans(new.fired, new.params, d.delay) as o;
+        end if;
+        return null;
+    end;
+    $trig$ language plpgsql; -- }}}
+
+    create or replace function impacts_trigger() -- {{{
+    returns trigger as $trig$
+    declare
+        rock_id integer;
+    begin
+        -- NOTE|dutc: a rock's impact is recomputed when its trajectory
+        --            changes or it is hit (or un-hit, see resolve_hits)
+        if tg_table_name = 'rocks' then
+            rock_id := new.id;
+        elsif tg_op = 'DELETE' then
+            rock_id := old.rock;
+        else
+            rock_id := new.rock;
+        end if;
+
+        delete from game.impacts where rock = rock_id;
+        insert into game.impacts (rock, t)
+            select r.id, m.t
+            from game.rocks as r
+            cross join lateral game.miss(r.fired, r.params) as m
+            where r.id = rock_id
+                and m.miss is null
+                and not exists (select 1 from game.hits as h where h.rock = r.id);
+        return null;
     end;
     $trig$ language plpgsql; -- }}}
 
@@ -585,6 +1499,8 @@ begin
     drop table if exists rocks cascade;
     drop table if exists collisions cascade;
     drop table if exists hits cascade;
+    drop table if exists octant_spans cascade;
+    drop table if exists impacts cascade;
 
     create table if not exists slugs ( -- {{{
         id serial primary key
@@ -598,6 +1514,10 @@ begin
                 and (params).v is not null
             )
     ) with oids;
+    -- NOTE|dutc: see candidate_rocks & candidate_slugs
+    create index slugs_theta_buckets on slugs using gin (theta_buckets(params));
+    create index slugs_phi_buckets on slugs using gin (phi_buckets(params));
+    create index slugs_inward on slugs (id) where (params).v < 0;
     -- }}}
 
     create table if not exists rocks ( -- {{{
@@ -617,6 +1537,9 @@ begin
             )
     ) with oids;
     create index rocks_id on rocks (id);
+    create index rocks_name on rocks (name);
+    create index rocks_theta_buckets on rocks using gin (theta_buckets(params));
+    create index rocks_phi_buckets on rocks using gin (phi_buckets(params));
     -- }}}
 
     create table if not exists collisions ( -- {{{
@@ -630,6 +1553,7 @@ begin
     create index collisions_collision on collisions (collision) where not collision is null;
     create index collisions_collision_t on collisions (((collision).t));
     create index collisions_collision_miss on collisions (((collision).miss));
+    create index collisions_slug on collisions (slug);
     -- }}}
 
     create table if not exists hits ( -- {{{
@@ -641,12 +1565,51 @@ begin
     alter table rocks add column source_name text default null;
     alter table rocks add column source_rock integer default null references rocks (id) on delete cascade;
     alter table rocks add column source_hit integer default null references hits (id) on delete cascade;
+    -- NOTE|dutc: fragment lineage (see hits_trigger), and the cascades from
+    --            a deleted rock or hit to its fragments
+    create index rocks_source_name on rocks (source_name);
+    create index rocks_source_rock on rocks (source_rock);
+    create index rocks_source_hit on rocks (source_hit);
+    -- }}}
+
+    create table if not exists octant_spans ( -- {{{
+        id serial primary key
+        , object integer not null
+        , regclass regclass not null
+        , delay boolean not null default false
+        , octant integer
+        , during tstzrange not null
+    );
+    -- NOTE|dutc: maintained by octant_spans_trigger; a null octant means
+    --            not (yet) computed, see refresh_octant_spans
+    create index octant_spans_object on octant_spans (object, regclass);
+    create index octant_spans_octant_during on octant_spans
+        using gist (octant, during) where not delay;
+    create index octant_spans_delay_octant_during on octant_spans
+        using gist (octant, during) where delay;
+    -- }}}
+
+    create table if not exists impacts ( -- {{{
+        rock integer primary key references rocks (id) on delete cascade
+        , t timestamp with time zone not null
+    );
+    -- NOTE|dutc: maintained by impacts_trigger; one row per rock that has
+    --            not been hit and will (or did) reach earth, see api.misses
+    create index impacts_t on impacts (t);
     -- }}}
 
     drop trigger if exists slugs_trigger on slugs;
+    drop trigger if exists slugs_insert_trigger on slugs;
     drop trigger if exists rocks_trigger on rocks;
-    drop trigger if exists collisions_trigger on collisions;
+    drop trigger if exists rocks_insert_trigger on rocks;
+    drop trigger if exists collisions_insert_trigger on collisions;
+    drop trigger if exists collisions_update_trigger on collisions;
+    drop trigger if exists collisions_delete_trigger on collisions;
     drop trigger if exists hits_trigger on hits;
+    drop trigger if exists slugs_octant_spans_trigger on slugs;
+    drop trigger if exists rocks_octant_spans_trigger on rocks;
+    drop trigger if exists rocks_impacts_trigger on rocks;
+    drop trigger if exists hits_impacts_trigger on hits;
 
     drop trigger if exists slugs_id_trigger on slugs;
     drop trigger if exists rocks_id_trigger on rocks;
@@ -655,13 +1618,48 @@ begin
 
     create trigger slugs_trigger after insert or update on slugs
         for each row execute procedure slugs_trigger();
+    create trigger slugs_insert_trigger after insert on slugs
+        referencing new table as new_table
+        for each statement execute procedure slugs_insert_trigger();
     create trigger rocks_trigger after insert or update on rocks
         for each row execute procedure rocks_trigger();
-    -- NOTE|dutc: collisions_trigger is STATEMENT level
-    create trigger collisions_trigger after insert or update or delete on collisions
+    create trigger rocks_insert_trigger after insert on rocks
+        referencing new table as new_table
+        for each statement execute procedure rocks_insert_trigger();
+    -- NOTE|dutc: collisions_trigger is STATEMENT level; one trigger per
+    --            event, since transition tables allow only one
+    create trigger collisions_insert_trigger after insert on collisions
+        referencing new table as new_table
+        for each statement execute procedure collisions_trigger();
+    create trigger collisions_update_trigger after update on collisions
+        referencing old table as old_table new table as new_table
+        for each statement execute procedure collisions_trigger();
+    create trigger collisions_delete_trigger after delete on collisions
+        referencing old table as old_table
         for each statement execute procedure collisions_trigger();
     create trigger hits_trigger after insert on hits
-        for each row execute procedure hits_trigger();
+        referencing new table as new_table
+        for each statement execute procedure hits_trigger();
+    create trigger slugs_delete_trigger after delete on slugs
+        referencing old table as old_table
+        for each statement execute procedure delete_trigger();
+    create trigger rocks_delete_trigger after delete on rocks
+        referencing old table as old_table
+        for each statement execute procedure delete_trigger();
+    create trigger hits_delete_trigger after delete on hits
+        referencing old table as old_table
+        for each statement execute procedure delete_trigger();
+    create trigger slugs_octant_spans_trigger
+        after insert or update of fired, params or delete on slugs
+        for each row execute procedure octant_spans_trigger();
+    create trigger rocks_octant_spans_trigger
+        after insert or update of fired, params or delete on rocks
+        for each row execute procedure octant_spans_trigger();
+    create trigger rocks_impacts_trigger
+        after insert or update of fired, params on rocks
+        for each row execute procedure impacts_trigger();
+    create trigger hits_impacts_trigger after insert or delete on hits
+        for each row execute procedure impacts_trigger();
 
     create trigger slugs_id_trigger before update of id on slugs
         for each statement execute procedure error('cannot change id');
@@ -680,12 +1678,15 @@ do $views$
 begin
     set search_path = api, game, public;
 
+    drop function if exists api.telescope;
+    drop function if exists api.solve;
     drop view if exists api.rocks;
     drop view if exists api.slugs;
     drop view if exists api.all_neos;
     drop view if exists api.neos;
     drop view if exists api.collisions;
     drop view if exists api.hits;
+    drop view if exists api.trigger_stats;
 
     create or replace view rocks as (
         select
@@ -697,17 +1698,25 @@ begin
             , (h.collision).t as collided
             , r.params
             , (h.collision)
-            , pos(r.fired, r.params, now())
-            , pos(r.fired, r.params, now(), true) as delay_pos
-            , pos2cpos(pos(r.fired, r.params, now())) as cpos
-            , pos2cpos(pos(r.fired, r.params, now(), true)) as delay_cpos
-            , octant(pos(r.fired, r.params, now()))
-            , octant(pos(r.fired, r.params, now(), true)) as delay_octant
+            , p.pos
+            , p.delay_pos
+            , pos2cpos(p.pos) as cpos
+            , pos2cpos(p.delay_pos) as delay_cpos
+            , octant(p.pos) as octant
+            , octant(p.delay_pos) as delay_octant
             , now() as t
             , now() - r.fired as age
         from game.rocks as r
         left outer join game.hits as h
            on (r.id = h.rock)
+        cross join lateral (
+            -- NOTE|dutc: offset 0 keeps this from being flattened, so each
+            --            position is computed once per row (not per column)
+            select
+                pos(r.fired, r.params, now()) as pos
+                , pos(r.fired, r.params, now(), true) as delay_pos
+            offset 0
+        ) as p
     );
 
     create or replace view slugs as (
@@ -719,20 +1728,30 @@ begin
             , (h.collision).t as collided
             , s.params
             , (h.collision)
-            , pos(s.fired, s.params, now())
-            , pos(s.fired, s.params, now(), true) as delay_pos
-            , pos2cpos(pos(s.fired, s.params, now())) as cpos
-            , pos2cpos(pos(s.fired, s.params, now(), true)) as delay_cpos
-            , octant(pos(s.fired, s.params, now()))
-            , octant(pos(s.fired, s.params, now(), true)) as delay_octant
+            , p.pos
+            , p.delay_pos
+            , pos2cpos(p.pos) as cpos
+            , pos2cpos(p.delay_pos) as delay_cpos
+            , octant(p.pos) as octant
+            , octant(p.delay_pos) as delay_octant
             , now() as t
             , now() - s.fired as age
         from game.slugs as s
         left outer join game.hits as h
            on (s.id = h.slug)
+        cross join lateral (
+            -- NOTE|dutc: offset 0 keeps this from being flattened, so each
+            --            position is computed once per row (not per column)
+            select
+                pos(s.fired, s.params, now()) as pos
+                , pos(s.fired, s.params, now(), true) as delay_pos
+            offset 0
+        ) as p
     );
 
     create or replace view all_neos as (
+            -- NOTE|dutc: regclass distinguishes the halves, so `union all`
+            --            (no de-duplication) returns the same rows
             select
                 'rocks'::regclass
                 , id
@@ -753,7 +1772,7 @@ begin
                 , t
                 , age
             from rocks
-        union
+        union all
             select
                 'slugs'::regclass
                 , id
@@ -784,6 +1803,91 @@ begin
             and ((pos).r >= 0)
     );
 
+    create or replace function telescope( -- {{{
+        octants integer[]
+        , delay boolean = false
+        )
+    returns setof neos as $func$
+    declare
+        candidates game.octant_spans[];
+    begin
+        -- NOTE|dutc: candidates come from the octant_spans index (plus any
+        --            object whose spans are not computed); every candidate
+        --            is then observed as usual and its octant checked
+        if delay is true then
+            candidates := array(
+                select s
+                from unnest(octants) as o(octant)
+                inner join game.octant_spans as s
+                    on (s.octant = o.octant and s.delay and s.during @> now())
+                union all
+                select s
+                from game.octant_spans as s
+                where s.octant is null and s.delay and s.during @> now()
+            );
+        else
+            candidates := array(
+                select s
+                from unnest(octants) as o(octant)
+                inner join game.octant_spans as s
+                    on (s.octant = o.octant and not s.delay and s.during @> now())
+                union all
+                select s
+                from game.octant_spans as s
+                where s.octant is null and not s.delay and s.during @> now()
+            );
+        end if;
+
+        return query
+        select n.*
+        from api.neos as n
+        where (
+                n.regclass = 'api.rocks'::regclass
+                and n.id = any(array(
+                    select (c).object from unnest(candidates) as c
+                    where (c).regclass = 'game.rocks'::regclass
+                ))
+            or
+                n.regclass = 'api.slugs'::regclass
+                and n.id = any(array(
+                    select (c).object from unnest(candidates) as c
+                    where (c).regclass = 'game.slugs'::regclass
+                ))
+            )
+            and case when delay is true
+                then n.delay_octant
+                else n.octant
+                end = any(octants);
+    end;
+    $func$ stable language plpgsql; -- }}}
+
+    create or replace function solve( -- {{{
+        slug_fired timestamp with time zone
+        , v numeric
+        , rocks integer[] = null
+        )
+    returns table (
+        id integer
+        , name text
+        , t timestamp with time zone
+        , params game.slug_params
+    ) as $func$
+        -- NOTE|dutc: fire-control for every visible rock (or just rocks)
+        --            with no hit pending, i.e., that no slug in flight is
+        --            already on course to hit; a slug fired at slug_fired
+        --            with params hits it at t
+        select n.id, n.name, (game.collide(r.fired, r.params, slug_fired, s.params)).t, s.params
+        from api.neos as n
+        inner join game.rocks as r on (r.id = n.id)
+        cross join lateral (
+            select game.intercept(r.fired, r.params, slug_fired, v) as params offset 0
+        ) as s
+        where n.regclass = 'api.rocks'::regclass
+            and (rocks is null or n.id = any(rocks))
+            and not exists (select 1 from game.hits as h where h.rock = n.id)
+            and s.params is not null;
+    $func$ stable language sql; -- }}}
+
     create or replace view collisions as ( -- {{{
         select
             c.id
@@ -807,19 +1911,26 @@ begin
     ); -- }}}
 
     create or replace view misses as (-- {{{
-        with misses as (
-            select distinct id from game.rocks
-                except
-            select distinct rock as id from game.hits
-        )
         select
             r.name as rock
             , r.fired as fired
             , game.miss(r.fired, r.params) as collision
             , r.target
-        from game.rocks as r
-        inner join misses as m on (m.id = r.id)
-        where (game.miss(r.fired, r.params)).t <= now()
+        from game.impacts as i
+        inner join game.rocks as r on (r.id = i.rock)
+        where i.t <= now()
+    ); -- }}}
+
+    create or replace view trigger_stats as (-- {{{
+        select
+            f.funcname as trigger
+            , f.calls
+            , f.total_time
+            , f.self_time
+        from pg_stat_user_functions as f
+        inner join pg_proc as p on (p.oid = f.funcid)
+        where f.schemaname = 'game'
+            and p.prorettype = 'trigger'::regtype
     ); -- }}}
 
 end $views$; -- }}}
@@ -830,3 +1941,7 @@ exception when others then
     get stacked diagnostics exc_detail = pg_exception_detail;
     raise exception E'\n------\n%\n%\n------\n\nCONTEXT:\n%\n', exc_message, exc_detail, exc_context;
 end $$;
+
+\if :float_kernel
+    \ir kernels/float.sql
+\endif
@@ -12,9 +12,54 @@ from sys import exit
 
 C = 299792458.0 # m / s
 V_SLUG = C / 10
+SALVO = 5 # shots per request (see RAILGUN_LIMIT in api.py)
 
 logger = getLogger(__name__)
 
+def aim(name, fired, r0, v, m_theta, b_theta, m_phi, b_phi, slug_fired_time):
+    'the shot at rock `name` (as fitted) from a slug fired at slug_fired_time'
+    rock_fired_time = fired
+
+    # compute times as seconds
+    base_time = slug_fired_time.replace(hour=0, minute=0, second=0, microsecond=0)
+    t_rock = (rock_fired_time - base_time).total_seconds()
+    t_slug = (slug_fired_time - base_time).total_seconds()
+
+    v_rock, v_slug  = v, V_SLUG
+    r0_rock, r0_slug = r0, 0
+
+    # given:
+    #   r_collide_rock = r_collide_slug
+    #   r_collide_rock = v_rock * (t_collide - t_rock) + r0_rock
+    #   r_collide_slug = v_slug * (t_collide - t_slug) + r0_slug
+
+    # ∴ t_collide  = (v_rock * t_rock - r0_rock - v_slug * t_slug + r0_slug)
+    #              / (v_rock - v_slug)
+
+    t_collide  = (v_rock * t_rock - r0_rock - v_slug * t_slug + r0_slug) \
+               / (v_rock - v_slug)
+
+    collide_time = base_time + timedelta(seconds=t_collide)
+    logger.info('Determined (for %s): collide_time = %s', name, collide_time)
+
+    r_collide = v_rock * (t_collide - t_rock) + r0_rock
+    if not isclose(r_collide, v_slug * (t_collide - t_slug) + r0_slug):
+        raise ArithmeticError('bad computation')
+
+    theta_collide = m_theta * (t_collide - t_rock) + b_theta
+    phi_collide = m_phi * (t_collide - t_rock) + b_phi
+
+    logger.info('Determined (for %s): theta = %s, phi = %s',
+                name, theta_collide, phi_collide)
+
+    logger.info('Aiming at (%s)!', name)
+    return {
+        'name': f'@ {name}',
+        'theta': theta_collide,
+        'phi': phi_collide,
+        'fired': slug_fired_time.strftime('%H:%M:%S.%f'),
+    }
+
 parser = ArgumentParser()
 parser.add_argument('-v', '--verbose', action='count')
 parser.add_argument('host', nargs='?', default='localhost')
@@ -26,21 +71,18 @@ if __name__ == '__main__':
     basicConfig(level=level)
 
     railgun_url = f'http://{args.host}:{args.port}/railgun'
-    base_telescope_url = f'http://{args.host}:{args.port}/telescope/{{octant}}'
-    telescope_urls = {
-        base_telescope_url.format(octant=octant)
-        for octant in range(1, 9)
-    }
+    telescope_url = f'http://{args.host}:{args.port}/telescope/all'
 
     objects = defaultdict(lambda: deque(maxlen=2))
     while True:
         all_clear = True
+        targets = []
 
-        for url in telescope_urls:
-            resp = get(url)
-            logger.info('GET %s -> %s', url, resp.status_code)
-            if resp.ok:
-                for obj in resp.json()['objects']:
+        resp = get(telescope_url)
+        logger.info('GET %s -> %s', telescope_url, resp.status_code)
+        if resp.ok:
+            for octant in resp.json()['octants'].values():
+                for obj in octant:
                     if obj['type'] != 'rock':
                         continue
                     name, fired = obj['name'], obj['fired']
@@ -105,51 +147,16 @@ if __name__ == '__main__':
                 logger.info('Determined (for %s): m_phi = %.2f, b_phi = %.2f',
                             name, m_phi, b_phi)
 
-                # assume firing in 10 seconds
-                now = datetime.now(tzlocal())
-
-                rock_fired_time = fired
-                slug_fired_time = now + timedelta(seconds=5)
-
-                # compute times as seconds
-                base_time = now.replace(hour=0, minute=0, second=0, microsecond=0)
-                t_rock = (rock_fired_time - base_time).total_seconds()
-                t_slug = (slug_fired_time - base_time).total_seconds()
-
-                v_rock, v_slug  = v, V_SLUG
-                r0_rock, r0_slug = r0, 0
-
-                # given:
-                #   r_collide_rock = r_collide_slug
-                #   r_collide_rock = v_rock * (t_collide - t_rock) + r0_rock
-                #   r_collide_slug = v_slug * (t_collide - t_slug) + r0_slug
-
-                # ∴ t_collide  = (v_rock * t_rock - r0_rock - v_slug * t_slug + r0_slug)
-                #              / (v_rock - v_slug)
-
-                t_collide  = (v_rock * t_rock - r0_rock - v_slug * t_slug + r0_slug) \
-                           / (v_rock - v_slug)
-
-                collide_time = base_time + timedelta(seconds=t_collide)
-                logger.info('Determined (for %s): collide_time = %s', name, collide_time)
-
-                r_collide = v_rock * (t_collide - t_rock) + r0_rock
-                if not isclose(r_collide, v_slug * (t_collide - t_slug) + r0_slug):
-                    raise ArithmeticError('bad computation')
-
-                theta_collide = m_theta * (t_collide - t_rock) + b_theta
-                phi_collide = m_phi * (t_collide - t_rock) + b_phi
-
-                logger.info('Determined (for %s): theta = %s, phi = %s',
-                            name, theta_collide, phi_collide)
-
-                logger.info('Firing at (%s)!', name)
-                data = {'name': f'@ {name}', 'theta': theta_collide, 'phi': phi_collide}
-
-                wait = (slug_fired_time - datetime.now(tzlocal())).total_seconds()
-                sleep(wait)
+                targets.append((name, fired, r0, v, m_theta, b_theta, m_phi, b_phi))
 
-                post(railgun_url, json=data)
-                logger.info('Fired at (%s)!!', name)
+        # fire every solution, SALVO shots per request (the rate limit counts
+        # shots, so wait out the limit between requests); each request is
+        # aimed as it is sent, as the firing time must still be ahead
+        for i in range(0, len(targets), SALVO):
+            slug_fired_time = datetime.now(tzlocal()) + timedelta(seconds=5)
+            salvo = [aim(*x, slug_fired_time) for x in targets[i:i + SALVO]]
+            resp = post(railgun_url, json=salvo)
+            logger.info('POST %s (%d shots) -> %s', railgun_url, len(salvo), resp.status_code)
+            sleep(1)
 
-            sleep(.1)
+        sleep(.1)
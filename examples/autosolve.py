@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+from time import sleep
+from requests import post
+from logging import getLogger, basicConfig, CRITICAL, INFO, DEBUG
+from argparse import ArgumentParser
+
+logger = getLogger(__name__)
+
+parser = ArgumentParser()
+parser.add_argument('-v', '--verbose', action='count')
+parser.add_argument('host', nargs='?', default='localhost')
+parser.add_argument('port', nargs='?', default=5000, type=int)
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    level = {0: CRITICAL, 1: INFO, 2: DEBUG}.get(args.verbose, CRITICAL)
+    basicConfig(level=level)
+
+    solve_url = f'http://{args.host}:{args.port}/railgun/solve'
+
+    # the server knows every rock's exact trajectory, so there is nothing to
+    # observe or fit: ask for a solution for every visible rock and fire it
+    while True:
+        resp = post(solve_url, json={'fire': True})
+        logger.info('POST %s -> %s', solve_url, resp.status_code)
+        if resp.ok:
+            solved = resp.json()
+            solutions = solved['solutions']
+            if not solutions:
+                print('All clear!')
+            for x in solutions:
+                logger.info('Aiming at (%s): theta = %s, phi = %s, collide_time = %s',
+                            x['rock']['name'], x['theta'], x['phi'], x['collision_time'])
+            # NOTE: one salvo per call; the rest are fired on the next pass
+            for x in solved.get('unfired', []):
+                logger.info('Not yet fired at (%s)', x['name'])
+        sleep(1)
@@ -17,15 +17,13 @@ if DBHOST is not None:
 
 QUERY = r"""
 select
-    n.name
-    , coalesce(n.target, 'unknown') as target
-    , n.regclass
-    , case
-    when (n.rock_params).v = 0 then 'Infinity'::double precision
-    else (n.pos).r / (n.rock_params).v
-    end as eta
-from api.neos as n
-where n.regclass = 'api.rocks'::regclass
+    r.name
+    , coalesce(r.target, 'unknown') as target
+    , extract(epoch from i.t - now()) as eta
+from game.impacts as i
+inner join game.rocks as r on (r.id = i.rock)
+where i.t > now()
+order by i.t
 """
 
 if __name__ == '__main__':
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+from asyncio import get_event_loop, gather, sleep, ensure_future
+from aiohttp import ClientSession
+from logging import getLogger, basicConfig, CRITICAL, INFO, DEBUG
+from argparse import ArgumentParser
+from collections import defaultdict, deque
+from dateutil.tz import tzlocal
+from dateutil.parser import parse as dateutil_parse
+from datetime import datetime, timedelta
+from time import perf_counter
+
+import numpy as np
+
+V_SLUG = 1 # m / s (see SLUG_VELOCITY in api.py)
+SALVO = 5 # shots per request (see RAILGUN_LIMIT in api.py)
+
+logger = getLogger(__name__)
+
+parser = ArgumentParser()
+parser.add_argument('-v', '--verbose', action='count')
+parser.add_argument('host', nargs='?', default='localhost')
+parser.add_argument('port', nargs='?', default=5000, type=int)
+parser.add_argument('--window', default=8, type=int, help='observations per track')
+parser.add_argument('--interval', default=.5, type=float, help='secs between observation cycles')
+parser.add_argument('--lead', default=2, type=float, help='secs between aiming and firing')
+parser.add_argument('--horizon', default=86400, type=float, help='secs ahead to engage rocks')
+
+class Tracker:
+    '''
+    sliding window of observations of every rock, fit by least squares
+
+    positions are linear in the time since a rock was fired:
+        r     = v * t + r_0
+        theta = m_theta * t + b_theta
+        phi   = m_phi * t + b_phi
+    '''
+    def __init__(self, window):
+        self.window = window
+        self.tracks = defaultdict(lambda: deque(maxlen=window))
+        self.names, self.fired = {}, {}
+
+    def observe(self, obj):
+        key = obj['id']
+        fired = dateutil_parse(obj['fired'])
+        t = (dateutil_parse(obj['obs_time']) - fired).total_seconds()
+        track = self.tracks[key]
+        if track and track[-1][0] >= t:
+            return
+        pos = obj['pos']
+        track.append((t, pos['r'], pos['theta'], pos['phi']))
+        self.names[key], self.fired[key] = obj['name'], fired
+
+    def forget(self, keys):
+        for key in keys:
+            self.tracks.pop(key, None)
+
+    def fit(self):
+        '''
+        fits every track with at least two observations at once; returns the
+        keys and (v, r_0, m_theta, b_theta, m_phi, b_phi) as arrays
+        '''
+        keys = [k for k, x in self.tracks.items() if len(x) >= 2]
+        if not keys:
+            return keys, (np.empty(0),) * 6
+
+        # NOTE: tracks are left-aligned and padded with nan, so that one
+        #       (nan-aware) computation fits tracks of any length
+        obs = np.full((len(keys), self.window, 4), np.nan)
+        for i, key in enumerate(keys):
+            track = self.tracks[key]
+            obs[i, :len(track)] = track
+        t, r, theta, phi = np.moveaxis(obs, 2, 0)
+
+        # NOTE: the telescope reports normalized angles; unwrap them (the
+        #       trailing nan only spoil the padding)
+        theta = np.unwrap(theta)
+        phi = np.unwrap(phi * 2) / 2
+
+        t_mean = np.nanmean(t, axis=1, keepdims=True)
+        dt = t - t_mean
+        var = np.nansum(dt ** 2, axis=1)
+        def line(y):
+            y_mean = np.nanmean(y, axis=1, keepdims=True)
+            m = np.nansum(dt * (y - y_mean), axis=1) / var
+            return m, y_mean[:, 0] - m * t_mean[:, 0]
+        return keys, (*line(r), *line(theta), *line(phi))
+
+def solve(fired, params, slug_fired):
+    '''
+    solves for the slug angles that meet each rock; returns the collision
+    times (secs since each rock was fired; nan if never) and the angles
+    '''
+    v, r_0, m_theta, b_theta, m_phi, b_phi = params
+    t_slug = np.array([(slug_fired - x).total_seconds() for x in fired])
+
+    # given:
+    #   r_collide = v * t_collide + r_0
+    #   r_collide = V_SLUG * (t_collide - t_slug)
+
+    # ∴ t_collide = (r_0 + V_SLUG * t_slug) / (V_SLUG - v)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_collide = (r_0 + V_SLUG * t_slug) / (V_SLUG - v)
+        t_collide[~(t_collide >= t_slug)] = np.nan
+    return t_collide, m_theta * t_collide + b_theta, m_phi * t_collide + b_phi
+
+class Battery:
+    '''
+    queue of shots, fired SALVO at a time, once per second (as the rate limit
+    counts shots); each shot is posted before its firing time or dropped
+    '''
+    def __init__(self, session, url):
+        self.session, self.url = session, url
+        self.pending = {}
+        self.engaged = {}
+        self.shots = 0
+
+    def aim(self, key, shot, fired, collide_time):
+        if key not in self.engaged and key not in self.pending:
+            self.pending[key] = shot, fired, collide_time
+
+    def disengage(self, now):
+        'forgets rocks that outlived their collision (the shot missed)'
+        for key in [k for k, t in self.engaged.items() if t < now]:
+            del self.engaged[key]
+
+    async def run(self):
+        while True:
+            now = datetime.now(tzlocal())
+            salvo = []
+            for key in list(self.pending):
+                shot, fired, collide_time = self.pending.pop(key)
+                if fired <= now:
+                    continue
+                salvo.append((key, shot, collide_time))
+                self.engaged[key] = collide_time
+                if len(salvo) == SALVO:
+                    break
+            if salvo:
+                ensure_future(self.fire(salvo))
+            await sleep(1)
+
+    async def fire(self, salvo):
+        start = perf_counter()
+        async with self.session.post(self.url, json=[x for _, x, _ in salvo]) as resp:
+            logger.info('POST %s (%d shots) -> %s in %.1f ms', self.url, len(salvo),
+                        resp.status, (perf_counter() - start) * 1000)
+            for key, shot, collide_time in salvo:
+                if resp.status != 200:
+                    self.engaged.pop(key, None)
+                    continue
+                logger.info('Fired at (%s): theta = %s, phi = %s, collide_time = %s',
+                            shot['target'], shot['theta'], shot['phi'], collide_time)
+            if resp.status == 200:
+                self.shots += len(salvo)
+
+async def observe(session, url):
+    async with session.get(url) as resp:
+        logger.debug('GET %s -> %s', url, resp.status)
+        if resp.status != 200:
+            return []
+        return (await resp.json())['objects']
+
+async def main(args):
+    base_url = f'http://{args.host}:{args.port}'
+    telescope_urls = [f'{base_url}/telescope/{octant}' for octant in range(1, 9)]
+
+    tracker = Tracker(args.window)
+    async with ClientSession() as session:
+        battery = Battery(session, f'{base_url}/railgun')
+        ensure_future(battery.run())
+
+        while True:
+            start = perf_counter()
+            octants = await gather(*(observe(session, url) for url in telescope_urls))
+            observed = perf_counter()
+
+            seen = set()
+            for obj in (obj for octant in octants for obj in octant):
+                if obj['type'] == 'rock':
+                    tracker.observe(obj)
+                    seen.add(obj['id'])
+            tracker.forget(set(tracker.tracks) - seen)
+
+            now = datetime.now(tzlocal())
+            battery.disengage(now)
+            slug_fired = now + timedelta(seconds=args.lead)
+            keys, params = tracker.fit()
+            fired = [tracker.fired[k] for k in keys]
+            t_collide, theta, phi = solve(fired, params, slug_fired)
+            horizon = np.array([(slug_fired - x).total_seconds() for x in fired]) + args.horizon
+            for i in np.nonzero(t_collide <= horizon)[0].tolist():
+                key, name = keys[i], tracker.names[keys[i]]
+                collide_time = fired[i] + timedelta(seconds=t_collide[i])
+                battery.aim(key, {
+                    'name': f'@ {name}',
+                    'target': name,
+                    'theta': theta[i],
+                    'phi': phi[i],
+                    'fired': slug_fired.strftime('%H:%M:%S.%f'),
+                }, slug_fired, collide_time)
+            solved = perf_counter()
+
+            if not seen:
+                print('All clear!')
+            print(f'observe {(observed - start) * 1000:>8.1f} ms  '
+                  f'solve {(solved - observed) * 1000:>8.1f} ms  '
+                  f'tracking {len(seen):>5}  '
+                  f'pending {len(battery.pending):>5}  '
+                  f'engaged {len(battery.engaged):>5}  '
+                  f'fired {battery.shots:>6}')
+
+            await sleep(max(0, args.interval - (perf_counter() - start)))
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    level = {0: CRITICAL, 1: INFO, 2: DEBUG}.get(args.verbose, CRITICAL)
+    basicConfig(level=level)
+
+    get_event_loop().run_until_complete(main(args))
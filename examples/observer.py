@@ -17,23 +17,22 @@ if __name__ == '__main__':
     level = {0: CRITICAL, 1: INFO, 2: DEBUG}.get(args.verbose, CRITICAL)
     basicConfig(level=level)
 
-    base_url = f'http://{args.host}:{args.port}/telescope/{{octant}}'
-    urls = {base_url.format(octant=octant) for octant in range(1, 9)}
+    url = f'http://{args.host}:{args.port}/telescope/all'
 
     objects = defaultdict(list)
     while True:
-        for url in urls:
-            resp = get(url)
-            logger.info('GET %s -> %s', url, resp.status_code)
-            if resp.ok:
-                for obj in resp.json()['objects']:
+        resp = get(url)
+        logger.info('GET %s -> %s', url, resp.status_code)
+        if resp.ok:
+            for octant in resp.json()['octants'].values():
+                for obj in octant:
                     name, pos = obj['name'], obj['pos']
                     objects[name].append(pos)
 
-            print(f'{"NAME".center(31, "-")}  {"POS (r, Θ, Φ)".center(31, "-")}')
-            for name, pos in sorted(objects.items()):
-                print(f'{name:^31}  {pos[-1]["r"]:>29.1f} r')
-                print(f'{" ":>31}  {pos[-1]["theta"]:>29.1f} Θ')
-                print(f'{" ":>31}  {pos[-1]["phi"]:>29.1f} Φ')
+        print(f'{"NAME".center(31, "-")}  {"POS (r, Θ, Φ)".center(31, "-")}')
+        for name, pos in sorted(objects.items()):
+            print(f'{name:^31}  {pos[-1]["r"]:>29.1f} r')
+            print(f'{" ":>31}  {pos[-1]["theta"]:>29.1f} Θ')
+            print(f'{" ":>31}  {pos[-1]["phi"]:>29.1f} Φ')
 
-            sleep(.1)
+        sleep(.1)
@@ -3,14 +3,20 @@
 from warnings import catch_warnings, simplefilter
 with catch_warnings():
     simplefilter('ignore')
-    from psycopg2 import connect
+    from psycopg2 import connect, Error as DatabaseError
+    from psycopg2.extensions import parse_dsn
     from psycopg2.extras import NamedTupleCursor
+from argparse import ArgumentParser
+from collections import namedtuple, deque
 from contextlib import closing
+from dateutil.parser import parse as dateutil_parse
 from os import environ
-from subprocess import run
-from time import sleep
+from select import select
+from sys import stdout
+from time import sleep, time
 from datetime import datetime
 from itertools import islice, tee, repeat, chain, zip_longest
+import json
 
 nwise = lambda g, n=2: zip(*(islice(g, i, None) for i, g in enumerate(tee(g, n))))
 nwise_longest = lambda g, n=2, fillvalue=object(): zip_longest(*(islice(g, i, None) for i, g in enumerate(tee(g, n))), fillvalue=fillvalue)
@@ -25,14 +31,20 @@ DBPARAMS = {'dbname': DBNAME, 'user': DBUSER}
 if DBHOST is not None:
     DBPARAMS['host'] = DBHOST
 
+# NOTE: as api.py; polling reads from the first replica that lags at most
+#       --max-lag secs (and from the primary, if none does)
+DBREPLICAS = [{**DBPARAMS, **parse_dsn(dsn)} for dsn in environ.get('DBREPLICAS', '').split(';') if dsn.strip()]
+
+CHANNEL = 'neocrisis' # see game.notify
+
 rocks_query = '''
-    select name, age, (pos).r as pos_r, (rock_params).v as params_v, coalesce(target, '?') as target
+    select name, extract(epoch from age)::double precision as age, (pos).r as pos_r, (rock_params).v as params_v, coalesce(target, '?') as target
     from api.neos where regclass = 'api.rocks'::regclass
     order by age desc
     limit 5
 '''
 slugs_query = '''
-    select name, age, (pos).r as pos_r, coalesce(target, '?') as target
+    select name, extract(epoch from age)::double precision as age, (pos).r as pos_r, coalesce(target, '?') as target
     from api.neos where regclass = 'api.slugs'::regclass
     order by age asc
     limit 5
@@ -42,36 +54,264 @@ misses_query = '''
     from api.misses
 '''
 
-if __name__ == '__main__':
-    with closing(connect(**DBPARAMS, cursor_factory=NamedTupleCursor)) as db:
-        db.set_session(autocommit=True)
-        with db.cursor() as cur:
-            while True:
-                COLUMNS = intercalate([20, 10, 20, 10, 15], repeat(1))
-                WIDTH = sum(COLUMNS)
+# NOTE: the --listen mode loads the trajectories once (and again after a
+#       RESET, or every --reload secs, in case a notification was missed) and
+#       then follows game.notify, inserts, updates, and deletes alike;
+#       everything else is computed locally
+rocks_state_query = '''
+    select id, name, coalesce(target, '?') as target
+        , extract(epoch from fired)::double precision as fired
+        , (params).r_0::double precision as r_0
+        , (params).v::double precision as v
+    from game.rocks
+'''
+slugs_state_query = '''
+    select id, name, coalesce(target, '?') as target
+        , extract(epoch from fired)::double precision as fired
+        , 0 as r_0
+        , (params).v::double precision as v
+    from game.slugs
+'''
+hits_state_query = '''
+    select rock, slug, extract(epoch from (collision).t)::double precision as t
+    from game.hits
+'''
 
-                run('clear')
-                print(f' Dashboard {datetime.now():%H:%M:%S} '.center(WIDTH, '='))
+primary_lsn_query = "select pg_wal_lsn_diff(pg_current_wal_flush_lsn(), '0/0')::bigint as lsn"
+replica_lsn_query = "select pg_wal_lsn_diff(pg_last_wal_replay_lsn(), '0/0')::bigint as lsn"
 
-                print()
-                print(f'  Rocks  '.center(WIDTH, '-'))
-                print(f'{"Name":<20} {"Distance":>10} {"Time To Impact (s)":>20} {"Age (s)":>10} {"Target":>15}')
-                cur.execute(rocks_query)
-                for rock in cur:
-                    print(f'{rock.name:<20} {rock.pos_r:>10.2f} {rock.pos_r / -rock.params_v if rock.params_v < 0 else float("inf"):>20.2f} {rock.age.seconds:>10.0f} {rock.target[:20]:>15}')
+Trajectory = namedtuple('Trajectory', 'name target fired r_0 v')
+Row = namedtuple('Row', 'name age pos_r params_v target')
+Miss = namedtuple('Miss', 'rock target t')
 
-                print()
-                print(f'  Slugs  '.center(WIDTH, '-'))
-                print(f'{"Name":<20} {"Distance":>10} {"":>20} {"Age (s)":>10} {"Target":>15}')
-                cur.execute(slugs_query)
-                for slug in cur:
-                    print(f'{slug.name[:20]:<20} {slug.pos_r:>10.2f} {"":>20} {slug.age.seconds:>10.0f} {slug.target[:20]:>15}')
+parser = ArgumentParser()
+parser.add_argument('--listen', action='store_true', help='follow change notifications instead of polling')
+parser.add_argument('--interval', default=.5, type=float, help='secs between refreshes')
+parser.add_argument('--reload', default=60, type=float, help='secs between full reloads (with --listen)')
+parser.add_argument('--max-lag', default=1, type=float, help='most lag of a replica to poll (secs; see DBREPLICAS)')
+
+class Screen:
+    'redraws only the lines that changed since the last frame'
+    def __init__(self, out=stdout):
+        self.out, self.lines = out, None
+
+    def draw(self, lines):
+        buf = []
+        if self.lines is None:
+            buf.append('\x1b[2J')
+            self.lines = []
+        for row, line in enumerate(lines, 1):
+            if row > len(self.lines) or self.lines[row - 1] != line:
+                buf.append(f'\x1b[{row};1H{line}\x1b[K')
+        if len(lines) < len(self.lines):
+            buf.append(f'\x1b[{len(lines) + 1};1H\x1b[J')
+        buf.append(f'\x1b[{len(lines) + 1};1H')
+        self.out.write(''.join(buf))
+        self.out.flush()
+        self.lines = lines
+
+class Rate:
+    'events per second over the last `window` secs'
+    def __init__(self, window=10):
+        self.window, self.start, self.times = window, time(), deque()
+
+    def tick(self, n=1):
+        self.times.extend(repeat(time(), n))
+
+    def __float__(self):
+        now = time()
+        while self.times and self.times[0] < now - self.window:
+            self.times.popleft()
+        return len(self.times) / max(min(self.window, now - self.start), 1e-9)
+
+class Replica:
+    '''
+    a streaming replica and how far it lags the primary (as api.Replicas): it
+    is as fresh as the newest sample of the primary's WAL position that it has
+    replayed
+    '''
+    def __init__(self, params, keep=60):
+        self.params, self.keep = params, keep
+        self.conn, self.samples = None, deque()
+
+    def cursor(self):
+        if self.conn is None or self.conn.closed:
+            self.conn = connect(**self.params, cursor_factory=NamedTupleCursor)
+            self.conn.set_session(autocommit=True)
+        return self.conn.cursor()
+
+    def lag(self, now, primary_lsn):
+        'secs behind the primary (at `primary_lsn` as of `now`); None if unknown'
+        self.samples.append((now, primary_lsn))
+        while self.samples[0][0] < now - self.keep:
+            self.samples.popleft()
+        try:
+            with self.cursor() as cur:
+                cur.execute(replica_lsn_query)
+                replayed = cur.fetchone().lsn
+        except DatabaseError:
+            self.conn = None
+            return None
+        fresh = [t for t, lsn in self.samples if replayed is not None and lsn <= replayed]
+        return now - fresh[-1] if fresh else None
+
+def frame(rocks, slugs, misses, status):
+    COLUMNS = intercalate([20, 10, 20, 10, 15], repeat(1))
+    WIDTH = sum(COLUMNS)
+
+    lines = [f' Dashboard {datetime.now():%H:%M:%S} '.center(WIDTH, '=')]
 
-                print()
-                print(f'  Status  '.center(WIDTH, '-'))
-                print(f'{"Name":<20} {"Target":<15} {"Time":>8} {"Status":>15}')
+    lines.append('')
+    lines.append(f'  Rocks  '.center(WIDTH, '-'))
+    lines.append(f'{"Name":<20} {"Distance":>10} {"Time To Impact (s)":>20} {"Age (s)":>10} {"Target":>15}')
+    for rock in rocks:
+        lines.append(f'{rock.name:<20} {rock.pos_r:>10.2f} {rock.pos_r / -rock.params_v if rock.params_v < 0 else float("inf"):>20.2f} {rock.age // 1:>10.0f} {rock.target[:20]:>15}')
+
+    lines.append('')
+    lines.append(f'  Slugs  '.center(WIDTH, '-'))
+    lines.append(f'{"Name":<20} {"Distance":>10} {"":>20} {"Age (s)":>10} {"Target":>15}')
+    for slug in slugs:
+        lines.append(f'{slug.name[:20]:<20} {slug.pos_r:>10.2f} {"":>20} {slug.age // 1:>10.0f} {slug.target[:20]:>15}')
+
+    lines.append('')
+    lines.append(f'  Status  '.center(WIDTH, '-'))
+    lines.append(f'{"Name":<20} {"Target":<15} {"Time":>8} {"Status":>15}')
+    for miss in misses:
+        lines.append(f'{miss.rock[:20]:<20} {miss.target[:15]:<15} {miss.t:%H:%M:%S} {"vaporized":>15}!')
+
+    lines.append('')
+    lines.append(status.center(WIDTH))
+    return lines
+
+class State:
+    '''
+    local copy of every trajectory and hit, kept up to date by game.notify
+
+    positions are computed as in api.neos and api.misses (without delay)
+    '''
+    def __init__(self):
+        self.rocks, self.slugs = {}, {}
+        self.rock_hits, self.slug_hits = {}, {}
+
+    def load(self, cur):
+        cur.execute(rocks_state_query)
+        self.rocks = {x.id: Trajectory(x.name, x.target, x.fired, x.r_0, x.v) for x in cur}
+        cur.execute(slugs_state_query)
+        self.slugs = {x.id: Trajectory(x.name, x.target, x.fired, x.r_0, x.v) for x in cur}
+        cur.execute(hits_state_query)
+        hits = cur.fetchall()
+        self.rock_hits = {x.rock: x.t for x in hits}
+        self.slug_hits = {x.slug: x.t for x in hits}
+
+    def apply(self, payload):
+        '''
+        applies a notification; returns False for a RESET (changes were not
+        notified one by one, e.g., by game.load), after which load again
+        '''
+        event = json.loads(payload)
+        table, obj = event.get('table'), event.get('object')
+        if event.get('op') == 'RESET':
+            return False
+        if event.get('op') == 'DELETE':
+            if table == 'rocks':
+                self.rocks.pop(obj['id'], None)
+            elif table == 'slugs':
+                self.slugs.pop(obj['id'], None)
+            elif table == 'hits':
+                self.rock_hits.pop(obj['rock'], None)
+                self.slug_hits.pop(obj['slug'], None)
+        elif table == 'rocks':
+            self.rocks[obj['id']] = Trajectory(
+                obj['name'], obj['target'] or '?', dateutil_parse(obj['fired']).timestamp(),
+                float(obj['params']['r_0']), float(obj['params']['v']),
+            )
+        elif table == 'slugs':
+            self.slugs[obj['id']] = Trajectory(
+                obj['name'], obj['target'] or '?', dateutil_parse(obj['fired']).timestamp(),
+                0, float(obj['params']['v']),
+            )
+        elif table == 'hits':
+            t = dateutil_parse(obj['collision']['t']).timestamp()
+            self.rock_hits[obj['rock']] = self.slug_hits[obj['slug']] = t
+        return True
+
+    def visible(self, objects, hits, now):
+        for id, x in objects.items():
+            if x.fired > now or hits.get(id, now + 1) <= now:
+                continue
+            pos_r = x.r_0 + x.v * (now - x.fired)
+            if pos_r >= 0:
+                yield Row(x.name, now - x.fired, pos_r, x.v, x.target)
+
+    def frame(self, now):
+        rocks = sorted(self.visible(self.rocks, self.rock_hits, now), key=lambda x: (-x.age, x.name))[:5]
+        slugs = sorted(self.visible(self.slugs, self.slug_hits, now), key=lambda x: (x.age, x.name))[:5]
+        misses = [
+            Miss(x.name, x.target, datetime.fromtimestamp(x.fired + x.r_0 / -x.v))
+            for id, x in self.rocks.items()
+            if id not in self.rock_hits and x.v < 0 and 0 <= x.r_0 / -x.v <= now - x.fired
+        ]
+        return rocks, slugs, misses
+
+def poll(db, screen, args):
+    queries = Rate()
+    replicas = [Replica(params) for params in DBREPLICAS]
+    with db.cursor() as primary:
+        while True:
+            conn, source = db, 'primary'
+            if replicas:
+                primary.execute(primary_lsn_query)
+                now, lsn = time(), primary.fetchone().lsn
+                queries.tick()
+                for i, replica in enumerate(replicas):
+                    lag = replica.lag(now, lsn)
+                    queries.tick()
+                    if lag is not None and lag <= args.max_lag:
+                        conn, source = replica.conn, f'replica {i} (lag {lag:.2f}s)'
+                        break
+
+            with conn.cursor() as cur:
+                cur.execute(rocks_query)
+                rocks = cur.fetchall()
+                cur.execute(slugs_query)
+                slugs = cur.fetchall()
                 cur.execute(misses_query)
-                for miss in cur:
-                    print(f'{miss.rock[:20]:<20} {miss.target[:15]:<15} {miss.t:%H:%M:%S} {"vaporized":>15}!')
+                misses = cur.fetchall()
+            queries.tick(3)
+
+            screen.draw(frame(rocks, slugs, misses, f'polling {source}: {float(queries):.1f} queries/s'))
+            sleep(args.interval)
+
+# NOTE: on the primary only: a replica can neither LISTEN nor be loaded from
+#       without missing the changes it has yet to replay
+def listen(db, screen, args):
+    queries, events = Rate(), Rate()
+    state, loaded = State(), None
+    with db.cursor() as cur:
+        cur.execute(f'listen {CHANNEL}')
+        queries.tick()
+        while True:
+            deadline = time() + args.interval
+            while time() < deadline:
+                # NOTE: load after LISTEN, so no change falls in between, and
+                #       at once after a RESET
+                if loaded is None or time() - loaded >= args.reload:
+                    state.load(cur)
+                    loaded = time()
+                    queries.tick(3)
 
-                sleep(.5)
+                if select([db], [], [], max(0, deadline - time())) != ([], [], []):
+                    db.poll()
+                    events.tick(len(db.notifies))
+                    while db.notifies:
+                        if not state.apply(db.notifies.pop(0).payload):
+                            loaded = None
+
+            status = f'listening: {float(queries):.1f} queries/s, {float(events):.1f} events/s'
+            screen.draw(frame(*state.frame(time()), status))
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    with closing(connect(**DBPARAMS, cursor_factory=NamedTupleCursor)) as db:
+        db.set_session(autocommit=True)
+        (listen if args.listen else poll)(db, Screen(), args)